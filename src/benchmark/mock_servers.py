@@ -0,0 +1,340 @@
+"""
+Local stand-ins of the Crossref, doi.org and Unpaywall APIs.
+
+The servers answer the requests sent by CrossrefClient, DOIOrgClient and
+UnpaywallClient for the bibliographies written by generate_bibliography:
+the entry i of a bibliography is the work of DOI 10.5555/bench.i. The
+response delays follow a configurable distribution, and faults can be
+injected: bursts of 429 responses with a Retry-After header, 5xx errors
+and responses delayed beyond the client timeout.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DOI_PREFIX = '10.5555/bench.'
+
+_TOPICS = [
+    'granular flows', 'contact dynamics', 'fracture mechanics', 'plasticity',
+    'nonsmooth mechanics', 'friction laws', 'thin shells', 'composite materials',
+    'wave propagation', 'homogenization', 'damage models', 'tribology',
+]
+_FAMILIES = [
+    'Dupont', 'Martin', 'Bernard', 'Moreau', 'Jean', 'Acary', 'Brogliato',
+    'Nguyen', 'Schmidt', 'Rossi', 'Garcia', 'Smith', 'Tanaka', 'Kowalski',
+]
+_GIVEN = ['Jean', 'Anne', 'Pierre', 'Marie', 'Luc', 'Sofia', 'Hiro', 'Ewa']
+_JOURNALS = [
+    'Journal of Theoretical, Computational and Applied Mechanics',
+    'International Journal of Solids and Structures',
+    'Computer Methods in Applied Mechanics and Engineering',
+]
+
+_INDEX = re.compile(r'study (\d+)')
+
+
+# =============================================================================
+# Generated bibliographies
+# =============================================================================
+
+def title_of(i: int) -> str:
+    return f'Benchmark study {i} of {_TOPICS[i % len(_TOPICS)]}'
+
+
+def authors_of(i: int) -> list:
+    return [
+        {'given': _GIVEN[(i + k) % len(_GIVEN)], 'family': _FAMILIES[(i * 7 + k) % len(_FAMILIES)]}
+        for k in range(1 + i % 3)
+    ]
+
+
+def year_of(i: int) -> int:
+    return 1990 + i % 35
+
+
+def work(i: int) -> Dict[str, Any]:
+    """CSL JSON of the work i."""
+    return {
+        'type': 'journal-article',
+        'DOI': f'{DOI_PREFIX}{i}',
+        'title': title_of(i),
+        'author': authors_of(i),
+        'issued': {'date-parts': [[year_of(i), 1 + i % 12]]},
+        'container-title': _JOURNALS[i % len(_JOURNALS)],
+        'volume': str(1 + i % 40),
+        'issue': str(1 + i % 4),
+        'page': f'{i % 500 + 1}-{i % 500 + 20}',
+        'publisher': 'Benchmark Press',
+    }
+
+
+def crossref_item(i: int) -> Dict[str, Any]:
+    """Crossref work item of the work i, as returned by the /works route."""
+    item = dict(work(i))
+    item['title'] = [item['title']]
+    item['container-title'] = [item['container-title']]
+    item['score'] = 50.0
+    return item
+
+
+def bibtex(i: int) -> str:
+    """BibTeX of the work i, as returned by content negotiation."""
+    w = work(i)
+    authors = ' and '.join(f"{a['family']}, {a['given']}" for a in w['author'])
+    return (
+        f"@article{{{w['author'][0]['family']}_{year_of(i)}, title={{{w['title']}}}, "
+        f"volume={{{w['volume']}}}, number={{{w['issue']}}}, journal={{{w['container-title']}}}, "
+        f"publisher={{{w['publisher']}}}, author={{{authors}}}, year={{{year_of(i)}}}, "
+        f"pages={{{w['page'].replace('-', '--')}}}, doi={{{w['DOI']}}}}}"
+    )
+
+
+def generate_bibliography(path: str, n: int, doi_ratio: float = 1 / 3, seed: int = 0) -> None:
+    """
+    Write a bibliography of ``n`` entries.
+
+    A fraction ``doi_ratio`` of the entries give their DOI; the others
+    have to be searched on Crossref.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n):
+            w = work(i)
+            authors = ' and '.join(f"{a['family']}, {a['given']}" for a in w['author'])
+            doi = f"  doi = {{{w['DOI']}}},\n" if rng.random() < doi_ratio else ''
+            f.write(
+                f"@article{{bench{i},\n"
+                f"  author = {{{authors}}},\n"
+                f"  title = {{{w['title']}}},\n"
+                f"  journal = {{{w['container-title']}}},\n"
+                f"  year = {{{year_of(i)}}},\n"
+                f"{doi}"
+                f"}}\n\n"
+            )
+
+
+# =============================================================================
+# Latency and faults
+# =============================================================================
+
+@dataclass
+class Latency:
+    """
+    Distribution of the response delays, in seconds.
+
+    Parsed from ``constant:<s>``, ``uniform:<min>,<max>`` or
+    ``lognormal:<median>,<sigma>``.
+    """
+    kind: str = 'constant'
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> 'Latency':
+        kind, _, args = text.partition(':')
+        values = [float(v) for v in args.split(',')] if args else []
+        if kind not in ('constant', 'uniform', 'lognormal') or len(values) != (1 if kind == 'constant' else 2):
+            raise ValueError(f'invalid latency {text}')
+        return cls(kind, *values)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'uniform':
+            return rng.uniform(self.a, self.b)
+        if self.kind == 'lognormal':
+            return self.a * rng.lognormvariate(0.0, self.b)
+        return self.a
+
+
+@dataclass
+class Faults:
+    """Faults injected in the responses."""
+    burst_every: int = 0        # requests between two bursts of 429 responses (0: no burst)
+    burst_length: int = 10      # 429 responses of a burst
+    retry_after: float = 1.0    # Retry-After of the 429 responses, in seconds
+    error_rate: float = 0.0     # probability of a 5xx response
+    timeout_rate: float = 0.0   # probability of a response delayed by timeout_delay
+    timeout_delay: float = 5.0  # longer than the client timeout
+
+
+# =============================================================================
+# Servers
+# =============================================================================
+
+class MockServer:
+    """
+    Threaded HTTP server answering the requests of one API.
+
+    Subclasses implement :meth:`respond`; the server adds the delays, the
+    faults and the rate-limit headers, and counts the responses by status.
+    """
+
+    name = 'api'
+
+    def __init__(self, latency: Optional[Latency] = None, faults: Optional[Faults] = None,
+                 rate_limit: int = 1000, seed: int = 0):
+        self.latency = latency or Latency()
+        self.faults = faults or Faults()
+        self.rate_limit = rate_limit
+        self.counts: Dict[str, int] = {}
+        self._requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server._handle(self)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}'
+
+    def start(self) -> 'MockServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.counts = {}
+
+    def _draw(self) -> Tuple[float, Optional[int]]:
+        """Delay and fault status of the next response."""
+        with self._lock:
+            self._requests += 1
+            delay = self.latency.sample(self._rng)
+            f = self.faults
+            if f.burst_every and self._requests % f.burst_every < f.burst_length:
+                return delay, 429
+            if self._rng.random() < f.error_rate:
+                return delay, self._rng.choice((500, 502, 503))
+            if self._rng.random() < f.timeout_rate:
+                return f.timeout_delay, None
+            return delay, None
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        delay, fault = self._draw()
+        time.sleep(delay)
+        if fault is not None:
+            status, body, content_type = fault, json.dumps({'status': 'error'}), 'application/json'
+        else:
+            u = urlsplit(handler.path)
+            status, body, content_type = self.respond(unquote(u.path), parse_qs(u.query), handler.headers)
+
+        with self._lock:
+            self.counts[str(status)] = self.counts.get(str(status), 0) + 1
+        data = body.encode('utf-8')
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', content_type)
+            handler.send_header('Content-Length', str(len(data)))
+            handler.send_header('X-Rate-Limit-Limit', str(self.rate_limit))
+            handler.send_header('X-Rate-Limit-Interval', '1s')
+            if status == 429:
+                handler.send_header('Retry-After', f'{self.faults.retry_after:g}')
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a delayed response
+            pass
+
+    def respond(self, path: str, query: Dict[str, list], headers: Any) -> Tuple[int, str, str]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _index(doi: str) -> Optional[int]:
+        if doi.lower().startswith(DOI_PREFIX) and doi[len(DOI_PREFIX):].isdigit():
+            return int(doi[len(DOI_PREFIX):])
+        return None
+
+
+class CrossrefServer(MockServer):
+    """Search (/works), batch lookup (/works?filter=doi:...) and transform routes."""
+
+    name = 'crossref'
+
+    def respond(self, path, query, headers):
+        if path == '/works':
+            if 'filter' in query:
+                dois = [d[len('doi:'):] for d in query['filter'][0].split(',')]
+                items = [crossref_item(i) for i in map(self._index, dois) if i is not None]
+            else:
+                match = _INDEX.search(query.get('query.bibliographic', [''])[0])
+                rows = int(query.get('rows', ['1'])[0])
+                # The searched work comes first, followed by neighbouring decoys
+                items = [crossref_item(int(match.group(1)) + k) for k in range(rows)] if match else []
+            return 200, json.dumps({'status': 'ok', 'message': {'items': items}}), 'application/json'
+
+        match = re.match(r'/works/(.+)/transform/(.+)', path)
+        if match:
+            i = self._index(match.group(1))
+            if i is None:
+                return 404, 'Resource not found.', 'text/plain'
+            if 'bibtex' in match.group(2):
+                return 200, bibtex(i), 'application/x-bibtex'
+            return 200, json.dumps(work(i)), 'application/vnd.citationstyles.csl+json'
+        return 404, 'Resource not found.', 'text/plain'
+
+
+class DOIOrgServer(MockServer):
+    """Content negotiation of https://doi.org/<doi>."""
+
+    name = 'doi.org'
+
+    def respond(self, path, query, headers):
+        i = self._index(path[1:])
+        if i is None:
+            return 404, 'DOI not found', 'text/plain'
+        if 'bibtex' in headers.get('Accept', ''):
+            return 200, bibtex(i), 'application/x-bibtex'
+        return 200, json.dumps(work(i)), 'application/vnd.citationstyles.csl+json'
+
+
+class UnpaywallServer(MockServer):
+    """The /v2/<doi> route; one work in four is closed access."""
+
+    name = 'unpaywall'
+
+    def respond(self, path, query, headers):
+        match = re.match(r'/v2/(.+)', path)
+        i = self._index(match.group(1)) if match else None
+        if i is None:
+            return 404, json.dumps({'HTTP_status_code': 404, 'error': True}), 'application/json'
+        record: Dict[str, Any] = {'doi': f'{DOI_PREFIX}{i}', 'is_oa': i % 4 != 0}
+        if record['is_oa']:
+            record['best_oa_location'] = {
+                'url': f'https://hal.science/hal-{i}/document',
+                'url_for_pdf': f'https://hal.science/hal-{i}/file/paper.pdf',
+                'url_for_landing_page': f'https://hal.science/hal-{i}',
+                'host_type': 'repository',
+                'repository_institution': 'CCSd - HAL',
+            }
+        return 200, json.dumps(record), 'application/json'
+
+
+def start_servers(latency: Optional[Latency] = None, faults: Optional[Faults] = None,
+                  rate_limit: int = 1000, seed: int = 0) -> Dict[str, MockServer]:
+    """Start the Crossref, doi.org and Unpaywall servers."""
+    return {
+        cls.name: cls(latency, faults, rate_limit, seed + k).start()
+        for k, cls in enumerate((CrossrefServer, DOIOrgServer, UnpaywallServer))
+    }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Benchmark of BibtexProcessor.run against local mock API servers.
+
+Generated bibliographies of several sizes are processed end to end, with
+the clients pointed at the servers of mock_servers.py. Each run appends
+one JSON line to the results file (wall time, throughput, time and calls
+of each stage, HTTP status codes); --compare checks each run against the
+last stored run with the same parameters and exits with status 1 if one
+is slower by more than --tolerance.
+
+Example:
+    python run_benchmark.py --sizes=100,1000,10000 --latency=lognormal:0.05,0.5 \\
+        --burst-every=500 --error-rate=0.01 --compare
+"""
+
+import contextlib
+import getopt
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jtcam_bibtex_editing as jtcam  # noqa: E402
+from mock_servers import Faults, Latency, generate_bibliography, start_servers  # noqa: E402
+
+
+def usage() -> None:
+    print(f'Usage: {os.path.split(sys.argv[0])[1]} [OPTION]...')
+    print("""Options:
+     --sizes=<int>,<int>,...
+       number of entries of the generated bibliographies (default: 100,1000)
+     --latency=<distribution>
+       response delay: constant:<s>, uniform:<min>,<max> or lognormal:<median>,<sigma>
+            (default: lognormal:0.05,0.5)
+     --burst-every=<int>, --burst-length=<int>, --retry-after=<float>
+       send <burst-length> 429 responses with Retry-After every <burst-every> requests
+     --error-rate=<float>
+       probability of a 5xx response
+     --timeout-rate=<float>
+       probability of a response delayed beyond --request-timeout
+     --rate-limit=<int>
+       requests/s announced in the X-Rate-Limit headers (default: 1000)
+     --parallel-requests=<int>
+       concurrent requests of the processor (default: 16)
+     --request-timeout=<int>
+       timeout of the client requests in seconds (default: 2)
+     --pipeline
+       process the entries with the streaming pipeline
+     --repeat=<int>
+       runs of each size (default: 1)
+     --seed=<int>
+       seed of the bibliographies and of the servers (default: 0)
+     --results=<path>
+       JSON lines file of the results (default: benchmark_results.jsonl)
+     --compare
+       compare with the last stored run of the same parameters
+     --tolerance=<float>
+       relative slowdown reported as a regression (default: 0.2)
+""")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_once(size: int, params: dict, servers: dict, workdir: str) -> dict:
+    """
+    Process a generated bibliography of ``size`` entries and return the measures.
+
+    A run raising an exception returns a failed result with the error, the
+    elapsed time and the server counts, so the following runs still happen.
+    """
+    bib_file = os.path.join(workdir, f'bench_{size}.bib')
+    generate_bibliography(bib_file, size, seed=params['seed'])
+    for suffix in ('_cache.pickle', '_cache.journal', '_edited.bib'):
+        path = os.path.join(workdir, f'bench_{size}{suffix}')
+        if os.path.exists(path):
+            os.remove(path)
+    for server in servers.values():
+        server.reset_counts()
+
+    config = jtcam.Config(
+        filename=bib_file,
+        metadata_cache_file=None,
+        number_of_parallel_request=params['parallel_requests'],
+        pipeline=params['pipeline'],
+        crossref_url=servers['crossref'].url,
+        doi_org_url=servers['doi.org'].url,
+        unpaywall_url=servers['unpaywall'].url,
+        request_timeout=params['request_timeout'],
+    )
+    processor = jtcam.BibtexProcessor(config)
+    start = time.perf_counter()
+    # The processor prints its progress
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.run()
+    except Exception as e:
+        return {
+            'failed': True,
+            'error': f'{type(e).__name__}: {e}'[:500],
+            'wall_seconds': time.perf_counter() - start,
+            'server_status': {name: dict(server.counts) for name, server in servers.items()},
+        }
+    wall = time.perf_counter() - start
+
+    metrics = jtcam.METRICS.to_dict()
+    stages = {}
+    for histogram in metrics['histograms']:
+        if histogram['name'] == 'stage_seconds':
+            stages[histogram['labels']['stage']] = {'seconds': histogram['sum']}
+    calls = {
+        histogram['labels']['call']: {
+            'count': histogram['count'], 'p50': histogram['p50'], 'p99': histogram['p99']
+        }
+        for histogram in metrics['histograms'] if histogram['name'] == 'call_seconds'
+    }
+    statuses = {}
+    for counter in metrics['counters']:
+        if counter['name'] == 'http_requests_total':
+            status = counter['labels']['status']
+            statuses[status] = statuses.get(status, 0) + counter['value']
+
+    return {
+        'wall_seconds': wall,
+        'entries_per_second': size / wall if wall > 0 else 0.0,
+        'stages': stages,
+        'calls': calls,
+        'http_status': statuses,
+        'server_status': {name: dict(server.counts) for name, server in servers.items()},
+    }
+
+
+def last_result(path: str, params: dict, size: int):
+    """Last stored result with the same parameters and size."""
+    if not os.path.exists(path):
+        return None
+    found = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('params') == params and record.get('size') == size and not record.get('failed'):
+                found = record
+    return found
+
+
+def main() -> int:
+    params = {
+        'latency': 'lognormal:0.05,0.5', 'burst_every': 0, 'burst_length': 10,
+        'retry_after': 1.0, 'error_rate': 0.0, 'timeout_rate': 0.0, 'rate_limit': 1000,
+        'parallel_requests': 16, 'request_timeout': 2, 'pipeline': False, 'seed': 0,
+    }
+    sizes = [100, 1000]
+    repeat = 1
+    results_file = 'benchmark_results.jsonl'
+    compare = False
+    tolerance = 0.2
+
+    try:
+        opts, _ = getopt.gnu_getopt(
+            sys.argv[1:], '',
+            ['help', 'sizes=', 'latency=', 'burst-every=', 'burst-length=', 'retry-after=',
+             'error-rate=', 'timeout-rate=', 'rate-limit=', 'parallel-requests=',
+             'request-timeout=', 'pipeline', 'repeat=', 'seed=', 'results=', 'compare',
+             'tolerance='])
+        for o, a in opts:
+            if o == '--help':
+                usage()
+                return 0
+            elif o == '--sizes':
+                sizes = [int(n) for n in a.split(',')]
+            elif o == '--latency':
+                Latency.parse(a)
+                params['latency'] = a
+            elif o in ('--burst-every', '--burst-length', '--rate-limit',
+                       '--parallel-requests', '--request-timeout', '--seed'):
+                params[o[2:].replace('-', '_')] = int(a)
+            elif o in ('--retry-after', '--error-rate', '--timeout-rate'):
+                params[o[2:].replace('-', '_')] = float(a)
+            elif o == '--pipeline':
+                params['pipeline'] = True
+            elif o == '--repeat':
+                repeat = int(a)
+            elif o == '--results':
+                results_file = a
+            elif o == '--compare':
+                compare = True
+            elif o == '--tolerance':
+                tolerance = float(a)
+    except (getopt.GetoptError, ValueError) as err:
+        sys.stderr.write(f'{err}\n')
+        usage()
+        return 2
+
+    faults = Faults(
+        burst_every=params['burst_every'], burst_length=params['burst_length'],
+        retry_after=params['retry_after'], error_rate=params['error_rate'],
+        timeout_rate=params['timeout_rate'], timeout_delay=params['request_timeout'] + 1.0,
+    )
+    servers = start_servers(Latency.parse(params['latency']), faults, params['rate_limit'], params['seed'])
+    commit = git_commit()
+    regressions = []
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='jtcam_benchmark_') as workdir:
+            for size in sizes:
+                previous = last_result(results_file, params, size) if compare else None
+                for _ in range(repeat):
+                    result = run_once(size, params, servers, workdir)
+                    record = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+                              'params': params, 'size': size, **result}
+                    with open(results_file, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record) + '\n')
+
+                    if result.get('failed'):
+                        print(f"{size:>7} entries: FAILED after {result['wall_seconds']:.2f}s  {result['error']}")
+                        continue
+                    stages = ', '.join(f"{k} {v['seconds']:.2f}s" for k, v in sorted(result['stages'].items()))
+                    line = (f"{size:>7} entries: {result['wall_seconds']:8.2f}s "
+                            f"{result['entries_per_second']:8.1f} entries/s  [{stages}]")
+                    if previous is not None:
+                        ratio = result['wall_seconds'] / previous['wall_seconds']
+                        line += f"  x{ratio:.2f} vs {previous.get('commit') or previous['timestamp']}"
+                        if ratio > 1 + tolerance:
+                            regressions.append((size, ratio))
+                            line += '  REGRESSION'
+                    print(line)
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    print(f'results appended to {results_file}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
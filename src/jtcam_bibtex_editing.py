@@ -24,6 +24,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import annotations
 
 import getopt
+import hashlib
 import sys
 import os
 import pprint
@@ -31,8 +32,12 @@ import time
 import json
 import urllib  # For URL encoding compliant with LaTeX
 import pickle
+import sqlite3
+import threading
+import zlib
+import dataclasses
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple, Any, Set
+from typing import Dict, List, Optional, Tuple, Any, Set, Iterator, Iterable
 from enum import Enum
 
 # BibTeX parsing imports
@@ -42,6 +47,8 @@ from bibtexparser.bwriter import BibTexWriter
 from bibtexparser.bibdatabase import BibDatabase, as_text
 
 # HTTP requests for retry logic
+import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, ConnectionError, Timeout
 
 
@@ -58,7 +65,7 @@ class APIError(BibtexProcessingError):
     """Base exception for API-related errors."""
     
     def __init__(self, message: str, status_code: Optional[int] = None, 
-                 retry_after: Optional[int] = None):
+                 retry_after: Optional[float] = None):
         super().__init__(message)
         self.status_code = status_code
         self.retry_after = retry_after
@@ -125,26 +132,36 @@ def retry_with_backoff(
                         # Final attempt failed, re-raise
                         raise last_exception
                     
+                    # Honour the delay requested by the server instead of
+                    # adding our own backoff on top of it
+                    wait = getattr(e, 'retry_after', None)
+                    if wait is None:
+                        wait = delay
+                    METRICS.inc('retries_total', {'function': func.__name__})
+                    
                     # Log retry attempt
                     logger = kwargs.get('logger')
                     if logger:
                         logger.info(
                             f'[RETRY] {func.__name__} failed (attempt {attempt + 1}/{max_retries + 1}): {e}. '
-                            f'Retrying in {delay:.1f}s...'
+                            f'Retrying in {wait:.1f}s...'
                         )
                     else:
                         print(
                             f'[RETRY] {func.__name__} failed (attempt {attempt + 1}/{max_retries + 1}): {e}. '
-                            f'Retrying in {delay:.1f}s...',
+                            f'Retrying in {wait:.1f}s...',
                             file=sys.stderr
                         )
                     
-                    time.sleep(delay)
+                    time.sleep(wait)
                     delay = min(delay * exponential_base, max_delay)
             
             # Should never reach here, but just in case
             raise last_exception if last_exception else RuntimeError("Unexpected retry loop exit")
         
+        # Keep the name of the function in the logs and the metrics
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
         return wrapper
     return decorator
 
@@ -173,6 +190,7 @@ class StoreKeys:
     ACTION = 'action'
     OUTPUT_BIBTEX_ENTRY = 'output_bibtex_entry'
     DUPLICATE = 'duplicate'
+    FINGERPRINTS = 'fingerprints'
 
 
 class ValidationStatus(Enum):
@@ -189,8 +207,13 @@ class ValidationStatus(Enum):
 
 @dataclass
 class Timer:
-    """Simple timer class for measuring execution time."""
+    """
+    Simple timer class for measuring execution time.
+    
+    A named timer records its elapsed time in the ``stage_seconds`` metric.
+    """
     _start_time: Optional[float] = None
+    name: Optional[str] = None
     
     def start(self) -> None:
         """Start the timer."""
@@ -205,16 +228,27 @@ class Timer:
         elapsed_time = time.perf_counter() - self._start_time
         self._start_time = None
         print(f"Elapsed time: {elapsed_time:0.4f} seconds")
+        if self.name is not None:
+            METRICS.observe('stage_seconds', elapsed_time, {'stage': self.name})
         return elapsed_time
 
 
-@dataclass
+# Dataclass slots need Python 3.10, older versions get regular instances
+_DATACLASS_SLOTS: Dict[str, Any] = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class EntryStore:
     """
     Typed storage for a single BibTeX entry's processing state.
     
     This replaces the untyped dictionary store[key] access with a dataclass
-    that provides type safety and IDE autocomplete support.
+    that provides type safety and IDE autocomplete support. The instances
+    are slotted where supported, as a run may hold one per entry of a large
+    bibliography.
+    
+    The CSL JSON of the Crossref record is kept as the zlib compressed blob
+    of the cache file until it is read through :attr:`crossref_json_entry`.
     """
     # Required fields
     input: Dict[str, Any]
@@ -227,7 +261,9 @@ class EntryStore:
     # BibTeX entry from Crossref
     crossref_bibtex_entry: Optional[Dict[str, Any]] = None
     crossref_bibtex_entry_key: Optional[str] = None
-    crossref_json_entry: Optional[str] = None
+    # CSL JSON and its compressed form, read through crossref_json_entry
+    _crossref_json: Optional[str] = field(default=None, repr=False, compare=False)
+    _crossref_json_blob: Optional[bytes] = field(default=None, repr=False, compare=False)
     doi_to_bibtex_status: Optional[str] = None
     
     # Unpaywall results
@@ -244,8 +280,23 @@ class EntryStore:
     output_bibtex_entry: Optional[Dict[str, Any]] = None
     duplicate: bool = False
     
+    # Fingerprints of the input fields each stage depends on
+    fingerprints: Dict[str, str] = field(default_factory=dict)
+    
+    @property
+    def crossref_json_entry(self) -> Optional[str]:
+        """CSL JSON string of the Crossref record."""
+        if self._crossref_json is None and self._crossref_json_blob is not None:
+            self._crossref_json = zlib.decompress(self._crossref_json_blob).decode('utf-8')
+        return self._crossref_json
+    
+    @crossref_json_entry.setter
+    def crossref_json_entry(self, value: Optional[str]) -> None:
+        self._crossref_json = value
+        self._crossref_json_blob = None
+    
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for pickle serialization."""
+        """Convert to dictionary for the journal and the legacy pickle cache."""
         return {
             StoreKeys.INPUT: self.input,
             StoreKeys.FOUND_DOI: self.found_doi,
@@ -265,19 +316,19 @@ class EntryStore:
             StoreKeys.ACTION: self.action,
             StoreKeys.OUTPUT_BIBTEX_ENTRY: self.output_bibtex_entry,
             StoreKeys.DUPLICATE: self.duplicate,
+            StoreKeys.FINGERPRINTS: self.fingerprints,
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> EntryStore:
-        """Create from dictionary (for pickle deserialization)."""
-        return cls(
+        """Create from dictionary (journal and legacy pickle cache)."""
+        entry_store = cls(
             input=data.get(StoreKeys.INPUT, {}),
             found_doi=data.get(StoreKeys.FOUND_DOI),
             found_doi_status=data.get(StoreKeys.FOUND_DOI_STATUS),
             crossref_query_status=data.get(StoreKeys.CROSSREF_QUERY_STATUS),
             crossref_bibtex_entry=data.get(StoreKeys.CROSSREF_BIBTEX_ENTRY),
             crossref_bibtex_entry_key=data.get(StoreKeys.CROSSREF_BIBTEX_ENTRY_KEY),
-            crossref_json_entry=data.get(StoreKeys.CROSSREF_JSON_ENTRY),
             doi_to_bibtex_status=data.get(StoreKeys.DOI_TO_BIBTEX_STATUS),
             unpaywall_msg=data.get(StoreKeys.UNPAYWALL_MSG),
             unpaywall_status=data.get(StoreKeys.UNPAYWALL_STATUS, []),
@@ -289,7 +340,43 @@ class EntryStore:
             action=data.get(StoreKeys.ACTION, ['', '']),
             output_bibtex_entry=data.get(StoreKeys.OUTPUT_BIBTEX_ENTRY),
             duplicate=data.get(StoreKeys.DUPLICATE, False),
+            fingerprints=data.get(StoreKeys.FINGERPRINTS, {}),
         )
+        entry_store.crossref_json_entry = data.get(StoreKeys.CROSSREF_JSON_ENTRY)
+        return entry_store
+    
+    def set_found_doi(self, doi: Optional[str]) -> None:
+        """
+        Set the DOI resolved by the search stage.
+        
+        The fetch and Unpaywall results depend only on the DOI, so they are
+        kept when a new search resolves the same DOI and discarded otherwise.
+        """
+        if self.found_doi is not None and (doi is None or canonical_doi(doi) != canonical_doi(self.found_doi)):
+            self.crossref_bibtex_entry = None
+            self.crossref_bibtex_entry_key = None
+            self.crossref_json_entry = None
+            self.doi_to_bibtex_status = None
+            self.unpaywall_msg = None
+            self.unpaywall_status = []
+            self.unpaywall_data = None
+            self.oai_url = None
+            self.oai_type = None
+            self.oai_url_for_landing_page = None
+        self.found_doi = doi
+    
+    def invalidate(self, stages: List[str]) -> None:
+        """Discard the results of the given stages (see :func:`stage_fingerprints`)."""
+        if 'search' in stages:
+            # The found DOI is kept to detect whether the new search resolves the same one
+            self.crossref_query_status = None
+        if 'validation' in stages:
+            self.found_doi_status = None
+            self.check = None
+        if 'output' in stages:
+            self.output_bibtex_entry = None
+            self.action = ['', '']
+            self.duplicate = False
 
 
 @dataclass
@@ -302,7 +389,7 @@ class Config:
     """
     filename: Optional[str] = None
     verbose: int = 0
-    number_of_parallel_request: int = 2
+    number_of_parallel_request: int = 16
     output_unpaywall_data: bool = False
     skip_double_check: List[str] = field(default_factory=list)
     forced_valid_crossref_entry: List[str] = field(default_factory=list)
@@ -312,6 +399,42 @@ class Config:
     use_input_doi: bool = True
     keep_entry: List[str] = field(default_factory=list)
     split_output: bool = False
+    metadata_cache_file: Optional[str] = field(default_factory=lambda: default_metadata_cache_file())
+    metadata_cache_max_size: int = 512  # in MB
+    bibtex_from_csl: bool = False
+    crossref_batch_size: int = 0
+    unpaywall_source: str = 'api'
+    import_unpaywall_snapshot: Optional[str] = None
+    crossref_source: str = 'api'
+    import_crossref_dump: Optional[str] = None
+    pipeline: bool = False
+    local_match_threshold: Optional[float] = 0.9
+    crossref_candidates: int = 5
+    pipeline_workers: Dict[str, int] = field(default_factory=dict)
+    character_table: Optional[str] = None
+    provenance_file: Optional[str] = None
+    metrics_file: Optional[str] = None
+    metrics_prometheus_file: Optional[str] = None
+    crossref_url: str = 'https://api.crossref.org'
+    doi_org_url: str = 'https://doi.org'
+    unpaywall_url: str = 'https://api.unpaywall.org'
+    request_timeout: int = 30
+    profile: bool = False
+    profile_dir: Optional[str] = None
+    
+    @property
+    def unpaywall_snapshot_path(self) -> Optional[str]:
+        """Path of the Unpaywall snapshot index given by --unpaywall-source."""
+        if self.unpaywall_source.startswith('snapshot:'):
+            return self.unpaywall_source[len('snapshot:'):]
+        return None
+    
+    @property
+    def crossref_local_path(self) -> Optional[str]:
+        """Path of the local Crossref index given by --crossref-source."""
+        if self.crossref_source.startswith('local:'):
+            return self.crossref_source[len('local:'):]
+        return None
     
     @classmethod
     def from_command_line(cls, argv: List[str]) -> Config:
@@ -325,7 +448,15 @@ class Config:
                  'output-unpaywall-data', 'skip-double-check=',
                  'forced-valid-crossref-entry=',
                  'stop-on-bad-check', 'max-entry=', 'keep-entry=',
-                 'split-output'])
+                 'split-output', 'metadata-cache=', 'metadata-cache-size=',
+                 'no-metadata-cache', 'parallel-requests=', 'bibtex-from-csl',
+                 'crossref-batch-size=', 'unpaywall-source=',
+                 'import-unpaywall-snapshot=', 'crossref-source=',
+                 'import-crossref-dump=', 'pipeline', 'pipeline-workers=',
+                 'local-match-threshold=', 'no-local-match', 'crossref-candidates=',
+                 'character-table=', 'provenance=', 'metrics=', 'metrics-prometheus=',
+                 'crossref-url=', 'doi-org-url=', 'unpaywall-url=', 'request-timeout=',
+                 'profile', 'profile-dir='])
             
             for o, a in opts:
                 if o == '--help':
@@ -347,10 +478,69 @@ class Config:
                     config.keep_entry = a.split(',')
                 elif o == '--split-output':
                     config.split_output = True
+                elif o == '--metadata-cache':
+                    config.metadata_cache_file = a
+                elif o == '--metadata-cache-size':
+                    config.metadata_cache_max_size = int(a)
+                elif o == '--no-metadata-cache':
+                    config.metadata_cache_file = None
+                elif o == '--parallel-requests':
+                    config.number_of_parallel_request = int(a)
+                elif o == '--bibtex-from-csl':
+                    config.bibtex_from_csl = True
+                elif o == '--crossref-batch-size':
+                    config.crossref_batch_size = int(a)
+                elif o == '--unpaywall-source':
+                    if a != 'api' and not a.startswith('snapshot:'):
+                        raise getopt.GetoptError(f'invalid unpaywall source {a}')
+                    config.unpaywall_source = a
+                elif o == '--import-unpaywall-snapshot':
+                    config.import_unpaywall_snapshot = a
+                elif o == '--crossref-source':
+                    if a != 'api' and not a.startswith('local:'):
+                        raise getopt.GetoptError(f'invalid crossref source {a}')
+                    config.crossref_source = a
+                elif o == '--import-crossref-dump':
+                    config.import_crossref_dump = a
+                elif o == '--local-match-threshold':
+                    config.local_match_threshold = float(a)
+                elif o == '--no-local-match':
+                    config.local_match_threshold = None
+                elif o == '--crossref-candidates':
+                    config.crossref_candidates = max(1, int(a))
+                elif o == '--character-table':
+                    config.character_table = a
+                elif o == '--provenance':
+                    config.provenance_file = a
+                elif o == '--metrics':
+                    config.metrics_file = a
+                elif o == '--metrics-prometheus':
+                    config.metrics_prometheus_file = a
+                elif o == '--crossref-url':
+                    config.crossref_url = a.rstrip('/')
+                elif o == '--doi-org-url':
+                    config.doi_org_url = a.rstrip('/')
+                elif o == '--unpaywall-url':
+                    config.unpaywall_url = a.rstrip('/')
+                elif o == '--request-timeout':
+                    config.request_timeout = int(a)
+                elif o == '--profile':
+                    config.profile = True
+                elif o == '--profile-dir':
+                    config.profile = True
+                    config.profile_dir = a
+                elif o == '--pipeline':
+                    config.pipeline = True
+                elif o == '--pipeline-workers':
+                    for item in a.split(','):
+                        stage, _, n = item.partition(':')
+                        if stage not in StreamingPipeline.NETWORK_STAGES or not n.isdigit():
+                            raise getopt.GetoptError(f'invalid pipeline workers {item}')
+                        config.pipeline_workers[stage] = int(n)
             
             if len(args) > 0:
                 config.filename = args[0]
-            else:
+            elif not (config.import_unpaywall_snapshot or config.import_crossref_dump):
                 config.usage()
                 exit(1)
                 
@@ -366,7 +556,14 @@ class Config:
         print(f'Usage: {os.path.split(sys.argv[0])[1]} [OPTION]... <bib file>')
         print()
         if not long:
-            print("""[--help][--verbose][--output-unpaywall-data][--skip-double-check=][--stop-on-bad-check][--max-entry=][--keep-entry=][--forced-valid-crossref-entry=]
+            print("""[--help][--verbose][--output-unpaywall-data][--skip-double-check=][--stop-on-bad-check][--max-entry=][--keep-entry=][--forced-valid-crossref-entry=][--split-output]
+            [--metadata-cache=][--metadata-cache-size=][--no-metadata-cache][--parallel-requests=]
+            [--bibtex-from-csl][--crossref-batch-size=][--unpaywall-source=]
+            [--import-unpaywall-snapshot=][--crossref-source=][--import-crossref-dump=]
+            [--pipeline][--pipeline-workers=][--local-match-threshold=][--no-local-match]
+            [--crossref-candidates=][--character-table=][--provenance=]
+            [--metrics=][--metrics-prometheus=][--crossref-url=][--doi-org-url=]
+            [--unpaywall-url=][--request-timeout=][--profile][--profile-dir=]
             """)
         else:
             print("""Options:
@@ -391,10 +588,106 @@ class Config:
             by crossref is bad.
      --split-output
        split output in multiple bib files to test entries one by one
+     --metadata-cache=<path>
+       sqlite database shared by all bib files to cache crossref and unpaywall
+            results (default: ~/.cache/jtcam_bibtex_editing/metadata_cache.sqlite)
+     --metadata-cache-size=<int>
+       maximum size of the metadata cache in MB. Least recently used records are evicted
+     --no-metadata-cache
+       do not use the shared metadata cache
+     --parallel-requests=<int>
+       maximum number of concurrent requests to the APIs (default: 16)
+     --bibtex-from-csl
+       fetch only the CSL JSON of each doi and build the crossref bibtex entry locally
+            (one request per doi instead of two)
+     --crossref-batch-size=<int>
+       fetch the crossref metadata of <int> dois per request with multi-doi filter
+            queries. dois not found by crossref are fetched one by one (default: 0, disabled)
+     --unpaywall-source=api|snapshot:<index>
+       resolve unpaywall queries with a local snapshot index, falling back to the api
+            for the dois missing from the snapshot (default: api)
+     --import-unpaywall-snapshot=<snapshot.jsonl.gz>
+       build the index of an unpaywall data snapshot, written to the path given by
+            --unpaywall-source=snapshot:<index> or to <snapshot.jsonl.gz>.index, and exit
+     --crossref-source=api|local:<index>
+       resolve crossref searches and metadata with a local index of the crossref public
+            data file, falling back to the api when the index has no answer (default: api)
+     --import-crossref-dump=<directory>
+       build the index of a crossref public data file, written to the path given by
+            --crossref-source=local:<index> or to <directory>.sqlite, and exit
+     --pipeline
+       stream each entry through search, fetch, validation and unpaywall lookup
+            independently instead of waiting for each step to finish for all entries
+     --pipeline-workers=<stage>:<int>,...
+       number of concurrent workers of the search, fetch and unpaywall stages of
+            --pipeline (default: --parallel-requests for each stage)
+     --local-match-threshold=<float>
+       resolve entries without a crossref search when a record of the metadata cache
+            with the same first author and year has a title similarity above <float> (default: 0.9)
+     --no-local-match
+       always search crossref for the entries without doi
+     --crossref-candidates=<int>
+       number of works returned by each crossref search, re-ranked against the input
+            entry (title, year, type, first author, container) to choose the doi (default: 5)
+     --character-table=<path>
+       file of replacements applied to the fields of the output, one per line as
+            <text><tab><replacement> (default: the built-in table of curious characters)
+     --provenance=<path>
+       write the input, crossref and output bibtex views of each entry to <path>,
+            one JSON line per entry
+     --metrics=<path>
+       write the metrics of the run (requests, bytes, latencies and status codes per host,
+            retries, cache hits and misses, stage and entry times) as JSON to <path>
+     --metrics-prometheus=<path>
+       write the same metrics in the Prometheus text format, e.g. for the textfile
+            collector of node_exporter
+     --crossref-url=<url>, --doi-org-url=<url>, --unpaywall-url=<url>
+       base urls of the apis (default: https://api.crossref.org, https://doi.org,
+            https://api.unpaywall.org), e.g. to run against mirrors or the benchmark servers
+     --request-timeout=<int>
+       timeout of the api requests in seconds (default: 30)
+     --profile
+       record the cpu time (pstats, collapsed stacks for flame graphs) and the memory
+            allocations of each step, including the request worker threads, and print a summary
+     --profile-dir=<path>
+       directory of the profiles (default: <bib file>_profile), implies --profile
 
      """)
 
 
+# =============================================================================
+# Stage Fingerprints
+# =============================================================================
+
+# Input fields compared to the Crossref entry by the validation stage
+VALIDATION_FIELDS = ('ENTRYTYPE', 'title', 'year', 'date')
+
+
+def _fingerprint(value: Any) -> str:
+    data = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def stage_fingerprints(entry: Dict[str, Any], config: Config) -> Dict[str, str]:
+    """
+    Fingerprint the input fields each stage depends on.
+    
+    The search stage depends on the ``crossref_search_key`` fields and on
+    the input DOI, the validation stage on :data:`VALIDATION_FIELDS` and the
+    output stage on the whole entry. The fetch and Unpaywall stages depend
+    only on the resolved DOI (see :meth:`EntryStore.set_found_doi`).
+    
+    Returns:
+        Dictionary of fingerprints by stage name
+    """
+    search_fields = {k: entry.get(k, '') for k in config.crossref_search_key}
+    return {
+        'search': _fingerprint([search_fields, entry.get('doi') if config.use_input_doi else None]),
+        'validation': _fingerprint({k: entry.get(k) for k in VALIDATION_FIELDS}),
+        'output': _fingerprint(entry),
+    }
+
+
 # =============================================================================
 # Proper Python Logging
 # =============================================================================
@@ -446,313 +739,2375 @@ def setup_logging(verbose: int = 1, log_file: Optional[str] = None) -> logging.L
 
 
 # =============================================================================
-# Parallel processing
+# Run Metrics
 # =============================================================================
-from joblib import Parallel, delayed
-
+import bisect
 
-# =============================================================================
-# API Client Classes
-# =============================================================================
-from habanero import Crossref, cn
-from unpywall.utils import UnpywallCredentials
-from unpywall import Unpywall
 
-class CrossrefClient:
+class MetricsRegistry:
     """
-    Client for Crossref API interactions.
+    Thread-safe registry of the counters and timings of a run.
     
-    Encapsulates all Crossref API calls with retry logic and error handling.
+    Counters accumulate values (requests, bytes, cache hits); histograms
+    count the observations (latencies, in seconds) falling in fixed
+    buckets, so their size does not depend on the run and the histograms of
+    several runs can be added. Metrics are identified by a name and a set of
+    labels, such as the host of a request. The registry is exported as JSON
+    and in the Prometheus text format, for the textfile collector of
+    node_exporter.
     """
     
-    def __init__(self, mailto: str, logger: Optional[logging.Logger] = None):
-        self.mailto = mailto
-        self.base_url = "https://api.crossref.org"
-        self.client = Crossref(base_url=self.base_url, mailto=mailto)
-        self.logger = logger or logging.getLogger('jtcam_bibtex')
+    PREFIX = 'jtcam_bibtex_'
+    # Upper bounds of the histogram buckets, in seconds (the last bucket is +Inf)
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+               30.0, 60.0, 300.0, 900.0, 3600.0)
+    QUANTILES = (0.5, 0.9, 0.99)
     
-    @retry_with_backoff(
-        max_retries=3,
-        initial_delay=2.0,
-        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
-    )
-    def query(self, bibliographic: str) -> Dict[str, Any]:
-        """
-        Query Crossref by bibliographic information.
-        
-        Args:
-            bibliographic: Search query string
-            
-        Returns:
-            API response dictionary
-            
-        Raises:
-            CrossrefAPIError: If request fails after retries
-        """
-        self.logger.debug(f'Crossref query: {bibliographic[:60]}...')
-        
-        try:
-            response = self.client.works(query_bibliographic=bibliographic, limit=1)
-            self.logger.debug(f'Crossref response status: {response.get("status", "unknown")}')
-            return response
-        except HTTPError as e:
-            status_code = e.response.status_code if hasattr(e, 'response') else None
-            if status_code == 429:
-                retry_after = int(e.response.headers.get('Retry-After', 5))
-                self.logger.warning(f'Rate limited by Crossref. Waiting {retry_after}s...')
-                time.sleep(retry_after)
-                raise CrossrefAPIError(f"Rate limited (429)", status_code=429) from e
-            elif status_code == 503:
-                raise CrossrefAPIError(f"Service unavailable (503)", status_code=503) from e
-            else:
-                self.logger.warning(f'HTTP error from Crossref: {e}')
-                return {'status': 'bad', 'error': str(e), 'status_code': status_code}
-        except (ConnectionError, Timeout) as e:
-            self.logger.warning(f'Connection error to Crossref: {e}')
-            raise CrossrefAPIError(f"Connection failed: {e}") from e
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # Per histogram: [count of each bucket and of +Inf, sum, maximum]
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]] = {}
     
-    @retry_with_backoff(
-        max_retries=2,
-        initial_delay=1.0,
-        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
-    )
-    def get_bibtex(self, doi: str) -> Tuple[Optional[str], Optional[str], str]:
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((labels or {}).items()))
+    
+    def reset(self) -> None:
+        """Discard all the metrics."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+    
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        """Add ``value`` to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Record one observation of a histogram."""
+        key = self._key(name, labels)
+        bucket = bisect.bisect_left(self.BUCKETS, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.BUCKETS) + 1), 0.0, value]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+            histogram[2] = max(histogram[2], value)
+    
+    @classmethod
+    def _quantile(cls, counts: List[int], maximum: float, q: float) -> float:
         """
-        Get BibTeX entry for a DOI using content negotiation.
-        
-        Args:
-            doi: DOI string
-            
-        Returns:
-            Tuple of (bibtex_str, json_str, status)
+        Estimate a quantile from the bucket counts, interpolating linearly
+        within its bucket like the Prometheus ``histogram_quantile``.
         """
-        self.logger.debug(f'Fetching BibTeX for DOI: {doi}')
+        rank = q * sum(counts)
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = cls.BUCKETS[i - 1] if i > 0 else 0.0
+                upper = min(cls.BUCKETS[i], maximum) if i < len(cls.BUCKETS) else maximum
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / count
+            cumulative += count
+        return maximum
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """All the metrics, with the buckets, count, sum, maximum and estimated quantiles of the histograms."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(counts), total, maximum)
+                          for key, (counts, total, maximum) in self.histograms.items()}
+        result: Dict[str, Any] = {'counters': [], 'histograms': []}
+        for (name, labels), value in sorted(counters.items()):
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total, maximum) in sorted(histograms.items()):
+            histogram = {'name': name, 'labels': dict(labels), 'buckets': counts,
+                         'count': sum(counts), 'sum': total, 'max': maximum}
+            for q in self.QUANTILES:
+                histogram[f'p{int(q * 100)}'] = self._quantile(counts, maximum, q)
+            result['histograms'].append(histogram)
+        return result
+    
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        def labels_text(labels: Dict[str, str]) -> str:
+            if not labels:
+                return ''
+            escaped = (
+                str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                for v in labels.values()
+            )
+            return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
         
-        try:
-            bibtex_str = cn.content_negotiation(ids=doi, format="bibentry")
-            json_str = cn.content_negotiation(ids=doi, format="citeproc-json")
-            return bibtex_str, json_str, 'ok'
-        except HTTPError as e:
-            status_code = e.response.status_code if hasattr(e, 'response') else None
-            self.logger.warning(f'HTTP error from Crossref content negotiation: {e}')
-            if status_code == 404:
-                return None, None, 'not_found'
-            elif status_code == 429:
-                raise CrossrefAPIError(f"Rate limited (429)", status_code=429) from e
-            else:
-                return None, None, f'http_error_{status_code}'
-        except (ConnectionError, Timeout) as e:
-            self.logger.warning(f'Connection error to Crossref: {e}')
-            raise CrossrefAPIError(f"Connection failed: {e}") from e
+        metrics = self.to_dict()
+        lines = []
+        typed = set()
+        for counter in metrics['counters']:
+            name = self.PREFIX + counter['name']
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f"{name}{labels_text(counter['labels'])} {counter['value']:g}")
+        for histogram in metrics['histograms']:
+            name = self.PREFIX + histogram['name']
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + (float('inf'),), histogram['buckets']):
+                cumulative += count
+                labels = dict(histogram['labels'], le='+Inf' if bound == float('inf') else f'{bound:g}')
+                lines.append(f"{name}_bucket{labels_text(labels)} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(histogram['labels'])} {histogram['sum']:.6g}")
+            lines.append(f"{name}_count{labels_text(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
     
     @staticmethod
-    def extract_doi(response: Dict[str, Any]) -> Optional[str]:
-        """Extract DOI from Crossref query response."""
-        try:
-            return response['message']['items'][0]['DOI']
-        except (KeyError, IndexError):
-            return None
+    def _write(path: str, content: str) -> None:
+        # Written to a temporary file and renamed, so a scraper never reads a partial file
+        tmp_name = f'{path}.tmp'
+        with open(tmp_name, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_name, path)
+    
+    def write_json(self, path: str) -> None:
+        """Write the metrics as JSON."""
+        self._write(path, json.dumps(self.to_dict(), indent=2))
+    
+    def write_prometheus(self, path: str) -> None:
+        """Write the metrics as a Prometheus textfile."""
+        self._write(path, self.to_prometheus())
 
 
-class UnpaywallClient:
+# Registry of the current run, fed by the API clients, the caches and the stages
+METRICS = MetricsRegistry()
+
+
+# =============================================================================
+# Shared Metadata Cache
+# =============================================================================
+
+def default_metadata_cache_file() -> str:
+    """Return the default location of the shared metadata cache."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'jtcam_bibtex_editing', 'metadata_cache.sqlite')
+
+
+def canonical_doi(doi: str) -> str:
     """
-    Client for Unpaywall API interactions.
+    Return the canonical form of a DOI.
     
-    Encapsulates all Unpaywall API calls with retry logic and error handling.
+    DOIs are case-insensitive and are often given as URLs, so the resolver
+    prefix is removed and the result is lower-cased.
+    """
+    doi = doi.strip()
+    lowered = doi.lower()
+    for prefix in ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/',
+                   'http://dx.doi.org/', 'doi:'):
+        if lowered.startswith(prefix):
+            doi = doi[len(prefix):]
+            break
+    return doi.strip().lower()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a Crossref search string (case and whitespace)."""
+    return ' '.join(query.lower().split())
+
+
+def crossref_query_key(query: str, rows: int) -> str:
     """
+    Metadata cache key of a Crossref search returning ``rows`` candidates.
     
-    def __init__(self, email: str, logger: Optional[logging.Logger] = None):
-        self.email = email
-        UnpywallCredentials(email)
-        self.logger = logger or logging.getLogger('jtcam_bibtex')
+    Single-candidate searches keep the key of the normalized query, as
+    cached before the candidates were re-ranked.
+    """
+    key = normalize_query(query)
+    return key if rows == 1 else f'{key} #rows={rows}'
+
+
+def bibtex_cache_key(doi: str, csl: bool = False) -> str:
+    """
+    Metadata cache key of the (bibtex_str, json_str, status) result of a DOI.
     
-    @retry_with_backoff(
-        max_retries=3,
-        initial_delay=1.0,
-        exceptions=(UnpaywallAPIError, ConnectionError, Timeout)
-    )
-    def query_by_doi(self, doi: str) -> Tuple[Optional[Any], str, str]:
-        """
-        Query Unpaywall by DOI.
+    Results holding only the CSL JSON (batched Crossref queries and
+    ``--bibtex-from-csl``) are keyed apart from the BibTeX of content
+    negotiation, so a run only reads the kind of result it would fetch
+    itself.
+    """
+    key = canonical_doi(doi)
+    return f'{key} #csl' if csl else key
+
+
+class MetadataCache:
+    """
+    Persistent cache of API results shared by all processed BibTeX files.
+    
+    Results are stored in an SQLite database, keyed by canonical DOI for
+    content negotiation and Unpaywall lookups, and by normalized query
+    string for Crossref searches. When the database grows beyond
+    ``max_bytes``, the least recently used records are evicted. The total
+    size of the records is kept up to date by triggers in a one-row table,
+    so a write does not scan the database.
+    
+    The DOI, normalized title, first author and year of the Crossref
+    records are also stored in the ``match_keys`` table, indexed by
+    (first author, year), for the local match index.
+    """
+    
+    CROSSREF_QUERY = 'crossref_query'
+    BIBTEX = 'bibtex'
+    UNPAYWALL = 'unpaywall'
+    
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger('jtcam_bibtex')
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
         
-        Args:
-            doi: DOI string
-            
-        Returns:
-            Tuple of (query_result, message, status)
-        """
-        self.logger.debug(f'Querying Unpaywall for DOI: {doi}')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The database may be shared by several concurrent runs
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_access REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS metadata_last_access ON metadata (last_access)'
+        )
+        self.conn.commit()
+        
+        # Created in one transaction, so concurrent runs see the total and its
+        # triggers together; the sum is only computed for older databases
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata_size ('
+            ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+            ' total INTEGER NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TRIGGER IF NOT EXISTS metadata_size_insert AFTER INSERT ON metadata '
+            'BEGIN UPDATE metadata_size SET total = total + NEW.size WHERE id = 0; END'
+        )
+        self.conn.execute(
+            'CREATE TRIGGER IF NOT EXISTS metadata_size_delete AFTER DELETE ON metadata '
+            'BEGIN UPDATE metadata_size SET total = total - OLD.size WHERE id = 0; END'
+        )
+        self.conn.execute(
+            'CREATE TRIGGER IF NOT EXISTS metadata_size_update AFTER UPDATE OF size ON metadata '
+            'BEGIN UPDATE metadata_size SET total = total + NEW.size - OLD.size WHERE id = 0; END'
+        )
+        self.conn.execute(
+            'INSERT OR IGNORE INTO metadata_size (id, total) '
+            'SELECT 0, COALESCE(SUM(size), 0) FROM metadata'
+        )
+        self.conn.commit()
         
+        backfill = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'match_keys'"
+        ).fetchone() is None
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS match_keys ('
+            ' key TEXT PRIMARY KEY,'
+            ' doi TEXT NOT NULL,'
+            ' title TEXT NOT NULL,'
+            ' year TEXT NOT NULL,'
+            ' author_key TEXT NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS match_keys_block ON match_keys (author_key, year)'
+        )
+        self.conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS match_keys_delete AFTER DELETE ON metadata '
+            f"WHEN OLD.namespace = '{self.BIBTEX}' "
+            f'BEGIN DELETE FROM match_keys WHERE key = OLD.key; END'
+        )
+        self.conn.commit()
+        if backfill:
+            # Crossref records cached before the match keys were stored
+            records = list(self.items(self.BIBTEX))
+            with self._lock:
+                self._put_match_keys(records)
+                self.conn.commit()
+    
+    @classmethod
+    def from_config(cls, config: Config, logger: logging.Logger) -> Optional[MetadataCache]:
+        """Open the cache configured in ``config``, or return None if disabled."""
+        if not config.metadata_cache_file:
+            return None
         try:
-            query = Unpywall.doi(dois=[doi], errors='ignore')
-            if query is not None:
-                return query, '{Unpywall.doi returns results}', 'doi found'
-            else:
-                return None, '{Unpywall.doi returns None}', 'doi not found'
-        except HTTPError as e:
-            status_code = e.response.status_code if hasattr(e, 'response') else None
-            self.logger.warning(f'HTTP error from Unpaywall: {status_code}')
-            if status_code == 404:
-                return None, '{DOI not found in Unpaywall}', 'doi_not_found'
-            elif status_code == 429:
-                raise UnpaywallAPIError(f"Rate limited (429)", status_code=429) from e
-            else:
-                return None, f'{{Unpywall.doi HTTP error {status_code}}}', f'http_error_{status_code}'
-        except (ConnectionError, Timeout) as e:
-            self.logger.warning(f'Connection error to Unpaywall: {e}')
-            raise UnpaywallAPIError(f"Connection failed: {e}") from e
-        except Exception as e:
-            self.logger.warning(f'Unexpected error from Unpaywall: {e}')
-            return None, f'{{Unpywall.doi failed}}: {str(e)[:100]}', 'doi_failed'
+            return cls(config.metadata_cache_file,
+                       max_bytes=config.metadata_cache_max_size * 1024 * 1024,
+                       logger=logger)
+        except sqlite3.Error as e:
+            logger.warning(f'Cannot open metadata cache {config.metadata_cache_file}: {e}')
+            return None
     
-    def extract_oai_url(self, query_result: Optional[Any]) -> Tuple[str, str]:
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, Any]:
         """
-        Extract OAI URL from Unpaywall query result.
+        Look up several keys of a namespace.
         
-        Args:
-            query_result: Unpaywall query result DataFrame
-            
         Returns:
-            Tuple of (oai_url, status)
+            Dictionary of the cached values, for the keys found in the cache
         """
-        oai_url = 'oai url not found'
-        status = 'oai url not found'
-        
-        if query_result is None:
-            return oai_url, status
-        
-        # Try different URL fields in order of preference
-        url_fields = [
-            'best_oa_location.url_for_pdf',
-            'best_oa_location.url',
-            'best_oa_location.url_for_landing_page'
-        ]
+        found: Dict[str, Any] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay below SQLITE_MAX_VARIABLE_NUMBER
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT key, value FROM metadata WHERE namespace = ? AND key IN ({placeholders})',
+                    [namespace] + chunk
+                ).fetchall()
+                for key, value in rows:
+                    try:
+                        found[key] = pickle.loads(value)
+                    except Exception as e:
+                        self.logger.debug(f'Discarding unreadable cache record {namespace}/{key}: {e}')
+            
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    'UPDATE metadata SET last_access = ? WHERE namespace = ? AND key = ?',
+                    [(now, namespace, key) for key in found]
+                )
+                self.conn.commit()
         
-        for field in url_fields:
-            value = query_result.get(field)
-            if value is not None and value[0] is not None:
-                oai_url = urllib.parse.unquote(value[0], errors='replace')
-                status = 'oai url found'
-                self.logger.debug(f'Found OAI URL: {oai_url[:80]}...')
-                break
+        self.hits += len(found)
+        self.misses += len(unique_keys) - len(found)
+        METRICS.inc('cache_requests_total', {'namespace': namespace, 'result': 'hit'}, len(found))
+        METRICS.inc('cache_requests_total', {'namespace': namespace, 'result': 'miss'},
+                    len(unique_keys) - len(found))
+        return found
+    
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Look up a single key, returning None when it is not cached."""
+        return self.get_many(namespace, [key]).get(key)
+    
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        """Iterate over the (key, value) records of a namespace."""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT key, value FROM metadata WHERE namespace = ?', (namespace,)
+            ).fetchall()
+        for key, value in rows:
+            try:
+                yield key, pickle.loads(value)
+            except Exception as e:
+                self.logger.debug(f'Discarding unreadable cache record {namespace}/{key}: {e}')
+    
+    def put_many(self, namespace: str, items: Dict[str, Any]) -> None:
+        """Store several values of a namespace and evict old records if needed."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((namespace, key, blob, len(blob), now))
         
-        return oai_url, status
+        with self._lock:
+            # An upsert, as the rows deleted by INSERT OR REPLACE fire no trigger
+            self.conn.executemany(
+                'INSERT INTO metadata (namespace, key, value, size, last_access) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = excluded.value, size = excluded.size, last_access = excluded.last_access',
+                rows
+            )
+            if namespace == self.BIBTEX:
+                self._put_match_keys(items.items())
+            self.conn.commit()
+            self._evict()
     
-    def get_repository_info(self, query_result: Optional[Any]) -> Tuple[Optional[str], Optional[str]]:
+    def put(self, namespace: str, key: str, value: Any) -> None:
+        """Store a single value."""
+        self.put_many(namespace, {key: value})
+    
+    def _put_match_keys(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Store the match keys of (key, (bibtex_str, json_str, status)) Crossref records."""
+        rows = []
+        for key, value in items:
+            try:
+                _, json_str, status = value
+            except (TypeError, ValueError):
+                continue
+            match_key = csl_match_key(json_str) if status == 'ok' and json_str else None
+            if match_key is not None:
+                rows.append((key,) + match_key)
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO match_keys (key, doi, title, year, author_key) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+    
+    def match_keys(self, blocks: Iterable[Tuple[str, str]]) -> List[Tuple[str, str, str, str]]:
         """
-        Get repository type and institution from query result.
+        Return the match keys of the Crossref records of some blocks.
         
+        Args:
+            blocks: (first author key, year) pairs
+            
         Returns:
-            Tuple of (host_type, repository_institution)
+            List of (doi, normalized title, year, first author key)
         """
-        if query_result is None:
-            return None, None
-        
-        host_type = None
-        institution = None
-        
-        if query_result.get('best_oa_location.host_type') is not None:
-            host_type = query_result.get('best_oa_location.host_type')[0]
+        found = []
+        with self._lock:
+            for author_key, year in set(blocks):
+                found.extend(self.conn.execute(
+                    'SELECT doi, title, year, author_key FROM match_keys WHERE author_key = ? AND year = ?',
+                    (author_key, year)
+                ).fetchall())
+        return found
+    
+    def _evict(self) -> None:
+        """Remove least recently used records until the size limit is met."""
+        total = self.conn.execute('SELECT total FROM metadata_size WHERE id = 0').fetchone()[0]
+        if total <= self.max_bytes:
+            return
         
-        if query_result.get('best_oa_location.repository_institution') is not None:
-            institution = query_result.get('best_oa_location.repository_institution')[0]
+        # Free some margin to avoid evicting on every insertion
+        to_free = total - int(0.9 * self.max_bytes)
+        victims = []
+        for namespace, key, size in self.conn.execute(
+                'SELECT namespace, key, size FROM metadata ORDER BY last_access'):
+            victims.append((namespace, key))
+            to_free -= size
+            if to_free <= 0:
+                break
         
-        return host_type, institution
+        self.conn.executemany(
+            'DELETE FROM metadata WHERE namespace = ? AND key = ?', victims
+        )
+        self.conn.commit()
+        self.logger.info(f'metadata cache: {len(victims)} least recently used records evicted')
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        self.logger.info(f'metadata cache: {self.hits} hits, {self.misses} misses')
+        self.conn.close()
 
 
 # =============================================================================
-# Legacy API functions (wrap the new client classes for backward compatibility)
+# Cache Journal
 # =============================================================================
+import shutil
 
-# Module-level helper functions for parallel processing (must be picklable)
-def _crossref_query_worker(bibliographic: str) -> Dict[str, Any]:
-    """Worker function for parallel Crossref queries (creates client inside worker)."""
-    client = CrossrefClient("jtcam@episciences.org")
-    return client.query(bibliographic)
 
-
-def _crossref_get_bibtex_worker(doi: str) -> Tuple[Optional[str], Optional[str], str]:
-    """Worker function for parallel Crossref BibTeX fetch (creates client inside worker)."""
-    client = CrossrefClient("jtcam@episciences.org")
-    return client.get_bibtex(doi)
-
-
-class DOIOrgClient:
+class CacheJournal:
     """
-    Client for doi.org content negotiation.
+    Append-only journal of the entry store updates of a run.
     
-    Fetches BibTeX and JSON metadata directly from doi.org using
-    content negotiation headers.
+    Each line is the JSON of one entry, written as soon as one of its
+    results arrives, so an interrupted run loses no completed request. On
+    startup the journal is replayed over the cache file.
+    
+    The journal is compacted into the cache file at the end of each step,
+    and during a step once it holds ``compact_bytes`` or is
+    ``compact_interval`` seconds old. The journal is then renamed to
+    ``<path>.compacting`` and the store is saved by a background thread
+    while new records go to a fresh journal; the renamed journal is removed
+    once the save succeeds. An entry updated during the save is journaled
+    again, so replaying the renamed journal then the current one over the
+    cache file always restores the latest state.
     """
     
-    def __init__(self, timeout: int = 30, logger: Optional[logging.Logger] = None):
-        self.timeout = timeout
-        self.base_url = "https://doi.org"
-        self.logger = logger or logging.getLogger('jtcam_bibtex')
+    def __init__(self, path: str, logger: logging.Logger, save=None,
+                 compact_bytes: int = 64 * 1024 * 1024, compact_interval: float = 300.0):
+        """
+        Args:
+            path: Journal file
+            logger: logging.Logger instance
+            save: Function writing the whole store to the cache file, called
+                from the compaction thread
+            compact_bytes: Size of the journal triggering a compaction
+            compact_interval: Age in seconds of the journal triggering a compaction
+        """
+        self.path = path
+        self.rotated_path = f'{path}.compacting'
+        self.logger = logger
+        self.save = save
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        self.records = 0
+        # perf_counter time of the last record of each entry
+        self.last_update: Dict[str, float] = {}
+        self._bytes = 0
+        self._started = time.monotonic()
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
     
-    @retry_with_backoff(
-        max_retries=2,
-        initial_delay=1.0,
-        exceptions=(ConnectionError, Timeout, urllib.error.URLError)
-    )
-    def get_bibtex(self, doi: str) -> Tuple[Optional[str], Optional[str], str]:
+    def replay(self, store: Dict[str, EntryStore]) -> int:
         """
-        Get BibTeX entry for a DOI from doi.org.
+        Apply the journaled entries to ``store``.
         
-        Args:
+        The journal renamed by an interrupted compaction holds the older
+        records and is replayed first.
+        
+        Returns:
+            Number of replayed records
+        """
+        n = 0
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        store[record['key']] = EntryStore.from_dict(record['entry'])
+                        n += 1
+                    except (ValueError, KeyError, TypeError):
+                        # Torn record of an interrupted write
+                        self.logger.warning(f'skipping unreadable record in cache journal {path}')
+        return n
+    
+    def append(self, key: str, entry_store: EntryStore) -> None:
+        """Journal the current state of an entry."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._started = time.monotonic()
+        line = json.dumps({'key': key, 'entry': entry_store.to_dict()}, default=str) + '\n'
+        self._file.write(line)
+        self._file.flush()
+        self.records += 1
+        self.last_update[key] = time.perf_counter()
+        self._bytes += len(line)
+        if (self.save is not None and not self.compacting()
+                and (self._bytes >= self.compact_bytes
+                     or time.monotonic() - self._started >= self.compact_interval)):
+            self._start_compaction()
+    
+    def compacting(self) -> bool:
+        """Whether a background compaction is running."""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def _start_compaction(self) -> None:
+        """Rename the journal and save the store in a background thread."""
+        self._close_file()
+        if os.path.exists(self.rotated_path):
+            # Kept by a failed compaction, the records are saved with it
+            with open(self.rotated_path, 'ab') as dst, open(self.path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+        self.records = 0
+        self._bytes = 0
+        self._thread = threading.Thread(target=self._compact, name='journal-compaction', daemon=True)
+        self._thread.start()
+    
+    def _compact(self) -> None:
+        try:
+            self.save()
+        except Exception as e:
+            # An entry modified while it is serialized, the next compaction retries
+            self.logger.warning(f'cache journal compaction failed, {self.rotated_path} is kept: {e}')
+            return
+        os.remove(self.rotated_path)
+    
+    def wait(self) -> None:
+        """Wait for the end of a background compaction."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def truncate(self) -> None:
+        """Discard the journal once its records are in the cache file."""
+        self.close()
+        for path in (self.path, self.rotated_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.records = 0
+        self._bytes = 0
+    
+    def close(self) -> None:
+        """Wait for a background compaction and close the journal file."""
+        self.wait()
+        self._close_file()
+    
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# =============================================================================
+# Entry Store Cache
+# =============================================================================
+import contextlib
+import gc
+import operator
+import struct
+
+
+class StoreCacheFile:
+    """
+    Versioned binary file of the entry store.
+    
+    The file is laid out as::
+    
+        header   magic, format version, number of entries
+        body     pickle of (fields, keys, rows, blobs)
+    
+    ``fields`` names the EntryStore fields of each row, so a cache written
+    before a field was added or removed still loads. ``rows`` holds one
+    tuple per entry, with the index in ``blobs`` of its compressed Crossref
+    CSL JSON: each distinct record is stored once however many entries
+    share its DOI. The blobs are given to the entries as they are, and
+    only decompressed when an entry reads its JSON; the JSON received
+    during a run is compressed once and kept for the following saves.
+    
+    A save only reads the entries, so it may run in a thread while they
+    are updated (see :class:`CacheJournal`).
+    
+    Files without the magic are the pickled dictionaries of the previous
+    format and are still read.
+    """
+    
+    MAGIC = b'JTCSTORE'
+    VERSION = 1
+    _HEADER = struct.Struct('>8sIQ')
+    
+    def __init__(self, path: str, logger: logging.Logger):
+        """
+        Args:
+            path: Cache file
+            logger: logging.Logger instance
+        """
+        self.path = path
+        self.logger = logger
+        self.fields = tuple(f.name for f in dataclasses.fields(EntryStore))
+        self._text_column = self.fields.index('_crossref_json')
+        self._blob_column = self.fields.index('_crossref_json_blob')
+        # Compressed form of the JSON strings of the entries
+        self._compressed: Dict[str, bytes] = {}
+    
+    def load(self) -> Dict[str, EntryStore]:
+        """
+        Read the entry store.
+        
+        Returns:
+            Dictionary of EntryStore instances, empty if there is no cache
+            
+        Raises:
+            BibtexProcessingError: if the file has an unknown format version
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'rb') as handle:
+            data = handle.read()
+        
+        if data[:len(self.MAGIC)] != self.MAGIC:
+            with _gc_paused():
+                return self._load_legacy(pickle.loads(data))
+        _, version, count = self._HEADER.unpack_from(data, 0)
+        if version != self.VERSION:
+            raise BibtexProcessingError(
+                f'cache {self.path} has format version {version}, expected {self.VERSION}'
+            )
+        
+        store: Dict[str, EntryStore] = {}
+        with _gc_paused():
+            fields, keys, rows, blobs = pickle.loads(memoryview(data)[self._HEADER.size:])
+            blob_column = fields.index('_crossref_json_blob')
+            # A cache written by a version with other fields is matched by name
+            same_fields = tuple(fields) == self.fields
+            known = set(self.fields)
+            for key, row in zip(keys, rows):
+                row = list(row)
+                if row[blob_column] is not None:
+                    row[blob_column] = blobs[row[blob_column]]
+                if same_fields:
+                    store[key] = EntryStore(*row)
+                else:
+                    store[key] = EntryStore(**{name: value for name, value in zip(fields, row) if name in known})
+        if len(store) != count:
+            self.logger.warning(f'cache {self.path} holds {len(store)} entries, header says {count}')
+        return store
+    
+    @staticmethod
+    def _load_legacy(old_store: Dict[str, Any]) -> Dict[str, EntryStore]:
+        """Convert the pickled dictionary store of the previous format."""
+        return {
+            key: EntryStore.from_dict(data) if isinstance(data, dict) else data
+            for key, data in old_store.items()
+        }
+    
+    def save(self, store: Dict[str, EntryStore]) -> None:
+        """Write the entry store atomically."""
+        row_of = operator.attrgetter(*self.fields)
+        index: Dict[bytes, int] = {}
+        blobs: List[bytes] = []
+        compressed: Dict[str, bytes] = {}
+        rows = []
+        with _gc_paused():
+            for entry_store in list(store.values()):
+                row = list(row_of(entry_store))
+                text, blob = row[self._text_column], row[self._blob_column]
+                if blob is None and text is not None:
+                    blob = self._compressed.get(text)
+                    if blob is None:
+                        blob = zlib.compress(text.encode('utf-8'), 1)
+                    compressed[text] = blob
+                row[self._text_column] = None
+                row[self._blob_column] = None
+                if blob is not None:
+                    i = index.get(blob)
+                    if i is None:
+                        i = index[blob] = len(blobs)
+                        blobs.append(blob)
+                    row[self._blob_column] = i
+                rows.append(tuple(row))
+            self._compressed = compressed
+            keys = list(store.keys())
+        
+        # Write a temporary file and rename it, so a crash never leaves a partial cache
+        tmp_name = f'{self.path}.tmp'
+        with open(tmp_name, 'wb') as handle:
+            handle.write(self._HEADER.pack(self.MAGIC, self.VERSION, len(rows)))
+            # Pickled straight to the file: the GIL is released at each
+            # frame written, so a save in a thread does not stall the others
+            pickle.Pickler(handle, protocol=pickle.HIGHEST_PROTOCOL).dump((self.fields, keys, rows, blobs))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, self.path)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector, which slows down building large containers."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# =============================================================================
+# Provenance Sidecar
+# =============================================================================
+import queue
+
+
+class ProvenanceWriter:
+    """
+    Background writer of the per-entry provenance file.
+    
+    Each JSON line holds the input, Crossref and output views of one entry.
+    The records are queued by the processing thread; a daemon thread
+    serializes the BibTeX entries and writes the lines, so the processing
+    never waits on the rendering or the disk.
+    """
+    
+    def __init__(self, path: str, logger: logging.Logger):
+        """
+        Args:
+            path: Provenance file (JSON lines)
+            logger: logging.Logger instance
+        """
+        self.path = path
+        self.logger = logger
+        self.records = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write, name='provenance-writer', daemon=True)
+        self._thread.start()
+    
+    def add(self, key: str, entry_store: EntryStore) -> None:
+        """Queue the provenance record of an entry."""
+        # Shallow copies, as the entries may be modified once queued
+        crossref = entry_store.crossref_bibtex_entry if entry_store.doi_to_bibtex_status == 'ok' else None
+        self._queue.put({
+            'key': key,
+            'ID': entry_store.input.get('ID'),
+            'doi': entry_store.found_doi,
+            'doi_status': entry_store.found_doi_status,
+            'check': entry_store.check,
+            'action': list(entry_store.action),
+            'input': dict(entry_store.input),
+            'crossref': dict(crossref) if crossref else None,
+            'output': dict(entry_store.output_bibtex_entry) if entry_store.output_bibtex_entry else None,
+        })
+    
+    def _write(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                for view in ('input', 'crossref', 'output'):
+                    if record[view] is not None:
+                        record[view] = bibtex_entry_to_str(record[view])
+                f.write(json.dumps(record, default=str) + '\n')
+                self.records += 1
+    
+    def close(self) -> None:
+        """Write the queued records and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+        self.logger.info(f'{self.records} provenance records written to {self.path}')
+
+
+# =============================================================================
+# Rate Limiting
+# =============================================================================
+
+class _TokenBucket:
+    """Token bucket state for one host."""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.nominal_rate = rate
+        self.tokens = max(1.0, rate)
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+    
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate)
+    
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+class RateLimiter:
+    """
+    Per-host token-bucket rate limiter shared by all concurrent requests.
+    
+    Each host starts at a default rate, which is updated from the
+    ``X-Rate-Limit-Limit``/``X-Rate-Limit-Interval`` headers sent by
+    Crossref. A 429 response pauses the host for ``Retry-After`` seconds
+    and halves its rate; the rate then recovers on successful responses.
+    """
+    
+    DEFAULT_RATES = {
+        'api.crossref.org': 50.0,
+        'doi.org': 20.0,
+        'api.unpaywall.org': 10.0,
+    }
+    DEFAULT_RATE = 10.0
+    
+    def __init__(self, logger: Optional[logging.Logger] = None,
+                 rates: Optional[Dict[str, float]] = None):
+        self.logger = logger or logging.getLogger('jtcam_bibtex')
+        self.rates = dict(self.DEFAULT_RATES)
+        if rates:
+            self.rates.update(rates)
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._lock = threading.Lock()
+    
+    def _bucket(self, host: str) -> _TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = _TokenBucket(self.rates.get(host, self.DEFAULT_RATE))
+            self._buckets[host] = bucket
+        return bucket
+    
+    def acquire(self, host: str) -> float:
+        """
+        Wait until a request to ``host`` is allowed.
+        
+        Returns:
+            Time waited in seconds
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            bucket.refill(now)
+            # Reserve a token: a negative balance queues the caller behind
+            # the requests already waiting
+            bucket.tokens -= 1
+            wait = max(-bucket.tokens / bucket.rate, bucket.blocked_until - now, 0.0)
+        if wait > 0:
+            self.logger.debug(f'rate limiter: waiting {wait:.2f}s for {host}')
+            time.sleep(wait)
+        return wait
+    
+    def _set_rate(self, host: str, bucket: _TokenBucket, rate: float) -> None:
+        if abs(rate - bucket.rate) > 1e-3:
+            bucket.rate = rate
+            self.logger.info(f'rate limiter: {host} now paced at {rate:.2f} requests/s')
+    
+    def update_from_headers(self, host: str, headers: Any, status_code: Optional[int] = None) -> None:
+        """
+        Adjust the pacing of ``host`` from a response.
+        
+        Args:
+            host: Host name of the request
+            headers: Response headers (any mapping with a ``get`` method)
+            status_code: HTTP status of the response
+        """
+        headers = headers if headers is not None else {}
+        limit = _parse_number(headers.get('X-Rate-Limit-Limit'))
+        interval = _parse_duration(headers.get('X-Rate-Limit-Interval'))
+        retry_after = _parse_number(headers.get('Retry-After'))
+        
+        with self._lock:
+            bucket = self._bucket(host)
+            if limit and interval:
+                bucket.nominal_rate = limit / interval
+            
+            if status_code == 429:
+                pause = retry_after if retry_after is not None else 1.0 / bucket.rate
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + pause)
+                bucket.tokens = min(bucket.tokens, 0.0)
+                self._set_rate(host, bucket, max(bucket.rate / 2, 0.1))
+                self.logger.warning(f'rate limiter: {host} throttled, pausing {pause:.1f}s')
+            else:
+                if retry_after is not None and status_code == 503:
+                    bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+                # Recover additively towards the rate announced by the server
+                if bucket.rate < bucket.nominal_rate:
+                    self._set_rate(host, bucket, min(bucket.nominal_rate, bucket.rate + 0.1 * bucket.nominal_rate))
+                elif bucket.rate > bucket.nominal_rate:
+                    self._set_rate(host, bucket, bucket.nominal_rate)
+    
+    def current_rates(self) -> Dict[str, float]:
+        """Return the current pacing (requests/s) of each host."""
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+    
+    def log_rates(self) -> None:
+        """Log the current pacing of each host."""
+        for host, rate in sorted(self.current_rates().items()):
+            self.logger.info(f'rate limiter: {host} paced at {rate:.2f} requests/s')
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    """Parse a numeric header value, returning None if absent or invalid."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a duration header such as ``1s``, ``500ms`` or ``2m`` into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    for suffix, factor in (('ms', 0.001), ('s', 1.0), ('m', 60.0), ('h', 3600.0)):
+        if value.endswith(suffix):
+            number = _parse_number(value[:-len(suffix)])
+            return number * factor if number else None
+    return _parse_number(value) or None
+
+
+# =============================================================================
+# API Client Classes
+# =============================================================================
+
+class APIClient:
+    """
+    Base class of the API clients.
+    
+    Each client owns a keep-alive session whose connection pool lives for the
+    whole run, so DNS, TCP and TLS setup are paid once per host rather than
+    once per request. Requests are paced with an optional RateLimiter shared
+    by all clients, which is fed back with the rate-limit headers of the
+    responses.
+    """
+    
+    def __init__(self, timeout: int = 30, logger: Optional[logging.Logger] = None,
+                 rate_limiter: Optional[RateLimiter] = None, pool_size: int = 10):
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger('jtcam_bibtex')
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        # One pooled connection per concurrent request and per host
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+    
+    def _throttle(self, url: str) -> str:
+        """Wait for the rate limiter of the host of ``url`` and return the host."""
+        host = urllib.parse.urlsplit(url).hostname or ''
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(host)
+        return host
+    
+    def _feedback(self, host: str, headers: Any, status_code: Optional[int]) -> None:
+        """Report the headers of a response to the rate limiter."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.update_from_headers(host, headers, status_code)
+    
+    def _get(self, url: str, params: Optional[Dict[str, Any]] = None,
+             headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """
+        Paced HTTP GET request.
+        
+        Raises:
+            HTTPError: If the response status is an error
+        """
+        host = self._throttle(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            METRICS.inc('http_errors_total', {'host': host, 'error': type(e).__name__})
+            raise
+        METRICS.observe('http_request_seconds', time.perf_counter() - start, {'host': host})
+        METRICS.inc('http_requests_total', {'host': host, 'status': str(response.status_code)})
+        METRICS.inc('http_response_bytes_total', {'host': host}, len(response.content))
+        self._feedback(host, response.headers, response.status_code)
+        response.raise_for_status()
+        return response
+
+
+def _retry_after(response: Optional[requests.Response],
+                 default: Optional[float] = None) -> Optional[float]:
+    """Read the Retry-After header of a response, in seconds (fractions are kept)."""
+    if response is None:
+        return default
+    value = _parse_number(response.headers.get('Retry-After'))
+    return float(value) if value is not None else default
+
+
+class CrossrefClient(APIClient):
+    """
+    Client for Crossref API interactions.
+    
+    Encapsulates all Crossref API calls with retry logic and error handling.
+    """
+    
+    def __init__(self, mailto: str, logger: Optional[logging.Logger] = None,
+                 rate_limiter: Optional[RateLimiter] = None, timeout: int = 30,
+                 pool_size: int = 10):
+        super().__init__(timeout=timeout, logger=logger, rate_limiter=rate_limiter,
+                         pool_size=pool_size)
+        self.mailto = mailto
+        self.base_url = "https://api.crossref.org"
+        self.headers = {'User-Agent': f'jtcam_bibtex_editing (mailto:{mailto})'}
+        self.local_index: Optional[CrossrefLocalIndex] = None
+    
+    @retry_with_backoff(
+        max_retries=3,
+        initial_delay=2.0,
+        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
+    )
+    def query(self, bibliographic: str, rows: int = 1,
+              entry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Query Crossref by bibliographic information.
+        
+        Args:
+            bibliographic: Search query string
+            rows: Number of candidate works returned
+            entry: Input BibTeX entry of the query, needed to answer it from
+                the local index
+            
+        Returns:
+            API response dictionary
+            
+        Raises:
+            CrossrefAPIError: If request fails after retries
+        """
+        self.logger.debug(f'Crossref query: {bibliographic[:60]}...')
+        
+        if self.local_index is not None and entry is not None:
+            local = self.local_index.query(bibliographic, entry, rows)
+            if local is not None:
+                return local
+        
+        try:
+            response = self._get(
+                f'{self.base_url}/works',
+                params={'query.bibliographic': bibliographic, 'rows': rows, 'mailto': self.mailto},
+                headers=self.headers
+            ).json()
+            self.logger.debug(f'Crossref response status: {response.get("status", "unknown")}')
+            return response
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code == 429:
+                # The rate limiter pauses all requests to Crossref meanwhile
+                retry_after = _retry_after(e.response, default=5)
+                self.logger.warning(f'Rate limited by Crossref. Retrying in {retry_after:.1f}s...')
+                raise CrossrefAPIError(f"Rate limited (429)", status_code=429,
+                                       retry_after=retry_after) from e
+            elif status_code == 503:
+                raise CrossrefAPIError(f"Service unavailable (503)", status_code=503,
+                                       retry_after=_retry_after(e.response)) from e
+            else:
+                self.logger.warning(f'HTTP error from Crossref: {e}')
+                return {'status': 'bad', 'error': str(e), 'status_code': status_code}
+        except (ConnectionError, Timeout) as e:
+            self.logger.warning(f'Connection error to Crossref: {e}')
+            raise CrossrefAPIError(f"Connection failed: {e}") from e
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
+    )
+    def get_bibtex(self, doi: str) -> Tuple[Optional[str], Optional[str], str]:
+        """
+        Get BibTeX entry for a DOI using the Crossref transform endpoints.
+        
+        Args:
+            doi: DOI string
+            
+        Returns:
+            Tuple of (bibtex_str, json_str, status)
+        """
+        self.logger.debug(f'Fetching BibTeX for DOI: {doi}')
+        
+        if self.local_index is not None:
+            local = self.local_index.get_csl_json(doi)
+            if local is not None:
+                json_str, status = local
+                return bibtex_entry_to_str(csl_json_to_bibtex_entry(json_str)), json_str, status
+        
+        url = f'{self.base_url}/works/{urllib.parse.quote(doi)}/transform'
+        try:
+            bibtex_str = self._get(f'{url}/application/x-bibtex', headers=self.headers).text
+            json_str = self._get(f'{url}/application/vnd.citationstyles.csl+json',
+                                 headers=self.headers).text
+            return bibtex_str, json_str, 'ok'
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from Crossref content negotiation: {e}')
+            if status_code == 404:
+                return None, None, 'not_found'
+            elif status_code == 429:
+                raise CrossrefAPIError(f"Rate limited (429)", status_code=429,
+                                       retry_after=_retry_after(e.response)) from e
+            else:
+                return None, None, f'http_error_{status_code}'
+        except (ConnectionError, Timeout) as e:
+            self.logger.warning(f'Connection error to Crossref: {e}')
+            raise CrossrefAPIError(f"Connection failed: {e}") from e
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
+    )
+    def get_csl_json(self, doi: str) -> Tuple[Optional[str], str]:
+        """
+        Get the CSL JSON metadata of a DOI only (one request).
+        
+        Args:
+            doi: DOI string
+            
+        Returns:
+            Tuple of (json_str, status)
+        """
+        self.logger.debug(f'Fetching CSL JSON for DOI: {doi}')
+        
+        if self.local_index is not None:
+            local = self.local_index.get_csl_json(doi)
+            if local is not None:
+                return local
+        
+        url = f'{self.base_url}/works/{urllib.parse.quote(doi)}/transform'
+        try:
+            json_str = self._get(f'{url}/application/vnd.citationstyles.csl+json',
+                                 headers=self.headers).text
+            return json_str, 'ok'
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from Crossref content negotiation: {e}')
+            if status_code == 404:
+                return None, 'not_found'
+            elif status_code == 429:
+                raise CrossrefAPIError(f"Rate limited (429)", status_code=429,
+                                       retry_after=_retry_after(e.response)) from e
+            else:
+                return None, f'http_error_{status_code}'
+        except (ConnectionError, Timeout) as e:
+            self.logger.warning(f'Connection error to Crossref: {e}')
+            raise CrossrefAPIError(f"Connection failed: {e}") from e
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(CrossrefAPIError, ConnectionError, Timeout)
+    )
+    def get_works(self, dois: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Get the metadata of several DOIs with one ``filter=doi:...`` query.
+        
+        Args:
+            dois: List of DOI strings
+            
+        Returns:
+            Dictionary of Crossref work items keyed by canonical DOI (DOIs
+            unknown to Crossref are missing), or None if the request was rejected
+        """
+        self.logger.debug(f'Fetching {len(dois)} works from Crossref')
+        
+        local: Dict[str, Dict[str, Any]] = {}
+        if self.local_index is not None:
+            local = self.local_index.get_works(dois)
+            dois = [doi for doi in dois if canonical_doi(doi) not in local]
+            if not dois:
+                return local
+        
+        try:
+            response = self._get(
+                f'{self.base_url}/works',
+                params={'filter': ','.join(f'doi:{doi}' for doi in dois),
+                        'rows': len(dois), 'mailto': self.mailto},
+                headers=self.headers
+            ).json()
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from Crossref batch query: {e}')
+            if status_code == 429 or (status_code is not None and status_code >= 500):
+                raise CrossrefAPIError(f"Batch query failed ({status_code})", status_code=status_code,
+                                       retry_after=_retry_after(e.response)) from e
+            return None
+        except (ConnectionError, Timeout) as e:
+            self.logger.warning(f'Connection error to Crossref: {e}')
+            raise CrossrefAPIError(f"Connection failed: {e}") from e
+        
+        items = response.get('message', {}).get('items', [])
+        local.update((canonical_doi(item['DOI']), item) for item in items if item.get('DOI'))
+        return local
+    
+    @staticmethod
+    def extract_doi(response: Dict[str, Any]) -> Optional[str]:
+        """Extract DOI from Crossref query response."""
+        try:
+            return response['message']['items'][0]['DOI']
+        except (KeyError, IndexError):
+            return None
+
+
+# Fields of the best open access location kept from the Unpaywall records
+UNPAYWALL_FIELDS = ('url_for_pdf', 'url', 'url_for_landing_page', 'host_type', 'repository_institution')
+
+
+def slim_unpaywall_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Keep the fields of an Unpaywall response used to find the open access URL.
+    
+    Returns:
+        Flat dictionary of the ``doi``, ``is_oa`` and the
+        :data:`UNPAYWALL_FIELDS` of the best open access location (None
+        without location)
+    """
+    location = data.get('best_oa_location') or {}
+    record = {'doi': data.get('doi'), 'is_oa': bool(data.get('is_oa'))}
+    record.update((name, location.get(name)) for name in UNPAYWALL_FIELDS)
+    return record
+
+
+def as_unpaywall_record(query: Any) -> Optional[Dict[str, Any]]:
+    """
+    Return an Unpaywall result as a slim record.
+    
+    The results cached by older versions are DataFrames, or dictionaries of
+    columns, with one ``best_oa_location.<field>`` column per field.
+    """
+    if query is None:
+        return None
+    if isinstance(query, dict) and not isinstance(query.get('doi'), list):
+        return query
+    
+    def first(column: str) -> Any:
+        value = query.get(column)
+        try:
+            return value[0] if value is not None else None
+        except (IndexError, KeyError, TypeError):
+            return None
+    
+    record = {'doi': first('doi'), 'is_oa': bool(first('is_oa'))}
+    record.update((name, first(f'best_oa_location.{name}')) for name in UNPAYWALL_FIELDS)
+    return record
+
+
+class UnpaywallClient(APIClient):
+    """
+    Client for Unpaywall API interactions.
+    
+    Encapsulates all Unpaywall API calls with retry logic and error handling.
+    """
+    
+    def __init__(self, email: str, logger: Optional[logging.Logger] = None,
+                 rate_limiter: Optional[RateLimiter] = None, timeout: int = 30,
+                 pool_size: int = 10):
+        super().__init__(timeout=timeout, logger=logger, rate_limiter=rate_limiter,
+                         pool_size=pool_size)
+        self.email = email
+        self.base_url = "https://api.unpaywall.org"
+        self.snapshot: Optional[UnpaywallSnapshotIndex] = None
+    
+    @retry_with_backoff(
+        max_retries=3,
+        initial_delay=1.0,
+        exceptions=(UnpaywallAPIError, ConnectionError, Timeout)
+    )
+    def query_by_doi(self, doi: str) -> Tuple[Optional[Any], str, str]:
+        """
+        Query Unpaywall by DOI.
+        
+        Args:
+            doi: DOI string
+            
+        Returns:
+            Tuple of (record, message, status), the record being the slim
+            record of :func:`slim_unpaywall_record`
+        """
+        self.logger.debug(f'Querying Unpaywall for DOI: {doi}')
+        
+        if self.snapshot is not None:
+            local = self.snapshot.query_by_doi(doi)
+            if local is not None:
+                return local
+        
+        try:
+            data = self._get(f'{self.base_url}/v2/{doi}', params={'email': self.email}).json()
+            if data:
+                return slim_unpaywall_record(data), '{Unpaywall API returns results}', 'doi found'
+            else:
+                return None, '{Unpaywall API returns None}', 'doi not found'
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from Unpaywall: {status_code}')
+            if status_code == 404:
+                return None, '{DOI not found in Unpaywall}', 'doi_not_found'
+            elif status_code == 429:
+                raise UnpaywallAPIError(f"Rate limited (429)", status_code=429,
+                                        retry_after=_retry_after(e.response)) from e
+            else:
+                return None, f'{{Unpaywall API HTTP error {status_code}}}', f'http_error_{status_code}'
+        except (ConnectionError, Timeout) as e:
+            self.logger.warning(f'Connection error to Unpaywall: {e}')
+            raise UnpaywallAPIError(f"Connection failed: {e}") from e
+        except Exception as e:
+            self.logger.warning(f'Unexpected error from Unpaywall: {e}')
+            return None, f'{{Unpaywall API request failed}}: {str(e)[:100]}', 'doi_failed'
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(UnpaywallAPIError, ConnectionError, Timeout)
+    )
+    def query_by_title(self, title: str, is_oa: bool) -> Tuple[Optional[List[Dict[str, Any]]], str, str]:
+        """
+        Search Unpaywall by title.
+        
+        Args:
+            title: Publication title
+            is_oa: Filter for open access only
+            
+        Returns:
+            Tuple of (records, message, status), with one slim record per result
+        """
+        try:
+            data = self._get(f'{self.base_url}/v2/search', params={
+                'query': title, 'is_oa': str(is_oa).lower(), 'email': self.email
+            }).json()
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code == 429:
+                raise UnpaywallAPIError(f"Rate limited (429)", status_code=429,
+                                        retry_after=_retry_after(e.response)) from e
+            return None, f'[warning]: Unpaywall title search HTTP error {status_code}: {e}', f'http_error_{status_code}'
+        except (ConnectionError, Timeout) as e:
+            raise UnpaywallAPIError(f"Connection failed: {e}") from e
+        
+        records = [slim_unpaywall_record(r['response']) for r in data.get('results') or [] if r.get('response')]
+        if records:
+            return records, f'{{Unpaywall title search returns results with is_oa={is_oa}}}', 'query ok'
+        return None, f'{{Unpaywall title search returns None with is_oa={is_oa}}}', 'query none'
+    
+    def extract_oai_url(self, query_result: Optional[Any]) -> Tuple[str, str]:
+        """
+        Extract OAI URL from Unpaywall query result.
+        
+        Args:
+            query_result: Unpaywall record
+            
+        Returns:
+            Tuple of (oai_url, status)
+        """
+        oai_url = 'oai url not found'
+        status = 'oai url not found'
+        
+        query_result = as_unpaywall_record(query_result)
+        if query_result is None:
+            return oai_url, status
+        
+        # Try different URL fields in order of preference
+        url_fields = ['url_for_pdf', 'url', 'url_for_landing_page']
+        
+        for field in url_fields:
+            value = query_result.get(field)
+            if value is not None:
+                oai_url = urllib.parse.unquote(value, errors='replace')
+                status = 'oai url found'
+                self.logger.debug(f'Found OAI URL: {oai_url[:80]}...')
+                break
+        
+        return oai_url, status
+    
+    def get_repository_info(self, query_result: Optional[Any]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Get repository type and institution from query result.
+        
+        Returns:
+            Tuple of (host_type, repository_institution)
+        """
+        query_result = as_unpaywall_record(query_result)
+        if query_result is None:
+            return None, None
+        return query_result.get('host_type'), query_result.get('repository_institution')
+
+
+class DOIOrgClient(APIClient):
+    """
+    Client for doi.org content negotiation.
+    
+    Fetches BibTeX and JSON metadata directly from doi.org using
+    content negotiation headers.
+    """
+    
+    def __init__(self, timeout: int = 30, logger: Optional[logging.Logger] = None,
+                 rate_limiter: Optional[RateLimiter] = None, pool_size: int = 10):
+        super().__init__(timeout=timeout, logger=logger, rate_limiter=rate_limiter,
+                         pool_size=pool_size)
+        self.base_url = "https://doi.org"
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(ConnectionError, Timeout)
+    )
+    def get_bibtex(self, doi: str) -> Tuple[Optional[str], Optional[str], str]:
+        """
+        Get BibTeX entry for a DOI from doi.org.
+        
+        Args:
             doi: DOI string
             
         Returns:
             Tuple of (bibtex_str, json_str, status)
         """
-        self.logger.debug(f'Fetching from doi.org: {doi}')
+        self.logger.debug(f'Fetching from doi.org: {doi}')
+        
+        try:
+            # Both requests reuse the same pooled connection
+            bibtex_str = self._get(
+                f"{self.base_url}/{doi}",
+                headers={"Accept": "application/x-bibtex"}
+            ).content.decode('utf-8')
+            
+            json_str = self._get(
+                f"{self.base_url}/{doi}",
+                headers={"Accept": "application/vnd.citationstyles.csl+json"}
+            ).content.decode('utf-8')
+            
+            self.logger.debug(f'Successfully fetched from doi.org: {doi}')
+            return bibtex_str, json_str, 'ok'
+            
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from doi.org: {status_code} {e}')
+            if status_code == 404:
+                return None, None, 'not_found'
+            elif status_code == 429:
+                raise ConnectionError(f"Rate limited by doi.org (429)") from e
+            else:
+                return None, None, f'http_error_{status_code}'
+        except ConnectionError as e:
+            self.logger.warning(f'Connection error from doi.org: {e}')
+            raise
+        except Timeout as e:
+            self.logger.warning(f'Timeout error from doi.org')
+            raise
+    
+    @retry_with_backoff(
+        max_retries=2,
+        initial_delay=1.0,
+        exceptions=(ConnectionError, Timeout)
+    )
+    def get_csl_json(self, doi: str) -> Tuple[Optional[str], str]:
+        """
+        Get the CSL JSON metadata of a DOI only (one request).
+        
+        Args:
+            doi: DOI string
+            
+        Returns:
+            Tuple of (json_str, status)
+        """
+        self.logger.debug(f'Fetching CSL JSON from doi.org: {doi}')
+        
+        try:
+            json_str = self._get(
+                f"{self.base_url}/{doi}",
+                headers={"Accept": "application/vnd.citationstyles.csl+json"}
+            ).content.decode('utf-8')
+            return json_str, 'ok'
+        except HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            self.logger.warning(f'HTTP error from doi.org: {status_code} {e}')
+            if status_code == 404:
+                return None, 'not_found'
+            elif status_code == 429:
+                raise ConnectionError(f"Rate limited by doi.org (429)") from e
+            else:
+                return None, f'http_error_{status_code}'
+
+
+# =============================================================================
+# Offline Unpaywall Snapshot
+# =============================================================================
+import gzip
+import mmap
+import tempfile
+
+
+class UnpaywallSnapshotIndex:
+    """
+    Memory-mapped DOI index built from the Unpaywall data snapshot.
+    
+    Only the ``best_oa_location`` fields read by unpaywall_get_oai_url and
+    get_repository_info are kept. The index file is laid out as::
+    
+        header   magic, number of records, offset of the index section
+        data     one compact JSON array per DOI
+        index    (doi hash, offset, length) records sorted by hash
+    
+    A lookup is a binary search in the memory-mapped index section.
+    """
+    
+    MAGIC = b'JTCUPW01'
+    _HEADER = struct.Struct('>8sQQ')
+    _RECORD = struct.Struct('>QQI')
+    # Fields of best_oa_location stored in the index, in this order
+    FIELDS = UNPAYWALL_FIELDS
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._index_offset = self._HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not an Unpaywall snapshot index')
+    
+    @staticmethod
+    def _hash(doi: str) -> int:
+        return int.from_bytes(hashlib.blake2b(doi.encode('utf-8'), digest_size=8).digest(), 'big')
+    
+    @classmethod
+    def build(cls, snapshot_path: str, index_path: str, logger: logging.Logger) -> int:
+        """
+        Build an index from a gzip JSONL Unpaywall snapshot.
+        
+        The (hash, offset, length) records are first spread over 256 bucket
+        files by hash prefix, so that only one bucket is held in memory when
+        sorting.
+        
+        Returns:
+            Number of indexed DOIs
+        """
+        count = 0
+        with open(index_path, 'wb') as out, tempfile.TemporaryDirectory() as tmp_dir:
+            buckets = [open(os.path.join(tmp_dir, f'{i:02x}'), 'wb') for i in range(256)]
+            try:
+                out.write(cls._HEADER.pack(cls.MAGIC, 0, 0))
+                offset = out.tell()
+                with gzip.open(snapshot_path, 'rt', encoding='utf-8') as snapshot:
+                    for line in snapshot:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if not record.get('doi'):
+                            continue
+                        doi = canonical_doi(record['doi'])
+                        location = record.get('best_oa_location') or None
+                        row = [doi]
+                        if location is not None:
+                            row.extend(location.get(f) for f in cls.FIELDS)
+                        data = json.dumps(row, separators=(',', ':')).encode('utf-8')
+                        out.write(data)
+                        h = cls._hash(doi)
+                        buckets[h >> 56].write(cls._RECORD.pack(h, offset, len(data)))
+                        offset += len(data)
+                        count += 1
+                        if count % 1000000 == 0:
+                            logger.info(f'unpaywall snapshot: {count} records read')
+                
+                index_offset = offset
+                for bucket in buckets:
+                    bucket.close()
+                for i in range(256):
+                    with open(os.path.join(tmp_dir, f'{i:02x}'), 'rb') as bucket:
+                        raw = bucket.read()
+                    entries = sorted(cls._RECORD.iter_unpack(raw))
+                    out.write(b''.join(cls._RECORD.pack(*e) for e in entries))
+                
+                out.seek(0)
+                out.write(cls._HEADER.pack(cls.MAGIC, count, index_offset))
+            finally:
+                for bucket in buckets:
+                    bucket.close()
+        
+        logger.info(f'unpaywall snapshot: {count} records indexed in {index_path}')
+        return count
+    
+    def lookup(self, doi: str) -> Optional[List[Any]]:
+        """
+        Return the stored row ``[doi, *FIELDS]`` of a DOI, or None if absent.
+        
+        The row is ``[doi]`` alone for a DOI without open access location.
+        """
+        doi = canonical_doi(doi)
+        h = self._hash(doi)
+        size = self._RECORD.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (mid_hash,) = struct.unpack_from('>Q', self._map, self._index_offset + mid * size)
+            if mid_hash < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        # Several DOIs may share a hash
+        while lo < self.count:
+            entry_hash, offset, length = self._RECORD.unpack_from(self._map, self._index_offset + lo * size)
+            if entry_hash != h:
+                break
+            row = json.loads(self._map[offset:offset + length])
+            if row[0] == doi:
+                return row
+            lo += 1
+        return None
+    
+    def query_by_doi(self, doi: str) -> Optional[Tuple[Any, str, str]]:
+        """
+        Resolve a DOI locally, in the format of UnpaywallClient.query_by_doi.
+        
+        Returns:
+            Tuple of (record, message, status), or None if the DOI is not in
+            the snapshot
+        """
+        row = self.lookup(doi)
+        if row is None:
+            return None
+        # Rows without location are stored as [doi]
+        record = {'doi': row[0], 'is_oa': len(row) > 1}
+        record.update(zip(self.FIELDS, row[1:] or [None] * len(self.FIELDS)))
+        return record, '{Unpaywall snapshot returns results}', 'doi found'
+    
+    def close(self) -> None:
+        """Release the memory map."""
+        self._map.close()
+        self._file.close()
+
+
+def import_unpaywall_snapshot(config: Config, logger: logging.Logger) -> None:
+    """Build the index of the snapshot given by --import-unpaywall-snapshot."""
+    index_path = config.unpaywall_snapshot_path or f'{config.import_unpaywall_snapshot}.index'
+    timer = Timer(name='import_unpaywall_snapshot')
+    timer.start()
+    UnpaywallSnapshotIndex.build(config.import_unpaywall_snapshot, index_path, logger)
+    timer.stop()
+    print(f'use --unpaywall-source=snapshot:{index_path} to resolve dois with this index')
+
+
+# =============================================================================
+# Local Crossref Index
+# =============================================================================
+import glob
+import re
+
+
+class CrossrefLocalIndex:
+    """
+    On-disk index of the Crossref public data file.
+    
+    Works are stored in an SQLite database keyed by canonical DOI, with the
+    fields read by csl_json_to_bibtex_entry only (zlib-compressed JSON). A
+    full-text index over title, authors and year answers the bibliographic
+    searches issued by bibtex_entries_to_crossref_dois. A search answers
+    only with works whose title matches the title of the searched entry
+    (``ok+`` or ``ok-``) and whose year and first author agree with it;
+    otherwise the Crossref API is used.
+    """
+    
+    # Fields of the Crossref work items kept in the index
+    FIELDS = ('DOI', 'type', 'title', 'container-title', 'author', 'issued',
+              'published-print', 'published-online', 'volume', 'issue', 'page',
+              'publisher', 'URL', 'ISSN')
+    
+    _TOKEN = re.compile(r'\w{2,}')
+    # Value of the 'source' key of the search responses built from the index
+    SOURCE = 'crossref-local-index'
+    # Candidates read from the full-text index for each search
+    _CANDIDATES = 20
+    
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise OSError(f'{path} does not exist')
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection of the calling thread (the index is read concurrently)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    @classmethod
+    def _iter_dump(cls, dump_path: str):
+        """Yield the work items of the files of a Crossref public data file."""
+        if os.path.isdir(dump_path):
+            files = sorted(glob.glob(os.path.join(dump_path, '**', '*.json*'), recursive=True))
+        else:
+            files = [dump_path]
+        for filename in files:
+            opener = gzip.open if filename.endswith('.gz') else open
+            with opener(filename, 'rt', encoding='utf-8') as f:
+                if '.jsonl' in filename:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+                else:
+                    yield from json.load(f).get('items', [])
+    
+    @classmethod
+    def _search_text(cls, item: Dict[str, Any]) -> Tuple[str, str, str]:
+        """Return the (title, authors, year) indexed for the search of a work."""
+        title = ' '.join(item.get('title') or []) + ' ' + ' '.join(item.get('container-title') or [])
+        authors = ' '.join(
+            f'{a.get("given", "")} {a.get("family", a.get("name", ""))}' for a in item.get('author') or []
+        )
+        date_parts = _csl_date_parts(item)
+        year = str(date_parts[0]) if date_parts else ''
+        return title, authors, year
+    
+    @classmethod
+    def build(cls, dump_path: str, index_path: str, logger: logging.Logger) -> int:
+        """
+        Build an index from a Crossref public data file (directory of
+        ``.json.gz`` files with an ``items`` list, or ``.jsonl.gz`` files).
+        
+        Returns:
+            Number of indexed works
+        """
+        conn = sqlite3.connect(index_path)
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('CREATE TABLE IF NOT EXISTS works (id INTEGER PRIMARY KEY, doi TEXT UNIQUE, data BLOB)')
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS works_search USING fts5("
+            "title, author, year, content='', tokenize='unicode61 remove_diacritics 2')"
+        )
+        
+        count = 0
+        rows = []
+        
+        def flush() -> None:
+            for doi, data, search in rows:
+                # A DOI listed twice in the dump keeps its first work item
+                cursor = conn.execute('INSERT OR IGNORE INTO works (doi, data) VALUES (?, ?)', (doi, data))
+                if cursor.rowcount:
+                    conn.execute('INSERT INTO works_search (rowid, title, author, year) VALUES (?, ?, ?, ?)',
+                                 (cursor.lastrowid,) + search)
+            conn.commit()
+            rows.clear()
+        
+        for item in cls._iter_dump(dump_path):
+            if not item.get('DOI'):
+                continue
+            slim = {k: item[k] for k in cls.FIELDS if k in item}
+            data = zlib.compress(json.dumps(slim, separators=(',', ':')).encode('utf-8'))
+            rows.append((canonical_doi(item['DOI']), data, cls._search_text(item)))
+            count += 1
+            if len(rows) >= 10000:
+                flush()
+                if count % 1000000 == 0:
+                    logger.info(f'crossref dump: {count} works read')
+        flush()
+        conn.execute("INSERT INTO works_search (works_search) VALUES ('optimize')")
+        conn.commit()
+        conn.close()
+        
+        logger.info(f'crossref dump: {count} works indexed in {index_path}')
+        return count
+    
+    def get_work(self, doi: str) -> Optional[Dict[str, Any]]:
+        """Return the work item of a DOI, or None if it is not indexed."""
+        row = self.conn.execute('SELECT data FROM works WHERE doi = ?', (canonical_doi(doi),)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+    
+    def get_csl_json(self, doi: str) -> Optional[Tuple[str, str]]:
+        """Return (json_str, 'ok') as CrossrefClient.get_csl_json, or None if not indexed."""
+        work = self.get_work(doi)
+        if work is None:
+            return None
+        return json.dumps(work), 'ok'
+    
+    def get_works(self, dois: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the indexed work items of several DOIs, keyed by canonical DOI."""
+        works = {}
+        for doi in dois:
+            work = self.get_work(doi)
+            if work is not None:
+                works[canonical_doi(doi)] = work
+        return works
+    
+    @staticmethod
+    def matches_entry(item: Dict[str, Any], entry: Dict[str, Any]) -> bool:
+        """Whether a work item has the title, year and first author of an input entry."""
+        if check_titles(entry.get('title', ''), _csl_text(item.get('title'))).label not in ('ok+', 'ok-'):
+            return False
+        parts = _csl_date_parts(item)
+        if not parts or str(parts[0]) != _entry_year(entry):
+            return False
+        authors = item.get('author') or [{}]
+        family = authors[0].get('family') or authors[0].get('name') or ''
+        author_key = _first_author_key(entry.get('author', ''))
+        return bool(author_key) and normalize_title(family).replace(' ', '') == author_key
+    
+    def query(self, bibliographic: str, entry: Dict[str, Any], rows: int = 1) -> Optional[Dict[str, Any]]:
+        """
+        Search the works matching a bibliographic string.
+        
+        Args:
+            bibliographic: Search query string
+            entry: Input BibTeX entry the query was built from
+            rows: Number of candidate works returned
+            
+        Returns:
+            Response in the format of the Crossref ``/works`` API, with
+            ``source`` set to :attr:`SOURCE`, or None if no indexed work
+            matches the entry
+        """
+        tokens = list(dict.fromkeys(t.lower() for t in self._TOKEN.findall(bibliographic)))[:32]
+        if not tokens:
+            return None
+        match = ' OR '.join('"' + t.replace('"', '""') + '"' for t in tokens)
+        results = self.conn.execute(
+            'SELECT works.data, bm25(works_search) AS rank FROM works_search '
+            'JOIN works ON works.id = works_search.rowid '
+            'WHERE works_search MATCH ? ORDER BY rank LIMIT ?',
+            (match, max(rows, self._CANDIDATES))
+        ).fetchall()
+        
+        # Any shared word is a full-text hit, only the works of the entry are trusted
+        items = []
+        for data, rank in results:
+            item = json.loads(zlib.decompress(data))
+            if self.matches_entry(item, entry):
+                item['score'] = -rank
+                items.append(item)
+                if len(items) == rows:
+                    break
+        if not items:
+            return None
+        return {'status': 'ok', 'message-type': 'work-list', 'message': {'items': items},
+                'source': self.SOURCE}
+    
+    def close(self) -> None:
+        """Close the connections of all threads."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+def import_crossref_dump(config: Config, logger: logging.Logger) -> None:
+    """Build the index of the dump given by --import-crossref-dump."""
+    index_path = config.crossref_local_path or f'{config.import_crossref_dump.rstrip(os.sep)}.sqlite'
+    timer = Timer(name='import_crossref_dump')
+    timer.start()
+    CrossrefLocalIndex.build(config.import_crossref_dump, index_path, logger)
+    timer.stop()
+    print(f'use --crossref-source=local:{index_path} to resolve dois with this index')
+
+
+# =============================================================================
+# Character Translation
+# =============================================================================
+
+# Problematic characters of the output and their replacements
+DEFAULT_CHARACTER_TABLE = [
+    ('$\\mathsemicolon$', ';'),
+    ('{\\&}amp;', '\\&'),
+    ('&amp;', '\\&'),
+    ('À', '{\\`A}'),
+    ('\\i', 'i'),
+    ('–', '-'),
+]
+
+_ENDS_WITH_CONTROL_WORD = re.compile(r'\\[a-zA-Z]+$')
+
+
+class CharacterTranslator:
+    """
+    Replace many substrings of a text in a single pass.
+    
+    The table is compiled into one alternation regex trying the longest
+    substrings first. A substring ending with a LaTeX control word only
+    matches when no letter follows, so ``\\i`` leaves ``\\item`` intact.
+    """
+    
+    def __init__(self, table: Iterable[Tuple[str, str]]):
+        self.table: Dict[str, str] = {}
+        for old, new in table:
+            if old:
+                self.table[old] = new
+        alternatives = []
+        for old in sorted(self.table, key=len, reverse=True):
+            pattern = re.escape(old)
+            if _ENDS_WITH_CONTROL_WORD.search(old):
+                pattern += '(?![a-zA-Z])'
+            alternatives.append(pattern)
+        self._pattern = re.compile('|'.join(alternatives)) if alternatives else None
+    
+    @classmethod
+    def from_file(cls, filepath: str) -> CharacterTranslator:
+        """
+        Load a table of replacements.
+        
+        Each line holds a substring and its replacement separated by a tab;
+        empty lines and lines starting with ``#`` are ignored.
+        
+        Raises:
+            BibtexProcessingError: If a line has no tab
+        """
+        table = []
+        with open(filepath, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                old, sep, new = line.partition('\t')
+                if not sep:
+                    raise BibtexProcessingError(
+                        f'{filepath}:{line_number}: expected <text><tab><replacement>'
+                    )
+                table.append((old, new))
+        return cls(table)
+    
+    def translate(self, text: str, found: Optional[Set[str]] = None) -> str:
+        """
+        Replace the substrings of the table in ``text``.
+        
+        Args:
+            text: Text to translate
+            found: Optional set receiving the replaced substrings
+        """
+        if self._pattern is None:
+            return text
+        
+        def replace(match: re.Match) -> str:
+            if found is not None:
+                found.add(match.group(0))
+            return self.table[match.group(0)]
+        
+        return self._pattern.sub(replace, text)
+    
+    def translate_entry(self, entry: Dict[str, Any], found: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Translate the fields of a BibTeX entry, except its type and key."""
+        return {
+            key: self.translate(value, found) if isinstance(value, str) and key not in ('ENTRYTYPE', 'ID') else value
+            for key, value in entry.items()
+        }
+    
+    def report(self, found: Set[str]) -> None:
+        """Print the replaced substrings, in the order of the table."""
+        for old, new in self.table.items():
+            if old in found:
+                print(f'Match Found. replace {old} by {new}')
+
+
+# =============================================================================
+# Local Fuzzy Matching
+# =============================================================================
+import unicodedata
+
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+\s*|\\.')
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_title(title: str) -> str:
+    """Lower-case a title and strip accents, LaTeX commands, braces and punctuation."""
+    title = _LATEX_COMMAND.sub('', title).replace('{', '').replace('}', '')
+    title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', title.lower()).strip()
+
+
+def title_trigrams(title: str) -> Set[str]:
+    """Character trigrams of a normalized title, with padded word boundaries."""
+    padded = f' {title} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _first_author_key(author: str) -> str:
+    """Normalized family name of the first author of a BibTeX author field."""
+    first = author.split(' and ')[0].strip()
+    family = first.split(',')[0] if ',' in first else (first.split() or [''])[-1]
+    return normalize_title(family).replace(' ', '')
+
+
+def _entry_year(entry: Dict[str, Any]) -> str:
+    return (entry.get('year') or entry.get('date') or '')[:4]
+
+
+def csl_match_key(json_str: str) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Return the (DOI, normalized title, year, first author key) of a CSL
+    JSON record, or None when one of them is missing.
+    """
+    try:
+        item = json.loads(json_str)
+        author = item.get('author') or [{}]
+        parts = _csl_date_parts(item)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    family = author[0].get('family') or author[0].get('name') or ''
+    key = (
+        item.get('DOI', ''), normalize_title(_csl_text(item.get('title'))),
+        str(parts[0]) if parts else '', normalize_title(family).replace(' ', '')
+    )
+    return key if all(key) else None
+
+
+# XOR masks turning one 32-bit hash of a trigram into independent MinHash permutations
+_MINHASH_MASKS = [
+    int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=4).digest(), 'big') for i in range(8)
+]
+_TITLE_NUMBER = re.compile(r'\d|^[ivxlc]+$')
+
+
+def _title_numbers(title: str) -> Set[str]:
+    """Numbers and roman numerals of a normalized title ("Part I" and "Part II" differ)."""
+    return {word for word in title.split() if _TITLE_NUMBER.search(word)}
+
+
+def near_duplicate_clusters(
+    entries: Dict[str, Dict[str, Any]],
+    threshold: float = 0.9,
+    bands: int = 4,
+    rows: int = 2
+) -> Dict[str, str]:
+    """
+    Cluster the near-duplicate input entries with MinHash locality-sensitive hashing.
+    
+    The MinHash signature of the title trigrams is cut in ``bands`` bands of
+    ``rows`` values; entries sharing a band, a first author and a year are
+    compared, and joined when their title similarity reaches ``threshold``
+    and their titles hold the same numbers and roman numerals (so "Part I"
+    and "Part II" stay apart). Each entry is compared with one entry per bucket, so the cost is
+    linear in the number of entries.
+    
+    Args:
+        entries: Input BibTeX entries by key
+        threshold: Minimum Jaccard similarity of the title trigrams
+        bands: Number of LSH bands
+        rows: Number of MinHash values per band
+        
+    Returns:
+        Dictionary mapping each duplicate key to the first key of its cluster
+    """
+    masks = _MINHASH_MASKS[:bands * rows]
+    order = {key: i for i, key in enumerate(entries)}
+    parent = {key: key for key in entries}
+    features: Dict[str, Tuple[Tuple[str, str], Set[str], Set[str]]] = {}
+    buckets: Dict[Tuple[Any, ...], str] = {}
+    
+    def find(key: str) -> str:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+    
+    for key, entry in entries.items():
+        title = normalize_title(entry.get('title', ''))
+        if not title:
+            continue
+        block = (_first_author_key(entry.get('author', '')), _entry_year(entry))
+        trigrams = title_trigrams(title)
+        numbers = _title_numbers(title)
+        features[key] = (block, trigrams, numbers)
+        
+        hashes = [zlib.crc32(trigram.encode()) for trigram in trigrams]
+        signature = [min(map(mask.__xor__, hashes)) for mask in masks]
+        for band in range(bands):
+            bucket = (block, band, tuple(signature[band * rows:(band + 1) * rows]))
+            other = buckets.setdefault(bucket, key)
+            if other == key or find(other) == find(key):
+                continue
+            _, other_trigrams, other_numbers = features[other]
+            if numbers == other_numbers and _jaccard(trigrams, other_trigrams) >= threshold:
+                # The first entry of the input file represents the cluster
+                root, other_root = sorted((find(key), find(other)), key=order.get)
+                parent[other_root] = root
+    
+    return {key: find(key) for key in entries if find(key) != key}
+
+
+class FuzzyMatchIndex:
+    """
+    In-process index of the Crossref records held in the metadata cache.
+    
+    Records are blocked by (first author family name, year) and compared to
+    an input entry with the Jaccard similarity of their title trigrams, so a
+    reference already resolved in an earlier run is found without a Crossref
+    search. Only records whose title holds the same numbers and roman
+    numerals as the entry are compared.
+    """
+    
+    def __init__(self):
+        self._blocks: Dict[Tuple[str, str], List[Tuple[str, Set[str], Set[str]]]] = {}
+        self.size = 0
+    
+    def add(self, doi: str, title: str, year: str, author_key: str) -> None:
+        """Index a work by its DOI, title, year and first author key."""
+        title = normalize_title(title)
+        if not (doi and title and year and author_key):
+            return
+        self._blocks.setdefault((author_key, year), []).append(
+            (doi, title_trigrams(title), _title_numbers(title))
+        )
+        self.size += 1
+    
+    def add_csl_json(self, json_str: str) -> None:
+        """Index a work from its CSL JSON."""
+        match_key = csl_match_key(json_str)
+        if match_key is not None:
+            self.add(*match_key)
+    
+    @classmethod
+    def from_metadata_cache(
+        cls,
+        metadata_cache: MetadataCache,
+        logger: logging.Logger,
+        entries: Iterable[Dict[str, Any]]
+    ) -> FuzzyMatchIndex:
+        """
+        Build the index from the Crossref records of the metadata cache
+        sharing the first author and year of one of ``entries``.
+        """
+        timer = Timer(name='local_match_index')
+        timer.start()
+        index = cls()
+        blocks = {(_first_author_key(entry.get('author', '')), _entry_year(entry)) for entry in entries}
+        for match_key in metadata_cache.match_keys(block for block in blocks if all(block)):
+            index.add(*match_key)
+        timer.stop()
+        logger.info(f'    {index.size} cached crossref records in the local match index')
+        return index
+    
+    def match(self, entry: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+        """
+        Find the best indexed work for an input BibTeX entry.
         
-        try:
-            # Fetch BibTeX
-            req = urllib.request.Request(
-                url=f"{self.base_url}/{doi}",
-                headers={"Accept": "application/x-bibtex"}
-            )
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                bibtex_str = response.read().decode('utf-8')
-            
-            # Fetch JSON
-            req = urllib.request.Request(
-                url=f"{self.base_url}/{doi}",
-                headers={"Accept": "application/vnd.citationstyles.csl+json"}
-            )
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                json_str = response.read().decode('utf-8')
-            
-            self.logger.debug(f'Successfully fetched from doi.org: {doi}')
-            return bibtex_str, json_str, 'ok'
-            
-        except urllib.error.HTTPError as e:
-            self.logger.warning(f'HTTP error from doi.org: {e.code} {e.reason}')
-            if e.code == 404:
-                return None, None, 'not_found'
-            elif e.code == 429:
-                raise ConnectionError(f"Rate limited by doi.org (429)") from e
-            else:
-                return None, None, f'http_error_{e.code}'
-        except urllib.error.URLError as e:
-            self.logger.warning(f'URL error from doi.org: {e.reason}')
-            raise ConnectionError(f"Failed to connect to doi.org: {e.reason}") from e
-        except TimeoutError as e:
-            self.logger.warning(f'Timeout error from doi.org')
-            raise Timeout("Request to doi.org timed out") from e
+        Returns:
+            Tuple of (doi, similarity), or None when no work shares the
+            first author, year and title numbers of the entry
+        """
+        block = self._blocks.get((_first_author_key(entry.get('author', '')), _entry_year(entry)))
+        title = normalize_title(entry.get('title', ''))
+        if not block or not title:
+            return None
+        trigrams = title_trigrams(title)
+        numbers = _title_numbers(title)
+        best: Optional[Tuple[str, float]] = None
+        for doi, other, other_numbers in block:
+            if other_numbers != numbers:
+                continue
+            score = len(trigrams & other) / len(trigrams | other)
+            if best is None or score > best[1]:
+                best = (doi, score)
+        return best
+    
+    @staticmethod
+    def as_query_result(doi: str, score: float) -> Dict[str, Any]:
+        """Format a local match like a Crossref search result."""
+        return {'status': 'ok', 'message': {'items': [{'DOI': doi, 'score': score}]}}
+
 
+# =============================================================================
+# Request Engine
+# =============================================================================
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-def _doi_org_fetch_worker(doi: str) -> Tuple[Optional[str], Optional[str], str]:
-    """Worker function for parallel doi.org fetch (creates client inside worker)."""
-    client = DOIOrgClient(timeout=30)
-    return client.get_bibtex(doi)
+CROSSREF_MAILTO = os.environ.get('CROSSREF_MAILTO', 'jtcam@episciences.org')
+UNPAYWALL_EMAIL = 'vincent.acary@inria.fr'
 
 
-def _unpaywall_doi_worker(doi: str) -> Tuple[Optional[Any], str, str]:
-    """Worker function for parallel Unpaywall queries (creates client inside worker)."""
-    client = UnpaywallClient('vincent.acary@inria.fr')
-    return client.query_by_doi(doi)
+class RequestEngine:
+    """
+    Run API requests concurrently from a single asyncio event loop.
+    
+    The Crossref, doi.org and Unpaywall clients are created once and shared
+    by all the requests of a run. The client calls are blocking, so they are
+    dispatched to a thread pool and the number of in-flight requests is
+    bounded by a semaphore.
+    """
+    
+    def __init__(self, concurrency: int = 16, logger: Optional[logging.Logger] = None,
+                 timeout: int = 30):
+        self.concurrency = max(1, concurrency)
+        self.logger = logger or logging.getLogger('jtcam_bibtex')
+        self.rate_limiter = RateLimiter(self.logger)
+        # The connection pools are sized for the configured concurrency
+        self.crossref = CrossrefClient(CROSSREF_MAILTO, logger=self.logger,
+                                       rate_limiter=self.rate_limiter, timeout=timeout,
+                                       pool_size=self.concurrency)
+        self.doi_org = DOIOrgClient(timeout=timeout, logger=self.logger,
+                                    rate_limiter=self.rate_limiter,
+                                    pool_size=self.concurrency)
+        self.unpaywall = UnpaywallClient(UNPAYWALL_EMAIL, logger=self.logger,
+                                         rate_limiter=self.rate_limiter, timeout=timeout,
+                                         pool_size=self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix='jtcam-request'
+        )
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # Profiler of the calls run by the worker threads (--profile)
+        self.profiler: Optional[StepProfiler] = None
+    
+    @classmethod
+    def from_config(cls, config: Config, logger: logging.Logger) -> RequestEngine:
+        """Create an engine with the concurrency and data sources configured in ``config``."""
+        engine = cls(config.number_of_parallel_request, logger, timeout=config.request_timeout)
+        engine.crossref.base_url = config.crossref_url
+        engine.doi_org.base_url = config.doi_org_url
+        engine.unpaywall.base_url = config.unpaywall_url
+        if config.unpaywall_snapshot_path:
+            try:
+                engine.unpaywall.snapshot = UnpaywallSnapshotIndex(config.unpaywall_snapshot_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f'Cannot open unpaywall snapshot {config.unpaywall_snapshot_path}: {e}')
+        if config.crossref_local_path:
+            try:
+                engine.crossref.local_index = CrossrefLocalIndex(config.crossref_local_path)
+            except OSError as e:
+                logger.warning(f'Cannot open crossref index {config.crossref_local_path}: {e}')
+        return engine
+    
+    async def call(self, func, *args) -> Any:
+        """Run a blocking client call in the thread pool."""
+        name = getattr(getattr(func, 'func', func), '__qualname__', 'call')
+        if self.profiler is not None:
+            func = self.profiler.wrap(func)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                return await self._loop.run_in_executor(
+                    self._executor, functools.partial(func, *args)
+                )
+            finally:
+                METRICS.observe('call_seconds', time.perf_counter() - start, {'call': name})
+    
+    async def map_async(self, func, items: List[Any], on_result=None) -> List[Any]:
+        """
+        Apply ``func`` to all items concurrently.
+        
+        Args:
+            func: Blocking function taking one item
+            items: Arguments of the calls
+            on_result: Optional callback ``on_result(index, result)`` invoked
+                in the event loop as soon as each result arrives
+            
+        Returns:
+            List of results, in the order of ``items``
+            
+        The first exception raised by a call cancels the pending calls and
+        is propagated.
+        """
+        results: List[Any] = [None] * len(items)
+        
+        async def run_one(index: int, item: Any) -> None:
+            results[index] = await self.call(func, item)
+            if on_result is not None:
+                on_result(index, results[index])
+        
+        tasks = [asyncio.ensure_future(run_one(i, item)) for i, item in enumerate(items)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return results
+    
+    def map(self, func, items: List[Any], on_result=None) -> List[Any]:
+        """Synchronous wrapper of :meth:`map_async`."""
+        return self.run(self.map_async(func, list(items), on_result))
+    
+    def run(self, coroutine) -> Any:
+        """Run a coroutine to completion in the engine event loop."""
+        return self._loop.run_until_complete(coroutine)
+    
+    def close(self) -> None:
+        """Stop the thread pool and close the event loop."""
+        self.rate_limiter.log_rates()
+        # Tasks left by an interrupted run are cancelled before closing the loop
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for client in (self.crossref, self.doi_org, self.unpaywall):
+            client.close()
+        if self.unpaywall.snapshot is not None:
+            self.unpaywall.snapshot.close()
+        if self.crossref.local_index is not None:
+            self.crossref.local_index.close()
+        self._loop.close()
+
+
+@contextlib.contextmanager
+def _engine_for(engine: Optional[RequestEngine], config: Config, logger: logging.Logger):
+    """Yield ``engine``, or a temporary engine closed on exit if it is None."""
+    if engine is not None:
+        yield engine
+        return
+    engine = RequestEngine.from_config(config, logger)
+    try:
+        yield engine
+    finally:
+        engine.close()
 
 
 def crossref_get_doi_from_query_results(x: Dict[str, Any]) -> Optional[str]:
@@ -766,7 +3121,10 @@ def crossref_get_doi_from_query_results(x: Dict[str, Any]) -> Optional[str]:
 def bibtex_entries_to_crossref_dois(
     store: Dict[str, EntryStore],
     config: Config,
-    logger: logging.Logger
+    logger: logging.Logger,
+    metadata_cache: Optional[MetadataCache] = None,
+    engine: Optional[RequestEngine] = None,
+    journal: Optional[CacheJournal] = None
 ) -> None:
     """
     Search for DOIs for all BibTeX entries using Crossref.
@@ -775,6 +3133,9 @@ def bibtex_entries_to_crossref_dois(
         store: Dictionary of EntryStore instances
         config: Configuration options
         logger: logging.Logger instance
+        metadata_cache: Optional shared cache consulted before querying Crossref
+        engine: Optional RequestEngine shared by all stages
+        journal: Optional journal of the entries, written as each result arrives
     """
     logger.info('Crossref doi search from bibtex input entry')
     bibliographic: Dict[str, Tuple[Dict[str, Any], str]] = {}
@@ -786,7 +3147,7 @@ def bibtex_entries_to_crossref_dois(
         if config.use_input_doi and entry.get('doi'):
             logger.info(f'    use user input doi for {entry_id}')
             entry_store.crossref_query_status = 'ok'
-            entry_store.found_doi = entry.get('doi')
+            entry_store.set_found_doi(entry.get('doi'))
         else:
             if entry_store.crossref_query_status != 'ok':
                 query_text = ' '.join(
@@ -796,34 +3157,285 @@ def bibtex_entries_to_crossref_dois(
             else:
                 logger.info(f'    use cache entry for {entry_id}')
     
-    if len(bibliographic) > 0:
-        timer = Timer()
-        timer.start()
-        n_jobs = min(len(bibliographic), config.number_of_parallel_request)
-        # Use module-level worker function instead of client method
-        results = Parallel(n_jobs=n_jobs)(
-            delayed(_crossref_query_worker)(bib[1])
-            for bib in bibliographic.values()
+    # Only one entry of each cluster of near-duplicates is searched
+    clusters = near_duplicate_clusters({k: v[0] for k, v in bibliographic.items()})
+    if clusters:
+        logger.info(f'    {len(clusters)} near-duplicate entries share the search of another entry')
+    bibliographic = {k: v for k, v in bibliographic.items() if k not in clusters}
+    
+    results: Dict[str, Dict[str, Any]] = {}
+    if metadata_cache is not None and len(bibliographic) > 0:
+        cached = metadata_cache.get_many(
+            MetadataCache.CROSSREF_QUERY,
+            [crossref_query_key(query_text, config.crossref_candidates) for _, query_text in bibliographic.values()]
+        )
+        for entry_id, (_, query_text) in bibliographic.items():
+            result = cached.get(crossref_query_key(query_text, config.crossref_candidates))
+            if result is not None:
+                logger.info(f'    use metadata cache for {entry_id}')
+                results[entry_id] = result
+    
+    for entry_id, result in results.items():
+        _apply_crossref_query_result(store[entry_id], result)
+    
+    pending = {k: v for k, v in bibliographic.items() if k not in results}
+    if len(pending) > 0 and metadata_cache is not None and config.local_match_threshold is not None:
+        # High-confidence matches with cached records need no search
+        index = FuzzyMatchIndex.from_metadata_cache(
+            metadata_cache, logger, [entry for entry, _ in pending.values()]
         )
+        for entry_id, (entry, _) in pending.items():
+            match = index.match(entry)
+            if match is not None and match[1] >= config.local_match_threshold:
+                logger.info(f'    local match for {entry_id}: {match[0]} ({match[1]:.2f})')
+                results[entry_id] = FuzzyMatchIndex.as_query_result(*match)
+                _apply_crossref_query_result(store[entry_id], results[entry_id])
+                if journal is not None:
+                    journal.append(entry_id, store[entry_id])
+        pending = {k: v for k, v in pending.items() if k not in results}
+    
+    if len(pending) > 0:
+        pending_ids = list(pending.keys())
+        
+        def on_result(index: int, result: Dict[str, Any]) -> None:
+            _apply_crossref_query_result(store[pending_ids[index]], result)
+            if journal is not None:
+                journal.append(pending_ids[index], store[pending_ids[index]])
+        
+        timer = Timer(name='search')
+        timer.start()
+        with _engine_for(engine, config, logger) as engine:
+            @functools.wraps(engine.crossref.query)
+            def search(bib: Tuple[Dict[str, Any], str]) -> Dict[str, Any]:
+                return engine.crossref.query(bib[1], config.crossref_candidates, bib[0])
+            
+            fetched = engine.map(search, list(pending.values()), on_result)
+            engine.rate_limiter.log_rates()
         timer.stop()
+        
+        if metadata_cache is not None:
+            metadata_cache.put_many(MetadataCache.CROSSREF_QUERY, {
+                crossref_query_key(pending[entry_id][1], config.crossref_candidates): result
+                for entry_id, result in zip(pending_ids, fetched)
+                if result.get('status') == 'ok' and result.get('source') != CrossrefLocalIndex.SOURCE
+            })
+    
+    for entry_id, representative in clusters.items():
+        _share_search_result(store[representative], store[entry_id])
+        if journal is not None:
+            journal.append(entry_id, store[entry_id])
+
+
+def _share_search_result(source: EntryStore, target: EntryStore) -> None:
+    """Give ``target`` the search result of its near-duplicate ``source``."""
+    if source.crossref_query_status is not None:
+        target.set_found_doi(source.found_doi)
+        target.crossref_query_status = source.crossref_query_status
+
+
+def _candidate_score(entry: Dict[str, Any], item: Dict[str, Any], max_score: float) -> float:
+    """Agreement in [0, 1] between an input entry and a Crossref work item."""
+    title = check_titles(entry.get('title', ''), _csl_text(item.get('title'))).score
+    
+    parts = _csl_date_parts(item)
+    year = _entry_year(entry)
+    year_match = 0.0
+    if parts and year.isdigit():
+        year_match = {0: 1.0, 1: 0.5}.get(abs(int(parts[0]) - int(year)), 0.0)
+    
+    type_match = float(CSL_TYPE_TO_BIBTEX.get(item.get('type', ''), 'misc') == entry.get('ENTRYTYPE'))
+    
+    authors = item.get('author') or [{}]
+    family = authors[0].get('family') or authors[0].get('name') or ''
+    author_match = float(
+        normalize_title(family).replace(' ', '') == _first_author_key(entry.get('author', ''))
+    )
+    
+    container = entry.get('journal') or entry.get('booktitle') or ''
+    container_match = 0.0
+    if container and item.get('container-title'):
+        container_match = _jaccard(
+            title_trigrams(normalize_title(container)),
+            title_trigrams(normalize_title(_csl_text(item.get('container-title'))))
+        )
+    
+    relevance = float(item.get('score') or 0) / max_score if max_score > 0 else 0.0
+    return (0.45 * title + 0.15 * year_match + 0.1 * type_match + 0.15 * author_match
+            + 0.05 * container_match + 0.1 * relevance)
+
+
+def rank_crossref_candidates(entry: Dict[str, Any], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Sort the works returned by a Crossref search by agreement with the input entry.
+    
+    The title similarity weighs most, then the first author and year, the
+    entry type, the Crossref relevance score and the container title.
+    """
+    if len(items) < 2:
+        return list(items)
+    max_score = max(float(item.get('score') or 0) for item in items)
+    return sorted(items, key=lambda item: -_candidate_score(entry, item, max_score))
 
-        for (entry_id, (entry, _)), result in zip(bibliographic.items(), results):
-            if result.get('status') == 'ok':
-                doi = CrossrefClient.extract_doi(result)
-                if doi is not None:
-                    store[entry_id].found_doi = doi
-                    store[entry_id].crossref_query_status = 'ok'
-                else:
-                    store[entry_id].crossref_query_status = 'bad'
+
+def _apply_crossref_query_result(entry_store: EntryStore, result: Dict[str, Any]) -> None:
+    """Store the DOI of the best candidate of a Crossref bibliographic query."""
+    if result.get('status') == 'ok':
+        try:
+            items = rank_crossref_candidates(entry_store.input, result['message']['items'])
+        except (KeyError, TypeError):
+            items = []
+        doi = items[0].get('DOI') if items else None
+        entry_store.set_found_doi(doi)
+        entry_store.crossref_query_status = 'ok' if doi is not None else 'bad'
 
 
 doi_to_bibtex_entry_server = 'doi.org'
 
 
+def crossref_works_by_batch(
+    dois: List[str],
+    batch_size: int,
+    engine: RequestEngine,
+    logger: logging.Logger
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch Crossref work items for many DOIs with multi-DOI filter queries.
+    
+    The batches run concurrently. A rejected or failed batch is split in two
+    and retried, and the batch size used for the retries is halved.
+    
+    Args:
+        dois: List of DOI strings
+        batch_size: Initial number of DOIs per request
+        engine: RequestEngine running the requests
+        logger: logging.Logger instance
+        
+    Returns:
+        Dictionary of Crossref work items keyed by canonical DOI
+    """
+    def get_works(batch: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            return engine.crossref.get_works(batch)
+        except CrossrefAPIError as e:
+            logger.info(f'   batch of {len(batch)} dois failed: {e}')
+            return None
+    
+    dois = list(dict.fromkeys(dois))
+    found: Dict[str, Dict[str, Any]] = {}
+    size = max(1, batch_size)
+    batches = [dois[i:i + size] for i in range(0, len(dois), size)]
+    n_requests = 0
+    
+    while batches:
+        outcomes = engine.map(get_works, batches)
+        n_requests += len(batches)
+        failed: List[str] = []
+        for batch, outcome in zip(batches, outcomes):
+            if outcome is not None:
+                found.update(outcome)
+            elif len(batch) > 1:
+                failed.extend(batch)
+        
+        if failed:
+            size = max(1, min(size, len(failed)) // 2)
+            logger.info(f'   retrying {len(failed)} dois with batches of {size}')
+        batches = [failed[i:i + size] for i in range(0, len(failed), size)]
+    
+    logger.info(f'   {len(found)} works fetched from crossref in {n_requests} requests')
+    return found
+
+
+def _bibtex_getter(config: Config, engine: RequestEngine):
+    """Return the blocking function fetching the (bibtex_str, json_str, status) of a DOI."""
+    client = engine.doi_org if doi_to_bibtex_entry_server == 'doi.org' else engine.crossref
+    if config.bibtex_from_csl:
+        # One request per DOI, the BibTeX entry is built locally
+        def get_bibtex(doi: str) -> Tuple[Optional[str], Optional[str], str]:
+            json_str, status = client.get_csl_json(doi)
+            return None, json_str, status
+        return get_bibtex
+    return client.get_bibtex
+
+
+def _fetch_bibtex_results(
+    pending: Dict[str, EntryStore],
+    config: Config,
+    logger: logging.Logger,
+    metadata_cache: Optional[MetadataCache],
+    engine: RequestEngine,
+    on_result
+) -> None:
+    """
+    Get the (bibtex_str, json_str, status) results of the entries of ``pending``.
+    
+    The local Crossref index is used first, then batched Crossref queries
+    if enabled, then one content negotiation per remaining DOI. Each result
+    is passed to ``on_result(key, result)`` as soon as it is available.
+    """
+    local_index = engine.crossref.local_index
+    if local_index is not None:
+        found = set()
+        for key, entry_store in pending.items():
+            local = local_index.get_csl_json(entry_store.found_doi)
+            if local is not None:
+                # The entry is built from the indexed metadata
+                on_result(key, (None, local[0], local[1]))
+                found.add(key)
+        logger.info(f'   {len(found)}/{len(pending)} entries found in the local crossref index')
+        pending = {k: v for k, v in pending.items() if k not in found}
+    
+    if len(pending) > 0 and config.crossref_batch_size > 0:
+        timer = Timer(name='fetch_batch')
+        timer.start()
+        works = crossref_works_by_batch(
+            [entry.found_doi for entry in pending.values()],
+            config.crossref_batch_size, engine, logger
+        )
+        timer.stop()
+        
+        batched = {}
+        for key, entry_store in pending.items():
+            item = works.get(canonical_doi(entry_store.found_doi))
+            if item is not None:
+                # The work item is read as CSL JSON, the entry is built locally
+                batched[key] = (None, json.dumps(item), 'ok')
+        logger.info(f'   {len(batched)}/{len(pending)} entries found with batched crossref queries')
+        for key, result in batched.items():
+            on_result(key, result)
+        
+        if metadata_cache is not None:
+            metadata_cache.put_many(MetadataCache.BIBTEX, {
+                bibtex_cache_key(pending[key].found_doi, csl=True): result for key, result in batched.items()
+            })
+        # The misses fall back to one request per DOI
+        pending = {k: v for k, v in pending.items() if k not in batched}
+    
+    if len(pending) > 0:
+        timer = Timer(name='fetch')
+        timer.start()
+        pending_keys = list(pending.keys())
+        fetched = engine.map(
+            _bibtex_getter(config, engine), [entry.found_doi for entry in pending.values()],
+            lambda index, result: on_result(pending_keys[index], result)
+        )
+        engine.rate_limiter.log_rates()
+        timer.stop()
+        
+        if metadata_cache is not None:
+            metadata_cache.put_many(MetadataCache.BIBTEX, {
+                bibtex_cache_key(entry_store.found_doi, csl=result[0] is None): result
+                for entry_store, result in zip(pending.values(), fetched)
+                if result[2] == 'ok'
+            })
+
+
 def dois_to_bibtex_entries(
     store: Dict[str, EntryStore],
     config: Config,
-    logger: logging.Logger
+    logger: logging.Logger,
+    metadata_cache: Optional[MetadataCache] = None,
+    engine: Optional[RequestEngine] = None,
+    journal: Optional[CacheJournal] = None
 ) -> None:
     """
     Fetch BibTeX entries for all DOIs in the store.
@@ -832,6 +3444,9 @@ def dois_to_bibtex_entries(
         store: Dictionary of EntryStore instances
         config: Configuration options
         logger: logging.Logger instance
+        metadata_cache: Optional shared cache consulted before content negotiation
+        engine: Optional RequestEngine shared by all stages
+        journal: Optional journal of the entries, written as each result arrives
     """
     logger.info('dois_to_bibtex_entries ....')
     store_search: Dict[str, EntryStore] = {}
@@ -846,55 +3461,88 @@ def dois_to_bibtex_entries(
         else:
             logger.info(f'crossref query for {entry_store.input["ID"]} has failed')
 
-    if len(store_search) > 0:
-        timer = Timer()
-        timer.start()
-        n_jobs = min(len(store_search), config.number_of_parallel_request)
+    results: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+    if metadata_cache is not None and len(store_search) > 0:
+        cached = metadata_cache.get_many(
+            MetadataCache.BIBTEX,
+            [bibtex_cache_key(entry.found_doi) for entry in store_search.values()]
+        )
+        for key, entry_store in store_search.items():
+            result = cached.get(bibtex_cache_key(entry_store.found_doi))
+            if result is not None and result[0] is not None:
+                if result[1] is not None or not config.bibtex_from_csl:
+                    results[key] = result
         
-        if doi_to_bibtex_entry_server == 'doi.org':
-            # Use doi.org client worker
-            results = Parallel(n_jobs=n_jobs)(
-                delayed(_doi_org_fetch_worker)(entry.found_doi)
-                for entry in store_search.values()
-            )
-        else:
-            # Use Crossref client worker
-            results = Parallel(n_jobs=n_jobs)(
-                delayed(_crossref_get_bibtex_worker)(entry.found_doi)
-                for entry in store_search.values()
+        if config.bibtex_from_csl or config.crossref_batch_size > 0:
+            # The entries built from CSL JSON are kept for the next runs building them so
+            missing = {k: v for k, v in store_search.items() if k not in results}
+            cached = metadata_cache.get_many(
+                MetadataCache.BIBTEX,
+                [bibtex_cache_key(entry.found_doi, csl=True) for entry in missing.values()]
             )
-        timer.stop()
+            for key, entry_store in missing.items():
+                result = cached.get(bibtex_cache_key(entry_store.found_doi, csl=True))
+                if result is not None:
+                    results[key] = result
+        
+        for key in results:
+            logger.info(f'   use metadata cache for {store_search[key].input["ID"]}')
 
-        for (key, entry_store), result in zip(store_search.items(), results):
-            bibtex_entry_str, json_entry, status = result
-            entry_store.doi_to_bibtex_status = status
-            
-            if status == 'ok':
-                entry_store.crossref_json_entry = json_entry
-                bp = BibTexParser(interpolate_strings=False)
-                bib_database = bp.parse(bibtex_entry_str)
-                
-                entries_list = list(bib_database.entries)
-                if len(entries_list) == 0:
-                    entry_store.doi_to_bibtex_status = '!ok'
-                    logger.warning(f'WARNING: bad format for bibtex from crossref {entry_store.input["ID"]}')
-                else:
-                    entry_store.crossref_bibtex_entry = entries_list[0]
+    for key, result in results.items():
+        _apply_bibtex_result(store_search[key], result, config, logger)
+    
+    # Entries sharing a DOI are fetched once
+    sharing: Dict[str, List[str]] = {}
+    for key, entry_store in store_search.items():
+        if key not in results:
+            sharing.setdefault(canonical_doi(entry_store.found_doi), []).append(key)
+    
+    def on_result(key: str, result: Tuple[Optional[str], Optional[str], str]) -> None:
+        for shared_key in sharing[canonical_doi(store_search[key].found_doi)]:
+            _apply_bibtex_result(store_search[shared_key], result, config, logger)
+            if journal is not None:
+                journal.append(shared_key, store_search[shared_key])
+    
+    pending = {keys[0]: store_search[keys[0]] for keys in sharing.values()}
+    if len(pending) > 0:
+        with _engine_for(engine, config, logger) as engine:
+            _fetch_bibtex_results(pending, config, logger, metadata_cache, engine, on_result)
+
+
+def _apply_bibtex_result(
+    entry_store: EntryStore,
+    result: Tuple[Optional[str], Optional[str], str],
+    config: Config,
+    logger: logging.Logger
+) -> None:
+    """Parse a (bibtex_str, json_str, status) result into the Crossref entry of ``entry_store``."""
+    bibtex_entry_str, json_entry, status = result
+    entry_store.doi_to_bibtex_status = status
+    
+    if status == 'ok':
+        entry_store.crossref_json_entry = json_entry
+        if config.bibtex_from_csl or bibtex_entry_str is None:
+            try:
+                entries_list = [csl_json_to_bibtex_entry(json_entry)]
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.debug(f'Cannot build bibtex entry from CSL JSON: {e}')
+                entries_list = []
+        else:
+            bp = BibTexParser(interpolate_strings=False)
+            bib_database = bp.parse(bibtex_entry_str)
+            entries_list = list(bib_database.entries)
+        
+        if len(entries_list) == 0:
+            entry_store.doi_to_bibtex_status = '!ok'
+            logger.warning(f'WARNING: bad format for bibtex from crossref {entry_store.input["ID"]}')
+        else:
+            entry_store.crossref_bibtex_entry = entries_list[0]
 
 
 # =============================================================================
 # Unpaywall API functions
 # =============================================================================
-# Note: Unpaywall imports are at the top with API Client Classes
-# Initialize credentials globally for backward compatibility
-UnpywallCredentials('vincent.acary@inria.fr')
 
-
-@retry_with_backoff(
-    max_retries=2,
-    initial_delay=1.0,
-    exceptions=(UnpaywallAPIError, ConnectionError, Timeout)
-)
 def unpywall_query(title: str, is_oa: bool, logger: logging.Logger) -> Tuple[Optional[Any], str, str]:
     """
     Query Unpaywall API by title.
@@ -905,45 +3553,13 @@ def unpywall_query(title: str, is_oa: bool, logger: logging.Logger) -> Tuple[Opt
         logger: logging.Logger instance
         
     Returns:
-        Tuple of (query_result, message, status)
+        Tuple of (records, message, status)
     """
-    try:
-        query = Unpywall.query(query=title, is_oa=is_oa, errors='ignore')
-        if query is not None:
-            msg = f'{{Unpywall.query on title returns results with is_oa={is_oa}}}'
-            logger.info(msg)
-            status = 'query ok'
-        else:
-            msg = f'{{Unpywall.query on title returns None with is_oa={is_oa}}}'
-            logger.info(msg)
-            status = 'query none'
-    except HTTPError as e:
-        status_code = e.response.status_code if hasattr(e, 'response') else None
-        query = None
-        msg = f'[warning]: Unpywall.query HTTP error {status_code}: {e}'
-        logger.info(msg)
-        if status_code == 429:
-            raise UnpaywallAPIError(f"Rate limited (429)", status_code=429) from e
-        status = f'http_error_{status_code}'
-    except (ConnectionError, Timeout) as e:
-        query = None
-        msg = f'[warning]: Unpywall.query connection error: {e}'
-        logger.info(msg)
-        raise UnpaywallAPIError(f"Connection failed: {e}") from e
-    except Exception as e:
-        query = None
-        msg = f'[warning]: Unpywall.query unexpected error: {e}'
-        logger.info(msg)
-        status = f'error: {str(e)[:50]}'
-    
+    query, msg, status = UnpaywallClient(UNPAYWALL_EMAIL, logger=logger).query_by_title(title, is_oa)
+    logger.info(msg)
     return query, msg, status
 
 
-@retry_with_backoff(
-    max_retries=3,
-    initial_delay=1.0,
-    exceptions=(UnpaywallAPIError, ConnectionError, Timeout)
-)
 def unpywall_doi(doi: str, logger: logging.Logger) -> Tuple[Optional[Any], str, str]:
     """
     Query Unpaywall API by DOI.
@@ -953,41 +3569,9 @@ def unpywall_doi(doi: str, logger: logging.Logger) -> Tuple[Optional[Any], str,
         logger: logging.Logger instance
         
     Returns:
-        Tuple of (query_result, message, status)
+        Tuple of (record, message, status)
     """
-    try:
-        query = Unpywall.doi(dois=[doi], errors='ignore')
-        if query is not None:
-            msg = '{Unpywall.doi returns results}'
-            status = 'doi found'
-        else:
-            logger.info('[error]: doi query on unpaywall is None !!!')
-            msg = '{Unpywall.doi returns None}'
-            status = 'doi not found'
-    except HTTPError as e:
-        status_code = e.response.status_code if hasattr(e, 'response') else None
-        logger.warning(f'HTTP error from Unpaywall DOI query: {status_code}')
-        if status_code == 404:
-            msg = '{DOI not found in Unpaywall}'
-            status = 'doi_not_found'
-        elif status_code == 429:
-            msg = '{Rate limited by Unpaywall}'
-            status = 'rate_limited'
-            raise UnpaywallAPIError(f"Rate limited (429)", status_code=429) from e
-        else:
-            msg = f'{{Unpywall.doi HTTP error {status_code}}}'
-            status = f'http_error_{status_code}'
-        query = None
-    except (ConnectionError, Timeout) as e:
-        logger.warning(f'Connection error to Unpaywall: {e}')
-        raise UnpaywallAPIError(f"Connection failed: {e}") from e
-    except Exception as e:
-        logger.warning(f'Unexpected error from Unpaywall: {e}')
-        msg = f'{{Unpywall.doi failed}}: {str(e)[:100]}'
-        status = 'doi_failed'
-        query = None
-
-    return query, msg, status
+    return UnpaywallClient(UNPAYWALL_EMAIL, logger=logger).query_by_doi(doi)
 
 
 def unpaywall_get_oai_url(doi_query: Optional[Any], logger: logging.Logger) -> Tuple[str, str]:
@@ -995,7 +3579,7 @@ def unpaywall_get_oai_url(doi_query: Optional[Any], logger: logging.Logger) -> T
     Extract OAI URL from Unpaywall query result.
     
     Args:
-        doi_query: Unpaywall query result DataFrame
+        doi_query: Unpaywall record
         logger: logging.Logger instance
         
     Returns:
@@ -1004,29 +3588,14 @@ def unpaywall_get_oai_url(doi_query: Optional[Any], logger: logging.Logger) -> T
     oai_url = 'oai url not found'
     status = 'oai url not found'
 
+    doi_query = as_unpaywall_record(doi_query)
     if doi_query is None:
         return oai_url, status
 
-    if doi_query.get('best_oa_location.url_for_pdf') is not None:
-        if doi_query['best_oa_location.url_for_pdf'][0] is not None:
-            oai_url = urllib.parse.unquote(
-                doi_query['best_oa_location.url_for_pdf'][0],
-                errors='replace')
-            status = 'oai url found'
-            logger.info(f'unpaywall oai url: {oai_url}')
-
-    if doi_query.get('best_oa_location.url') is not None:
-        if doi_query.get('best_oa_location.url')[0] is not None:
-            oai_url = urllib.parse.unquote(
-                doi_query.get('best_oa_location.url')[0], errors='replace')
-            status = 'oai url found'
-            logger.info(f'unpaywall oai url: {oai_url}')
-
-    if doi_query.get('best_oa_location.url_for_landing_page') is not None:
-        if doi_query.get('best_oa_location.url_for_landing_page')[0] is not None:
-            oai_url = urllib.parse.unquote(
-                doi_query.get('best_oa_location.url_for_landing_page')[0],
-                errors='replace')
+    # The last url found wins: the landing page, then the url, then the pdf
+    for field in ('url_for_pdf', 'url', 'url_for_landing_page'):
+        if doi_query.get(field) is not None:
+            oai_url = urllib.parse.unquote(doi_query[field], errors='replace')
             status = 'oai url found'
             logger.info(f'unpaywall oai url: {oai_url}')
 
@@ -1037,7 +3606,10 @@ def unpaywall_oais_from_crossref_dois(
     entries: List[Dict[str, Any]],
     store: Dict[str, EntryStore],
     config: Config,
-    logger: logging.Logger
+    logger: logging.Logger,
+    metadata_cache: Optional[MetadataCache] = None,
+    engine: Optional[RequestEngine] = None,
+    journal: Optional[CacheJournal] = None
 ) -> None:
     """
     Query Unpaywall for all entries with valid Crossref DOIs.
@@ -1047,61 +3619,115 @@ def unpaywall_oais_from_crossref_dois(
         store: Dictionary of EntryStore instances
         config: Configuration options
         logger: logging.Logger instance
+        metadata_cache: Optional shared cache consulted before querying Unpaywall
+        engine: Optional RequestEngine shared by all stages
+        journal: Optional journal of the entries, written as each result arrives
     """
+    done = [entry for entry in entries if _has_unpaywall_result(store[entry.get('ID')], config)]
+    for entry in done:
+        logger.info(f'    use cache entry for {entry.get("ID")}')
+    done_ids = {entry.get('ID') for entry in done}
+    entries = [entry for entry in entries if entry.get('ID') not in done_ids]
     if not entries:
         return
     
-    timer = Timer()
-    timer.start()
-    # Use module-level worker function instead of passing logger
-    results = Parallel(n_jobs=len(entries))(
-        delayed(_unpaywall_doi_worker)(store[entry.get('ID')].found_doi)
-        for entry in entries
-    )
-    timer.stop()
-
-    for entry, result in zip(entries, results):
-        entry_id = entry.get('ID')
-        doi_query, unpaywall_msg, unpaywall_status = result
+    dois = [store[entry.get('ID')].found_doi for entry in entries]
+    cached: Dict[str, Any] = {}
+    if metadata_cache is not None:
+        cached = metadata_cache.get_many(
+            MetadataCache.UNPAYWALL, [canonical_doi(doi) for doi in dois]
+        )
+    
+    with _engine_for(engine, config, logger) as engine:
+        snapshot = engine.unpaywall.snapshot
+        missing = [doi for doi in dois if canonical_doi(doi) not in cached]
+        if snapshot is not None and missing:
+            # Resolve locally, only the dois missing from the snapshot use the api
+            local = {canonical_doi(doi): snapshot.query_by_doi(doi) for doi in missing}
+            local = {key: result for key, result in local.items() if result is not None}
+            logger.info(f'    {len(local)}/{len(missing)} dois resolved with the unpaywall snapshot')
+            cached.update(local)
+        
+        # Entries sharing a DOI are queried once
+        sharing: Dict[str, List[str]] = {}
+        for entry, doi in zip(entries, dois):
+            result = cached.get(canonical_doi(doi))
+            if result is not None:
+                _apply_unpaywall_result(store[entry.get('ID')], result, config, logger)
+            else:
+                sharing.setdefault(canonical_doi(doi), []).append(entry.get('ID'))
+        pending = [keys[0] for keys in sharing.values()]
         
-        entry_store = store[entry_id]
-        entry_store.unpaywall_msg = unpaywall_msg
-        entry_store.unpaywall_status = [unpaywall_status]
+        if pending:
+            def on_result(index: int, result: Tuple[Optional[Any], str, str]) -> None:
+                for key in sharing[canonical_doi(store[pending[index]].found_doi)]:
+                    _apply_unpaywall_result(store[key], result, config, logger)
+                    if journal is not None:
+                        journal.append(key, store[key])
+            
+            timer = Timer(name='unpaywall')
+            timer.start()
+            fetched = engine.map(
+                engine.unpaywall.query_by_doi, [store[key].found_doi for key in pending], on_result
+            )
+            engine.rate_limiter.log_rates()
+            timer.stop()
+            
+            if metadata_cache is not None:
+                metadata_cache.put_many(MetadataCache.UNPAYWALL, {
+                    canonical_doi(store[key].found_doi): result
+                    for key, result in zip(pending, fetched)
+                    if result[2] == 'doi found'
+                })
+        else:
+            logger.info('    no unpaywall api query needed')
 
-        if doi_query is not None:
-            if config.output_unpaywall_data:
-                doi_query_dict = doi_query.to_dict('dict')
-                print(doi_query_dict)
-                entry_store.unpaywall_data = json.dumps(doi_query_dict, indent=4)
 
-            if unpaywall_status == 'doi found':
-                oai_url, status = unpaywall_get_oai_url(doi_query, logger)
-                entry_store.oai_url = oai_url
-                entry_store.unpaywall_status.append(status)
+def _has_unpaywall_result(entry_store: EntryStore, config: Config) -> bool:
+    """Whether the entry already holds the Unpaywall result of its DOI."""
+    if entry_store.unpaywall_status[:1] != ['doi found']:
+        return False
+    return not config.output_unpaywall_data or entry_store.unpaywall_data is not None
 
-                # Detect if OAI is from arXiv or HAL
-                oai_host_type = None
-                oai_repository_institution = None
 
-                if doi_query.get('best_oa_location.host_type') is not None:
-                    oai_host_type = doi_query.get('best_oa_location.host_type')[0]
+def _apply_unpaywall_result(
+    entry_store: EntryStore,
+    result: Tuple[Optional[Any], str, str],
+    config: Config,
+    logger: logging.Logger
+) -> None:
+    """Store the open access location found by an Unpaywall query."""
+    doi_query, unpaywall_msg, unpaywall_status = result
+    doi_query = as_unpaywall_record(doi_query)
+    
+    entry_store.unpaywall_msg = unpaywall_msg
+    entry_store.unpaywall_status = [unpaywall_status]
+
+    if doi_query is not None:
+        if config.output_unpaywall_data:
+            print(doi_query)
+            entry_store.unpaywall_data = json.dumps(doi_query, separators=(',', ':'))
+
+        if unpaywall_status == 'doi found':
+            oai_url, status = unpaywall_get_oai_url(doi_query, logger)
+            entry_store.oai_url = oai_url
+            entry_store.unpaywall_status.append(status)
+
+            # Detect if OAI is from arXiv or HAL
+            oai_host_type = doi_query.get('host_type')
+            oai_repository_institution = doi_query.get('repository_institution')
+
+            if (oai_host_type == 'repository' and oai_repository_institution is not None):
+                if 'arXiv' in oai_repository_institution:
+                    print(doi_query)
+                    entry_store.oai_url_for_landing_page = doi_query.get('url_for_landing_page')
+                    print(f'landing: {entry_store.oai_url_for_landing_page}')
+                    entry_store.oai_type = 'arXiv'
                 
-                if doi_query.get('best_oa_location.repository_institution') is not None:
-                    oai_repository_institution = doi_query.get('best_oa_location.repository_institution')[0]
-
-                if (oai_host_type == 'repository' and oai_repository_institution is not None):
-                    if 'arXiv' in oai_repository_institution:
-                        print(doi_query)
-                        entry_store.oai_url_for_landing_page = \
-                            doi_query.get('best_oa_location.url_for_landing_page')[0]
-                        print(f'landing: {entry_store.oai_url_for_landing_page}')
-                        entry_store.oai_type = 'arXiv'
-                    
-                    if 'HAL' in oai_repository_institution:
-                        entry_store.oai_type = 'HAL'
-                        entry_store.oai_url_for_landing_page = \
-                            doi_query.get('best_oa_location.url_for_landing_page')[0]
-                        print(f'landing: {entry_store.oai_url_for_landing_page}')
+                if 'HAL' in oai_repository_institution:
+                    entry_store.oai_type = 'HAL'
+                    entry_store.oai_url_for_landing_page = doi_query.get('url_for_landing_page')
+                    print(f'landing: {entry_store.oai_url_for_landing_page}')
 
 
 # =============================================================================
@@ -1236,12 +3862,84 @@ def interactive_menu(
     return flag_skip, flag_forced_valid
 
 
+@dataclass
+class TitleCheck:
+    """Comparison of an input title with a Crossref title."""
+    differences: Set[str]  # words found in only one of the titles
+    score: float           # similarity in [0, 1]
+    
+    @property
+    def label(self) -> str:
+        """'ok+' for the same words, 'ok-' for at most two different words, '!ok' otherwise."""
+        if len(self.differences) < 1:
+            return 'ok+'
+        if len(self.differences) < 3:
+            return 'ok-'
+        return '!ok'
+
+
+_TITLE_BRACES = CharacterTranslator([('{', ''), ('}', '')])
+_CROSSREF_TITLE = CharacterTranslator([
+    ('{', ''), ('}', ''),
+    ('\\textquotesingle', "'"), ('\\textendash', '--'), ('\\textemdash', '-'),
+])
+
+
+def _title_words(title: str, crossref: bool = False) -> Set[str]:
+    translator = _CROSSREF_TITLE if crossref else _TITLE_BRACES
+    return set(translator.translate(title.lower()).split())
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def batch_check_titles(pairs: List[Tuple[str, str]]) -> List[TitleCheck]:
+    """
+    Compare many (input title, Crossref title) pairs.
+    
+    Each distinct title is tokenized once. The differences are the words of
+    only one of the titles, which decide the label; the score averages the
+    Jaccard similarities of the words and of the character trigrams of the
+    normalized titles.
+    
+    Args:
+        pairs: List of (input title, Crossref title)
+        
+    Returns:
+        List of TitleCheck, in the order of ``pairs``
+    """
+    words: Dict[Tuple[str, bool], Set[str]] = {}
+    trigrams: Dict[str, Set[str]] = {}
+    
+    def tokens(title: str, crossref: bool) -> Tuple[Set[str], Set[str]]:
+        if (title, crossref) not in words:
+            words[title, crossref] = _title_words(title, crossref)
+        if title not in trigrams:
+            trigrams[title] = title_trigrams(normalize_title(title))
+        return words[title, crossref], trigrams[title]
+    
+    checks = []
+    for input_title, crossref_title in pairs:
+        words_1, trigrams_1 = tokens(input_title, False)
+        words_2, trigrams_2 = tokens(crossref_title, True)
+        score = (_jaccard(words_1, words_2) + _jaccard(trigrams_1, trigrams_2)) / 2
+        checks.append(TitleCheck(words_1 ^ words_2, score))
+    return checks
+
+
+def check_titles(input_title: str, crossref_title: str) -> TitleCheck:
+    """Compare an input title with a Crossref title."""
+    return batch_check_titles([(input_title, crossref_title)])[0]
+
+
 def double_check_bibtex_entries(
     input_bibtex_entry: Dict[str, Any],
     crossref_bibtex_entry: Dict[str, Any],
     config: Config,
     decisions: InteractiveDecisions,
-    logger: logging.Logger
+    logger: logging.Logger,
+    title_check: Optional[TitleCheck] = None
 ) -> Tuple[str, str]:
     """
     Validate Crossref entry against input entry.
@@ -1252,6 +3950,7 @@ def double_check_bibtex_entries(
         config: Configuration options
         decisions: InteractiveDecisions to track user choices
         logger: logging.Logger instance
+        title_check: Optional title comparison computed by :func:`batch_check_titles`
         
     Returns:
         Tuple of (status, check_details)
@@ -1303,26 +4002,22 @@ def double_check_bibtex_entries(
         check += 'year: ok '
 
     # Check title
-    document_1_text = input_bibtex_entry.get('title', '').lower().replace('{', '').replace('}', '')
-    document_2_text = crossref_bibtex_entry.get('title', '').lower().replace('{', '').replace('}', '')
-    document_2_text = document_2_text.replace('\\textquotesingle', "'").replace('\\textendash', '--').replace('\\textemdash', '-')
-
-    document_1_words = document_1_text.split()
-    document_2_words = document_2_text.split()
-    intersection = set(document_1_words).symmetric_difference(set(document_2_words))
-
-    if len(intersection) < 1:
-        check += 'title: ok+ '
-    elif len(intersection) < 3:
-        check += 'title: ok- '
+    if title_check is None:
+        title_check = check_titles(input_bibtex_entry.get('title', ''), crossref_bibtex_entry.get('title', ''))
+    intersection = title_check.differences
+
+    if title_check.label == 'ok+':
+        check += f'title: ok+ ({title_check.score:.2f}) '
+    elif title_check.label == 'ok-':
+        check += f'title: ok- ({title_check.score:.2f}) '
         logger.info(f'[Warning] small difference in title {intersection}')
         print(f'| {entry_id}\n| small difference in title |\n')
     else:
-        check += 'title: !ok '
+        check += f'title: !ok ({title_check.score:.2f}) '
         flag = False
         if config.stop_on_bad_check and not flag_skip:
-            logger.info(f'[Warning] title in input bibtex:\n{document_1_text}\n')
-            logger.info(f'[Warning] title in crossref bibtex:\n{document_2_text}\n')
+            logger.info(f'[Warning] title in input bibtex:\n{input_bibtex_entry.get("title", "")}\n')
+            logger.info(f'[Warning] title in crossref bibtex:\n{crossref_bibtex_entry.get("title", "")}\n')
             print(f'difference: {intersection} {len(intersection)}')
             print(f'\n| {entry_id} | title are different |\n')
             
@@ -1498,10 +4193,159 @@ def astyle_author_crossref_json(json_entry: str) -> str:
     return ' and '.join(author_bibtex)
 
 
+def bibtex_entry_to_str(entry: Dict[str, Any]) -> str:
+    """Serialize a single BibTeX entry."""
+    writer = BibTexWriter()
+    db = BibDatabase()
+    db.entries.append(entry)
+    return writer.write(db)
+
+
+class LazyBibtex:
+    """
+    BibTeX entry serialized only when converted to a string.
+    
+    Passed as a logging argument, the entry is rendered only if a handler
+    emits the record.
+    """
+    
+    __slots__ = ('entry',)
+    
+    def __init__(self, entry: Dict[str, Any]):
+        self.entry = entry
+    
+    def __str__(self) -> str:
+        return bibtex_entry_to_str(self.entry)
+
+
+# Correspondence between CSL / Crossref work types and BibTeX entry types
+CSL_TYPE_TO_BIBTEX = {
+    'article-journal': 'article',
+    'journal-article': 'article',
+    'paper-conference': 'inproceedings',
+    'proceedings-article': 'inproceedings',
+    'chapter': 'inbook',
+    'book-chapter': 'inbook',
+    'book-section': 'inbook',
+    'book': 'book',
+    'edited-book': 'book',
+    'monograph': 'book',
+    'reference-book': 'book',
+    'report': 'techreport',
+    'thesis': 'phdthesis',
+    'dissertation': 'phdthesis',
+    'proceedings': 'proceedings',
+}
+
+# Fields of the CSL container title, depending on the BibTeX entry type
+_CONTAINER_FIELD = {
+    'article': 'journal',
+    'inproceedings': 'booktitle',
+    'inbook': 'booktitle',
+}
+
+_MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+           'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def _csl_text(value: Any) -> str:
+    """Return a CSL text field, which is a list in the Crossref REST API."""
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    return str(value).strip() if value is not None else ''
+
+
+def _csl_date_parts(d: Dict[str, Any]) -> List[Any]:
+    """Return the date parts of the publication date of a CSL item."""
+    for key in ('issued', 'published-print', 'published-online', 'created'):
+        try:
+            parts = d[key]['date-parts'][0]
+        except (KeyError, IndexError, TypeError):
+            continue
+        if parts and parts[0] is not None:
+            return parts
+    return []
+
+
+def csl_json_to_bibtex_entry(json_entry: str) -> Dict[str, Any]:
+    """
+    Build a Crossref BibTeX entry from CSL JSON metadata.
+    
+    Produces the fields read by double_check_bibtex_entries and
+    ad_hoc_build_output_bibtex_entries, as the BibTeX content negotiation
+    would, without a second request and without BibTeX parsing.
+    
+    Args:
+        json_entry: CSL JSON string from content negotiation
+        
+    Returns:
+        BibTeX entry dictionary
+        
+    Raises:
+        ValueError: If the JSON is not a CSL item
+    """
+    d = json.loads(json_entry)
+    if not isinstance(d, dict):
+        raise ValueError('CSL JSON is not an object')
+    
+    entry_type = CSL_TYPE_TO_BIBTEX.get(d.get('type', ''), 'misc')
+    entry: Dict[str, Any] = {'ENTRYTYPE': entry_type}
+    
+    authors = []
+    for a in d.get('author', []):
+        family = a.get('family')
+        given = a.get('given')
+        if family and given:
+            authors.append(f'{family}, {given}')
+        elif family or a.get('name'):
+            authors.append(family or a.get('name'))
+    if authors:
+        entry['author'] = ' and '.join(authors)
+    
+    title = _csl_text(d.get('title'))
+    if title:
+        entry['title'] = title
+    
+    container = _csl_text(d.get('container-title'))
+    if container:
+        entry[_CONTAINER_FIELD.get(entry_type, 'journal')] = container
+    
+    date_parts = _csl_date_parts(d)
+    if date_parts:
+        entry['year'] = str(date_parts[0])
+        if len(date_parts) > 1 and isinstance(date_parts[1], int) and 1 <= date_parts[1] <= 12:
+            entry['month'] = _MONTHS[date_parts[1] - 1]
+    
+    for csl_key, bibtex_key in (('volume', 'volume'), ('issue', 'number'),
+                                ('publisher', 'publisher'), ('DOI', 'doi'),
+                                ('URL', 'url')):
+        value = _csl_text(d.get(csl_key))
+        if value:
+            entry[bibtex_key] = value
+    
+    pages = _csl_text(d.get('page'))
+    if pages:
+        entry['pages'] = '--'.join(p.strip() for p in pages.replace('–', '-').split('-') if p.strip())
+    
+    issn = _csl_text(d.get('ISSN'))
+    if issn:
+        entry['ISSN'] = issn
+    
+    # Same key scheme as the Crossref BibTeX transform
+    first_family = ''
+    if d.get('author'):
+        first_family = d['author'][0].get('family') or d['author'][0].get('name') or ''
+    key_parts = [p for p in (first_family.replace(' ', '_'), entry.get('year', '')) if p]
+    entry['ID'] = '_'.join(key_parts) or d.get('DOI', 'crossref')
+    
+    return entry
+
+
 def ad_hoc_build_output_bibtex_entries(
     store: Dict[str, EntryStore],
     config: Config,
-    logger: logging.Logger
+    logger: logging.Logger,
+    provenance: Optional[ProvenanceWriter] = None
 ) -> None:
     """
     Build final output BibTeX entries from all gathered data.
@@ -1510,6 +4354,7 @@ def ad_hoc_build_output_bibtex_entries(
         store: Dictionary of EntryStore instances
         config: Configuration options
         logger: logging.Logger instance
+        provenance: Optional writer of the input, Crossref and output views of each entry
     """
     logger.info('ad_hoc_build_output_bibtex_entries')
 
@@ -1524,21 +4369,17 @@ def ad_hoc_build_output_bibtex_entries(
 
         if entry_store.doi_to_bibtex_status != 'ok':
             entry_store.output_bibtex_entry = input_bibtex_entry
+            if provenance is not None:
+                provenance.add(key, entry_store)
             continue
 
         crossref_bibtex_entry = entry_store.crossref_bibtex_entry
         entry_id = input_bibtex_entry.get('ID')
         logger.info(f'## bibtex_entry {k} ID : {entry_id}')
 
-        writer = BibTexWriter()
-        db = BibDatabase()
-        db.entries.append(input_bibtex_entry)
-        logger.info(f'Original input bibtex entry: \n{writer.write(db)}')
-        
-        writer = BibTexWriter()
-        db = BibDatabase()
-        db.entries.append(crossref_bibtex_entry)
-        logger.info(f'crossref bibtex entry: \n{writer.write(db)}')
+        # The entries are only serialized if a handler emits the records
+        logger.info('Original input bibtex entry: \n%s', LazyBibtex(input_bibtex_entry))
+        logger.info('crossref bibtex entry: \n%s', LazyBibtex(crossref_bibtex_entry))
 
         entry_store.action = ['', '']
 
@@ -1585,10 +4426,9 @@ def ad_hoc_build_output_bibtex_entries(
         if output_bibtex_entry.get('issue') and output_bibtex_entry.get('number'):
             output_bibtex_entry.pop('number')
 
-        writer = BibTexWriter()
-        db = BibDatabase()
-        db.entries.append(output_bibtex_entry)
-        logger.info(f'output edited bibtex entry: \n{writer.write(db)}')
+        logger.info('output edited bibtex entry: \n%s', LazyBibtex(output_bibtex_entry))
+        if provenance is not None:
+            provenance.add(key, entry_store)
 
 
         k += 1
@@ -1601,59 +4441,670 @@ def ad_hoc_build_output_bibtex_entries(
 class BibtexIO:
     """Handle all BibTeX file I/O operations."""
     
+    # Characters changing the nesting level of a BibTeX block
+    _DELIMITERS = re.compile(r'[@{}()]')
+    
     @staticmethod
     def load(filepath: str, logger: logging.Logger) -> 'BibDatabase':
         """Load BibTeX file and return parsed database."""
-
+        database = BibDatabase()
+        database.entries = list(BibtexIO.iter_entries(filepath))
+        return database
+    
+    @staticmethod
+    def iter_blocks(lines: Iterator[str]) -> Iterator[Tuple[int, str]]:
+        """
+        Split BibTeX text into its top-level ``@`` blocks.
         
-        with open(filepath) as f:
-            bibtex_str = f.read()
+        A block ends at the brace (or parenthesis) closing the one after its
+        type, so only one block at a time is held in memory.
+        
+        Args:
+            lines: Lines of the BibTeX text
+            
+        Returns:
+            Iterator of (line number of the block start, block text)
+        """
+        parts: List[str] = []
+        start_line = 0
+        opening = None      # delimiter opening the current block, None outside blocks
+        depth = 0           # braces depth
+        parens = 0          # parentheses depth outside braces, for @type(...) blocks
+        in_block = False
+        
+        for line_number, line in enumerate(lines, 1):
+            position = 0
+            for match in BibtexIO._DELIMITERS.finditer(line):
+                char = match.group()
+                if not in_block:
+                    if char == '@':
+                        in_block, opening, depth, parens = True, None, 0, 0
+                        start_line, position = line_number, match.start()
+                    continue
+                if opening is None:
+                    if char == '@':
+                        # The previous @ was not followed by a block
+                        start_line, position = line_number, match.start()
+                        parts = []
+                    elif char in '{(':
+                        opening = char
+                        depth, parens = (1, 0) if char == '{' else (0, 1)
+                    continue
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                elif opening == '(' and depth == 0:
+                    parens += 1 if char == '(' else -1 if char == ')' else 0
+                
+                if depth == 0 and (opening == '{' or parens == 0):
+                    parts.append(line[position:match.end()])
+                    yield start_line, ''.join(parts)
+                    parts, in_block, position = [], False, match.end()
+            if in_block:
+                parts.append(line[position:])
+        
+        if in_block and parts:
+            # Unterminated last block, left to the parser to report
+            yield start_line, ''.join(parts)
+    
+    @staticmethod
+    def iter_entries(filepath: str, max_entry: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Read the entries of a BibTeX file one at a time.
+        
+        Each block is parsed as soon as it is read, with the same parser
+        options as the whole-file parsing, and reading stops after
+        ``max_entry`` entries.
         
+        Raises:
+            BibtexParseError: If a block cannot be parsed
+        """
         # Use interpolate_strings=False to handle undefined strings
         bp = BibTexParser(
             interpolate_strings=False,
             ignore_nonstandard_types=False
         )
-        return bp.parse(bibtex_str)
+        # The parser is reused for all blocks, its entries are emptied after each one
+        bp.expect_multiple_parse = True
+        
+        n_entries = 0
+        with open(filepath) as f:
+            for line_number, block in BibtexIO.iter_blocks(f):
+                try:
+                    bp.parse(block)
+                except Exception as e:
+                    raise BibtexParseError(f'{filepath}:{line_number}: {e}') from e
+                entries, bp.bib_database.entries = bp.bib_database.entries, []
+                for entry in entries:
+                    if max_entry is not None and n_entries >= max_entry:
+                        return
+                    n_entries += 1
+                    yield entry
     
     @staticmethod
     def save(database: 'BibDatabase', filepath: str, header: Optional[str] = None) -> None:
         """Save BibTeX database to file."""
-
+        BibtexIO.write_entries(database.entries, filepath, header)
+    
+    @staticmethod
+    def write_entries(
+        entries: Iterable[Dict[str, Any]],
+        filepath: str,
+        header: Optional[str] = None,
+        translator: Optional[CharacterTranslator] = None
+    ) -> None:
+        """
+        Write BibTeX entries to a file in a single pass.
+        
+        The entries are sorted by ID and serialized one at a time, as
+        ``dumps`` does for a whole database, and the fields of each entry are
+        translated before it is written.
         
+        Args:
+            entries: BibTeX entries
+            filepath: Output file
+            header: Optional text written before the entries
+            translator: Optional translator of the problematic characters
+        """
         writer = BibTexWriter()
         writer.display_order = ['author', 'title', 'journal', 'year']
+        found: Set[str] = set()
         
         with open(filepath, 'w', encoding='utf-8') as f:
-            bibtex_str = dumps(database, writer)
             if header:
                 f.write(header + '\n')
-            f.write(bibtex_str)
+            sort_key = lambda x: BibDatabase.entry_sort_key(x, writer.order_entries_by)
+            for i, entry in enumerate(sorted(entries, key=sort_key)):
+                bibtex_str = BibtexIO.entry_to_str(entry, writer, translator, found)
+                if i > 0:
+                    f.write(writer.entry_separator)
+                f.write(bibtex_str)
+        
+        if translator is not None:
+            translator.report(found)
+    
+    @staticmethod
+    def entry_to_str(
+        entry: Dict[str, Any],
+        writer: BibTexWriter,
+        translator: Optional[CharacterTranslator] = None,
+        found: Optional[Set[str]] = None
+    ) -> str:
+        """Serialize one BibTeX entry, translating its fields first."""
+        if translator is not None:
+            entry = translator.translate_entry(entry, found)
+        database = BibDatabase()
+        database.entries = [entry]
+        return writer.write(database)
+    
+    @staticmethod
+    def write_if_changed(filepath: str, content: str) -> bool:
+        """
+        Write ``content`` to a file unless the file already holds it.
+        
+        An unchanged file is not touched, so its modification time is kept.
+        
+        Returns:
+            Whether the file was written
+        """
+        data = content.encode('utf-8')
+        try:
+            if os.path.getsize(filepath) == len(data):
+                with open(filepath, 'rb') as f:
+                    if f.read() == data:
+                        return False
+        except FileNotFoundError:
+            pass
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        return True
     
     @staticmethod
-    def replace_curious_characters(filepath: str) -> None:
+    def replace_curious_characters(filepath: str, translator: Optional[CharacterTranslator] = None) -> None:
         """Replace problematic characters in the output file."""
-        text_to_replace = [
-            ('$\\mathsemicolon$', ';'),
-            ('{\\&}amp;', '\\&'),
-            ('&amp;', '\\&'),
-            ('À', '{\\`A}'),
-            ('\\i', 'i'),
-            ('–', '-'),
-        ]
-
+        translator = translator or CharacterTranslator(DEFAULT_CHARACTER_TABLE)
         with open(filepath, "r", encoding='utf-8') as f:
             content = f.read()
-
-        for old, new in text_to_replace:
-            if old in content:
-                print(f'Match Found. replace {old} by {new}')
-                content = content.replace(old, new)
-
+        
+        found: Set[str] = set()
+        content = translator.translate(content, found)
+        translator.report(found)
+        
         with open(filepath, "w", encoding="utf-8") as f:
             f.write(content)
 
 
+# =============================================================================
+# Streaming Pipeline
+# =============================================================================
+import itertools
+
+
+class StreamingPipeline:
+    """
+    Stream the entries through the search, fetch, validation and Unpaywall stages.
+    
+    Each stage is a pool of workers reading entry keys from a bounded queue
+    and forwarding each entry to the next stage as soon as it is processed,
+    so a slow entry only delays itself. The workers are coroutines of the
+    RequestEngine event loop; the validation stage has a single worker since
+    it may prompt the user. A request failing for one entry only takes that
+    entry out of the pipeline.
+    """
+    
+    NETWORK_STAGES = ('search', 'fetch', 'unpaywall')
+    # Metadata cache records written per batch, in a worker thread
+    CACHE_BATCH = 100
+    
+    def __init__(
+        self,
+        store: Dict[str, EntryStore],
+        config: Config,
+        logger: logging.Logger,
+        validate,
+        engine: RequestEngine,
+        metadata_cache: Optional[MetadataCache] = None,
+        journal: Optional[CacheJournal] = None
+    ):
+        """
+        Args:
+            store: Dictionary of EntryStore instances
+            config: Configuration options
+            logger: logging.Logger instance
+            validate: Function ``validate(entry_store)`` returning the found_doi_status
+            engine: RequestEngine running the stages
+            metadata_cache: Optional shared cache consulted before each request
+            journal: Optional journal of the entries, written after each network stage
+        """
+        self.store = store
+        self.config = config
+        self.logger = logger
+        self.validate = validate
+        self.engine = engine
+        self.metadata_cache = metadata_cache
+        self.journal = journal
+        self.queue_size = 2 * engine.concurrency
+        self._get_bibtex = _bibtex_getter(config, engine)
+        # Time at which each entry entered the pipeline
+        self._started: Dict[str, float] = {}
+        self._match_index: Optional[FuzzyMatchIndex] = None
+        self._shared_results: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Stage at which each failed entry left the pipeline
+        self.failed: Dict[str, str] = {}
+        self._cache_writes: Dict[str, Dict[str, Any]] = {}
+        self._cache_flushes: List[asyncio.Future] = []
+        # Near-duplicate entries share the search of the first entry of their cluster
+        self._clusters = near_duplicate_clusters({
+            key: entry_store.input for key, entry_store in store.items()
+            if not (config.use_input_doi and entry_store.input.get('doi'))
+            and entry_store.crossref_query_status != 'ok'
+        })
+    
+    def workers(self, stage: str) -> int:
+        """Number of concurrent workers of ``stage``."""
+        if stage not in self.NETWORK_STAGES:
+            return 1
+        return max(1, self.config.pipeline_workers.get(stage, self.engine.concurrency))
+    
+    def run(self) -> None:
+        """Process all the entries of the store."""
+        timer = Timer(name='pipeline')
+        timer.start()
+        self.engine.run(self._run(list(self.store)))
+        self.engine.rate_limiter.log_rates()
+        timer.stop()
+    
+    async def _run(self, keys: List[str]) -> None:
+        stages = [
+            ('search', self._search),
+            ('fetch', self._fetch),
+            ('validate', self._validate),
+            ('unpaywall', self._unpaywall),
+        ]
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        tasks = [asyncio.ensure_future(self._feed(keys, queues[0], self.workers(stages[0][0])))]
+        for i, (name, func) in enumerate(stages):
+            if i + 1 < len(stages):
+                outbox, n_next = queues[i + 1], self.workers(stages[i + 1][0])
+            else:
+                outbox, n_next = None, 0
+            tasks.append(asyncio.ensure_future(
+                self._stage(name, func, queues[i], outbox, n_next)
+            ))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await self._flush_cache_writes()
+        if self.failed:
+            self.logger.warning(f'    pipeline: {len(self.failed)} entries failed, they are retried at the next run')
+    
+    @staticmethod
+    async def _feed(keys: List[str], queue: asyncio.Queue, n_workers: int) -> None:
+        for key in keys:
+            await queue.put(key)
+        for _ in range(n_workers):
+            await queue.put(None)
+    
+    async def _stage(self, name: str, func, inbox: asyncio.Queue,
+                     outbox: Optional[asyncio.Queue], n_next: int) -> None:
+        """Run the workers of a stage, then signal the end of the stream to the next stage."""
+        processed = 0
+        
+        async def worker() -> None:
+            nonlocal processed
+            while True:
+                key = await inbox.get()
+                if key is None:
+                    return
+                started = self._started.setdefault(key, time.perf_counter())
+                try:
+                    forward = await func(self.store[key])
+                except (APIError, requests.RequestException) as e:
+                    # Timeouts and connection errors still raised after the retries
+                    self.logger.warning(f'{name} failed for {key}: {e}')
+                    self.failed[key] = name
+                    METRICS.inc('entry_failures_total', {'stage': name})
+                    forward = False
+                processed += 1
+                if not forward or outbox is None:
+                    # The entry leaves the pipeline
+                    METRICS.observe('entry_seconds', time.perf_counter() - started)
+                    del self._started[key]
+                if self.journal is not None and name in self.NETWORK_STAGES:
+                    self.journal.append(key, self.store[key])
+                if forward and outbox is not None:
+                    await outbox.put(key)
+        
+        await asyncio.gather(*[worker() for _ in range(self.workers(name))])
+        self.logger.info(f'    pipeline stage {name}: {processed} entries processed')
+        if outbox is not None:
+            for _ in range(n_next):
+                await outbox.put(None)
+    
+    def _cache_get(self, namespace: str, key: str) -> Optional[Any]:
+        if self.metadata_cache is None:
+            return None
+        pending = self._cache_writes.get(namespace, {}).get(key)
+        if pending is not None:
+            return pending
+        return self.metadata_cache.get(namespace, key)
+    
+    def _cache_put(self, namespace: str, key: str, value: Any) -> None:
+        """Queue a metadata cache record, written with the next batch of its namespace."""
+        if self.metadata_cache is None:
+            return
+        batch = self._cache_writes.setdefault(namespace, {})
+        batch[key] = value
+        if len(batch) >= self.CACHE_BATCH:
+            self._flush_cache(namespace)
+    
+    def _flush_cache(self, namespace: str) -> None:
+        """Write the queued records of a namespace in the default executor."""
+        batch = self._cache_writes.pop(namespace, None)
+        if batch:
+            self._cache_flushes = [f for f in self._cache_flushes if not f.done()]
+            self._cache_flushes.append(asyncio.get_running_loop().run_in_executor(
+                None, self.metadata_cache.put_many, namespace, batch
+            ))
+    
+    async def _flush_cache_writes(self) -> None:
+        """Write all the queued records and wait for the pending writes."""
+        for namespace in list(self._cache_writes):
+            self._flush_cache(namespace)
+        for result in await asyncio.gather(*self._cache_flushes, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.warning(f'metadata cache write failed: {result}')
+        self._cache_flushes = []
+    
+    async def _shared(self, stage: str, key: str, compute) -> Any:
+        """
+        Await ``compute()`` once per (stage, key).
+        
+        The entries sharing a DOI, or a cluster of near-duplicates, await the
+        result of the first one instead of sending their own requests.
+        """
+        future = self._shared_results.get((stage, key))
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._shared_results[stage, key] = future
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other entry awaits it
+            future.exception()
+            raise
+        future.set_result(result)
+        return result
+    
+    async def _search(self, entry_store: EntryStore) -> bool:
+        entry = entry_store.input
+        if self.config.use_input_doi and entry.get('doi'):
+            entry_store.crossref_query_status = 'ok'
+            entry_store.set_found_doi(entry.get('doi'))
+        elif entry_store.crossref_query_status != 'ok':
+            entry_id = entry.get('ID')
+            result = await self._shared(
+                'search', self._clusters.get(entry_id, entry_id), lambda: self._search_result(entry)
+            )
+            _apply_crossref_query_result(entry_store, result)
+        return True
+    
+    async def _search_result(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        query_text = ' '.join(entry.get(k, '') for k in self.config.crossref_search_key)
+        cache_key = crossref_query_key(query_text, self.config.crossref_candidates)
+        result = self._cache_get(MetadataCache.CROSSREF_QUERY, cache_key)
+        if result is None:
+            result = self._local_match(entry)
+        if result is None:
+            result = await self.engine.call(
+                self.engine.crossref.query, query_text, self.config.crossref_candidates, entry
+            )
+            if result.get('status') == 'ok' and result.get('source') != CrossrefLocalIndex.SOURCE:
+                self._cache_put(MetadataCache.CROSSREF_QUERY, cache_key, result)
+        return result
+    
+    def _local_match(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Search result of a high-confidence match with a cached record, if any."""
+        if self.metadata_cache is None or self.config.local_match_threshold is None:
+            return None
+        if self._match_index is None:
+            self._match_index = FuzzyMatchIndex.from_metadata_cache(
+                self.metadata_cache, self.logger,
+                [entry_store.input for entry_store in self.store.values()
+                 if entry_store.crossref_query_status != 'ok']
+            )
+        match = self._match_index.match(entry)
+        if match is None or match[1] < self.config.local_match_threshold:
+            return None
+        self.logger.info(f'    local match for {entry.get("ID")}: {match[0]} ({match[1]:.2f})')
+        return FuzzyMatchIndex.as_query_result(*match)
+    
+    async def _fetch(self, entry_store: EntryStore) -> bool:
+        if entry_store.crossref_query_status != 'ok' or entry_store.doi_to_bibtex_status == 'ok':
+            return True
+        doi = entry_store.found_doi
+        result = await self._shared('fetch', canonical_doi(doi), lambda: self._fetch_result(doi))
+        _apply_bibtex_result(entry_store, result, self.config, self.logger)
+        return True
+    
+    async def _fetch_result(self, doi: str) -> Tuple[Optional[str], Optional[str], str]:
+        result = self._cache_get(MetadataCache.BIBTEX, bibtex_cache_key(doi))
+        if result is not None and (result[0] is None or (self.config.bibtex_from_csl and result[1] is None)):
+            # Entry built from CSL JSON cached under the DOI, or BibTeX without its CSL JSON
+            result = None
+        if result is None and self.config.bibtex_from_csl:
+            result = self._cache_get(MetadataCache.BIBTEX, bibtex_cache_key(doi, csl=True))
+        local_index = self.engine.crossref.local_index
+        if result is None and local_index is not None:
+            local = local_index.get_csl_json(doi)
+            if local is not None:
+                result = (None, local[0], local[1])
+        if result is None:
+            result = await self.engine.call(self._get_bibtex, doi)
+            if result[2] == 'ok':
+                self._cache_put(MetadataCache.BIBTEX, bibtex_cache_key(doi, csl=result[0] is None), result)
+        return result
+    
+    async def _validate(self, entry_store: EntryStore) -> bool:
+        return self.validate(entry_store) == 'valid'
+    
+    async def _unpaywall(self, entry_store: EntryStore) -> bool:
+        if _has_unpaywall_result(entry_store, self.config):
+            return False
+        doi = entry_store.found_doi
+        result = await self._shared('unpaywall', canonical_doi(doi), lambda: self._unpaywall_result(doi))
+        _apply_unpaywall_result(entry_store, result, self.config, self.logger)
+        return False
+    
+    async def _unpaywall_result(self, doi: str) -> Tuple[Optional[Any], str, str]:
+        result = self._cache_get(MetadataCache.UNPAYWALL, canonical_doi(doi))
+        snapshot = self.engine.unpaywall.snapshot
+        if result is None and snapshot is not None:
+            result = snapshot.query_by_doi(doi)
+        if result is None:
+            result = await self.engine.call(self.engine.unpaywall.query_by_doi, doi)
+            if result[2] == 'doi found':
+                self._cache_put(MetadataCache.UNPAYWALL, canonical_doi(doi), result)
+        return result
+
+
+# =============================================================================
+# Profiling
+# =============================================================================
+import cProfile
+import pstats
+import tracemalloc
+
+
+class _StackSampler:
+    """
+    Sample the stacks of all the threads at a fixed interval.
+    
+    The samples are counted by stack, in the collapsed format of the
+    flame graph tools: ``thread;module:function;... count``.
+    """
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+    
+    def _sample(self) -> None:
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                # The workers of a pool are merged into one root frame
+                names[thread.ident] = re.sub(r'_\d+$', '', thread.name)
+            for ident, frame in sys._current_frames().items():
+                if ident == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread'))
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+    
+    def write(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class StepProfiler:
+    """
+    CPU and memory profile of each step of a run.
+    
+    For each step, a cProfile profile of the main thread is merged with the
+    profiles of the calls run by the request worker threads (see
+    :meth:`wrap`) and written as ``<n>_<step>.pstats``; the stacks of all
+    the threads are sampled into ``<n>_<step>.folded`` for flame graphs;
+    tracemalloc gives the peak memory and the allocation sites, written to
+    ``<n>_<step>.memory.txt``.
+    """
+    
+    TOP = 10
+    
+    def __init__(self, directory: str, logger: logging.Logger):
+        self.directory = directory
+        self.logger = logger
+        os.makedirs(directory, exist_ok=True)
+        self.steps: List[Dict[str, Any]] = []
+        self._workers: List[cProfile.Profile] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+    
+    def wrap(self, func):
+        """Profile the calls of ``func`` in the thread running them."""
+        def profiled(*args, **kwargs):
+            profile = getattr(self._local, 'profile', None)
+            try:
+                if profile is None:
+                    profile = cProfile.Profile()
+                    profile.enable()
+                    self._local.profile = profile
+                    with self._lock:
+                        self._workers.append(profile)
+                else:
+                    profile.enable()
+            except ValueError:
+                # Python 3.12+ allows a single active profiler, which then
+                # already sees all the threads
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+    
+    @contextlib.contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        """Profile the code run inside the ``with`` block as the step ``name``."""
+        prefix = os.path.join(self.directory, f'{len(self.steps) + 1:02d}_{name}')
+        with self._lock:
+            self._workers = []
+        # The worker threads create new profiles for the step
+        self._local = threading.local()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        sampler = _StackSampler()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            wall = time.perf_counter() - start
+            sampler.stop()
+            peak = tracemalloc.get_traced_memory()[1]
+            allocations = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            
+            stats = pstats.Stats(profile)
+            with self._lock:
+                for worker in self._workers:
+                    stats.add(worker)
+            stats.dump_stats(f'{prefix}.pstats')
+            sampler.write(f'{prefix}.folded')
+            with open(f'{prefix}.memory.txt', 'w', encoding='utf-8') as f:
+                f.write(f'peak: {peak / 2**20:.1f} MiB\n')
+                for stat in allocations[:50]:
+                    f.write(f'{stat}\n')
+            
+            self.steps.append({
+                'name': name, 'wall': wall, 'profiled': stats.total_tt, 'peak': peak,
+                'functions': {
+                    func: (tt, ct) for func, (_, _, tt, ct, _) in stats.stats.items()
+                },
+            })
+    
+    def summary(self) -> None:
+        """Print the time and memory of each step and the functions using the most time."""
+        print(f'profile written to {self.directory}')
+        print(f"{'step':<12} {'wall (s)':>9} {'profiled (s)':>13} {'peak (MiB)':>11}")
+        for step in self.steps:
+            print(f"{step['name']:<12} {step['wall']:>9.2f} {step['profiled']:>13.2f} {step['peak'] / 2**20:>11.1f}")
+        
+        functions = [
+            (tt, ct, step['name'], func)
+            for step in self.steps for func, (tt, ct) in step['functions'].items()
+        ]
+        print(f'top {self.TOP} functions by own time:')
+        for tt, ct, name, (filename, line, function) in sorted(functions, reverse=True)[:self.TOP]:
+            print(f'  {tt:8.3f}s {ct:8.3f}s cumulative  [{name}] {os.path.basename(filename)}:{line}({function})')
+    
+    def close(self) -> None:
+        """Print the summary and stop tracemalloc if it was started by the profiler."""
+        self.summary()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+
 # =============================================================================
 # Main Processing Class
 # =============================================================================
@@ -1673,55 +5124,87 @@ class BibtexProcessor:
         self.base_filename = os.path.splitext(config.filename)[0] if config.filename else ''
         self.output_file = f'{self.base_filename}_edited.bib'
         self.pickle_name = f'{self.base_filename}_cache.pickle'
+        # Split files written for this input, the only ones a later run removes
+        self.split_list_file = f'{self.base_filename}_splitted_entries.txt'
+        self.cache_file = StoreCacheFile(self.pickle_name, self.logger)
+        self.journal = CacheJournal(
+            f'{self.base_filename}_cache.journal', self.logger,
+            save=lambda: self.cache_file.save(self.store)
+        )
+        self.metadata_cache: Optional[MetadataCache] = None
+        self.engine: Optional[RequestEngine] = None
+        if config.character_table:
+            self.translator = CharacterTranslator.from_file(config.character_table)
+        else:
+            self.translator = CharacterTranslator(DEFAULT_CHARACTER_TABLE)
+        self.profiler: Optional[StepProfiler] = None
+    
+    def step(self, name: str):
+        """Context of a step of the run, profiled with --profile."""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.step(name)
     
     def load_cache(self) -> None:
-        """Load cached data from pickle file."""
-        if os.path.exists(self.pickle_name):
-            with open(self.pickle_name, 'rb') as handle:
-                old_store = pickle.load(handle)
-                # Convert dictionaries back to EntryStore objects
-                for key, data in old_store.items():
-                    if isinstance(data, dict):
-                        self.store[key] = EntryStore.from_dict(data)
-                    else:
-                        self.store[key] = data
+        """Load the cache file and replay the journal of an interrupted run."""
+        self.store.update(self.cache_file.load())
+        
+        n_replayed = self.journal.replay(self.store)
+        if n_replayed > 0:
+            self.logger.info(f'{n_replayed} results of an interrupted run recovered from {self.journal.path}')
     
     def save_cache(self) -> None:
-        """Save current state to pickle file."""
-        with open(self.pickle_name, 'wb') as handle:
-            # Convert EntryStore objects to dictionaries for serialization
-            dict_store = {k: v.to_dict() for k, v in self.store.items()}
-            pickle.dump(dict_store, handle, protocol=pickle.HIGHEST_PROTOCOL)
-    
-    def initialize_store(self, bib_database: 'BibDatabase') -> None:
-        """Initialize store from BibTeX database."""
-        # Remove entries from cache that are no longer in the input file
-        current_entries = {entry.get('ID') for entry in bib_database.entries}
-        keys_to_remove = [k for k in self.store if k not in current_entries]
-        for k in keys_to_remove:
-            self.logger.info(f'entry in cache {k} no longer in input bibtex file')
-            del self.store[k]
+        """Save current state to the cache file and truncate the journal."""
+        self.journal.wait()
+        self.cache_file.save(self.store)
+        self.journal.truncate()
+    
+    def initialize_store(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """
+        Initialize store from the input BibTeX entries.
+        
+        Args:
+            entries: Input entries, possibly read one at a time
+            
+        Returns:
+            Number of input entries
+        """
+        cached_store, self.store = self.store, {}
+        n_entries = 0
         
-        # Update or create EntryStore for each entry
-        for entry in bib_database.entries:
+        # Update or create EntryStore for each entry, in the order of the input file
+        for entry in entries:
+            n_entries += 1
             entry_id = entry.get('ID')
+            fingerprints = stage_fingerprints(entry, self.config)
             
-            if entry_id in self.store:
-                existing = self.store[entry_id]
-                if existing.input == entry:
+            if entry_id in cached_store:
+                existing = cached_store.pop(entry_id)
+                self.store[entry_id] = existing
+                old_fingerprints = existing.fingerprints or stage_fingerprints(existing.input, self.config)
+                # Only the stages whose input fields have changed are run again
+                stale = [stage for stage, fp in fingerprints.items() if old_fingerprints.get(stage) != fp]
+                if not stale:
                     self.logger.info(f'    entry {entry_id} has not changed. using cache')
                 else:
-                    self.logger.info(f'    entry {entry_id} has changed. cache removed')
-                    self.store[entry_id] = EntryStore(input=entry)
+                    self.logger.info(f'    entry {entry_id} has changed. cache removed for {", ".join(stale)}')
+                    existing.invalidate(stale)
+                existing.input = entry
+                existing.fingerprints = fingerprints
             else:
-                self.store[entry_id] = EntryStore(input=entry)
+                self.store[entry_id] = EntryStore(input=entry, fingerprints=fingerprints)
+        
+        # The remaining cached entries are no longer in the input file
+        for k in cached_store:
+            self.logger.info(f'entry in cache {k} no longer in input bibtex file')
+        return n_entries
     
     def remove_duplicates(self) -> int:
         """Remove duplicate entries with the same DOI."""
         dois: List[Tuple[str, str]] = []
         for key, entry_store in self.store.items():
             if entry_store.found_doi_status == 'valid' and entry_store.found_doi:
-                dois.append((entry_store.found_doi, key))
+                dois.append((canonical_doi(entry_store.found_doi), key))
         
         seen: Set[str] = set()
         duplicates = []
@@ -1811,12 +5294,13 @@ class BibtexProcessor:
     
     def write_output(self, n_bibtex_entries: int, n_duplicates: int) -> None:
         """Write output BibTeX file."""
-        edited_bib_db = BibDatabase()
-        for entry_store in self.store.values():
-            if not entry_store.duplicate and entry_store.output_bibtex_entry:
-                edited_bib_db.entries.append(entry_store.output_bibtex_entry)
+        edited_entries = [
+            entry_store.output_bibtex_entry
+            for entry_store in self.store.values()
+            if not entry_store.duplicate and entry_store.output_bibtex_entry
+        ]
         
-        n_edited = len(edited_bib_db.entries)
+        n_edited = len(edited_entries)
         
         self.logger.info(f'## number of entries (input) {n_bibtex_entries}')
         self.logger.info(f'## number of duplicate entries (input) {n_duplicates}')
@@ -1833,156 +5317,289 @@ class BibtexProcessor:
             "@Comment{Do not edit it directly by yourself. Modify the source file if needed}"
         )
         
-        BibtexIO.save(edited_bib_db, self.output_file, header)
-        BibtexIO.replace_curious_characters(self.output_file)
+        BibtexIO.write_entries(edited_entries, self.output_file, header, self.translator)
     
     def split_output(self) -> None:
         """Split output into individual BibTeX files."""
         self.logger.info(' ' + '-' * 42 + '------------------------------------------------#\n' + ' ' * 18 + ' {:<40}  ------------------------------------------------#'.format('10. Splitted bib entries'))
         
         dir_name = 'splitted_bibtex_entries'
-        if not os.path.exists(dir_name):
-            os.mkdir(dir_name)
+        os.makedirs(dir_name, exist_ok=True)
         
-        list_bib_file = []
+        entries = {
+            entry_store.output_bibtex_entry['ID']: entry_store.output_bibtex_entry
+            for entry_store in self.store.values()
+            if not entry_store.duplicate and entry_store.output_bibtex_entry
+        }
+        writer = BibTexWriter()
+        found: Set[str] = set()
         
-        for entry_store in self.store.values():
-            if entry_store.duplicate or not entry_store.output_bibtex_entry:
-                continue
-            
-            writer = BibTexWriter()
-            edited_bib = BibDatabase()
-            edited_bib.entries.append(entry_store.output_bibtex_entry)
-            
-            output_path = os.path.join(dir_name, entry_store.output_bibtex_entry['ID'] + '.bib')
-            
-            with open(output_path, 'w') as f:
-                f.write(dumps(edited_bib, writer))
-            
-            BibtexIO.replace_curious_characters(output_path)
-            
-            str_file = r"\ "[0] + f'addbibresource{{{output_path}}}'
-            list_bib_file.append(str_file)
+        def write(entry: Dict[str, Any]) -> bool:
+            output_path = os.path.join(dir_name, entry['ID'] + '.bib')
+            return BibtexIO.write_if_changed(
+                output_path, BibtexIO.entry_to_str(entry, writer, self.translator, found)
+            )
+        
+        # Only the changed files are written, so a LaTeX build depending on them is not retriggered
+        with ThreadPoolExecutor(max_workers=self.config.number_of_parallel_request) as executor:
+            n_written = sum(executor.map(write, entries.values()))
+        self.translator.report(found)
         
-        with open('splitted_bib_entries.tex', 'w') as f:
-            for line in list_bib_file:
-                f.write(f"{line}\n")
+        # The directory is shared by all inputs, only the files of this one are removed
+        expected = {key + '.bib' for key in entries}
+        previous: Set[str] = set()
+        if os.path.exists(self.split_list_file):
+            with open(self.split_list_file, encoding='utf-8') as f:
+                previous = {line.strip() for line in f if line.strip()}
+        stale = [name for name in sorted(previous - expected)
+                 if os.path.exists(os.path.join(dir_name, name))]
+        for name in stale:
+            os.remove(os.path.join(dir_name, name))
+        BibtexIO.write_if_changed(self.split_list_file, ''.join(f'{name}\n' for name in sorted(expected)))
+        
+        list_bib_file = [
+            r"\ "[0] + f'addbibresource{{{os.path.join(dir_name, key + ".bib")}}}' for key in entries
+        ]
+        BibtexIO.write_if_changed('splitted_bib_entries.tex', ''.join(f"{line}\n" for line in list_bib_file))
         
+        self.logger.info(
+            f'{n_written} of {len(entries)} splitted bib entries written, {len(stale)} removed'
+        )
         self.logger.info('splitted bib entries are in the folder: splitted_bibtex_entries')
         self.logger.info('\\input(splitted_bib_entries.tex) to use it')
     
-    def run(self) -> None:
-        """Run the complete processing pipeline with error handling."""
-        if not self.config.filename or not os.path.exists(self.config.filename):
-            self.logger.info(f'bib file {self.config.filename} does not exist')
-            return
-        
-        # Load bib file
-        header = ' ' + '-' * 42 + '------------------------------------------------#\n' + ' ' * 18 + ' {:<40}  ------------------------------------------------#'
-        self.logger.info(header.format('1. Parse input bibtex file'))
-        
-        try:
-            bib_database = BibtexIO.load(self.config.filename, self.logger)
-        except Exception as e:
-            self.logger.warning(f'Failed to load BibTeX file: {e}')
-            raise BibtexParseError(f"Cannot parse {self.config.filename}: {e}") from e
+    def validate_entry(self, k: int, entry_store: EntryStore,
+                       title_check: Optional[TitleCheck] = None) -> str:
+        """
+        Validate the Crossref entry of ``entry_store`` against the input entry.
         
-        n_bibtex_entries = len(bib_database.entries)
-        self.logger.info(f'# number of entries (input) {n_bibtex_entries}')
+        Args:
+            k: Index of the entry, for the log
+            entry_store: Entry to validate
+            title_check: Optional precomputed comparison of the titles
+            
+        Returns:
+            The found_doi_status of the entry
+        """
+        entry = entry_store.input
+        entry_id = entry.get('ID')
+        self.logger.info(f'## entry {k}: {entry_id}')
         
-        # Limit entries if needed
-        if n_bibtex_entries > self.config.max_entry:
-            bib_database.entries = bib_database.entries[:self.config.max_entry]
+        if entry_store.crossref_query_status == 'ok' and entry_store.doi_to_bibtex_status == 'ok':
+            entry_store.crossref_bibtex_entry_key = entry_store.crossref_bibtex_entry.get('ID')
+            entry_store.crossref_bibtex_entry['ID'] = entry_id
+            
+            status, check = double_check_bibtex_entries(
+                entry, entry_store.crossref_bibtex_entry,
+                self.config, self.decisions, self.logger, title_check
+            )
+            
+            self.logger.info(f'{status} {check}')
+            entry_store.check = check
+            entry_store.found_doi_status = status
+        else:
+            entry_store.found_doi_status = 'failed'
         
-        # Load cache and initialize store
-        self.load_cache()
-        self.initialize_store(bib_database)
+        self.logger.info(f'validation results : {entry_store.found_doi_status}\n')
+        return entry_store.found_doi_status
+    
+    def process_entries(self, header: str) -> int:
+        """
+        Run steps 2 to 5, each step processing all entries before the next one.
         
+        Returns:
+            Number of duplicate entries
+        """
         # Step 2: Crossref DOI search
         self.logger.info(header.format('2. Crossref doi search'))
-        try:
-            bibtex_entries_to_crossref_dois(self.store, self.config, self.logger)
-        except CrossrefAPIError as e:
-            self.logger.warning(f'Crossref API error during DOI search: {e}')
-        self.save_cache()
+        started = time.perf_counter()
+        with self.step('search'):
+            try:
+                bibtex_entries_to_crossref_dois(
+                    self.store, self.config, self.logger, self.metadata_cache, self.engine,
+                    self.journal
+                )
+            except CrossrefAPIError as e:
+                self.logger.warning(f'Crossref API error during DOI search: {e}')
+            self.save_cache()
         
         # Step 3: Get BibTeX entries from Crossref
         self.logger.info(header.format('3. get bibtex from crossref'))
-        try:
-            dois_to_bibtex_entries(self.store, self.config, self.logger)
-        except CrossrefAPIError as e:
-            self.logger.warning(f'Crossref API error during BibTeX fetch: {e}')
-        self.save_cache()
+        with self.step('fetch'):
+            try:
+                dois_to_bibtex_entries(
+                    self.store, self.config, self.logger, self.metadata_cache, self.engine,
+                    self.journal
+                )
+            except CrossrefAPIError as e:
+                self.logger.warning(f'Crossref API error during BibTeX fetch: {e}')
+            self.save_cache()
         
         # Step 4: Validate entries
         self.logger.info(header.format('4. validation of crossref_bibtex_entry'))
         
-        valid_crossref_bib_db = BibDatabase()
-        
-        k = 0
-        for key, entry_store in self.store.items():
-            entry = entry_store.input
-            entry_id = entry.get('ID')
-            self.logger.info(f'## entry {k}: {entry_id}')
+        with self.step('validate'):
+            valid_crossref_bib_db = BibDatabase()
             
-            if entry_store.doi_to_bibtex_status == 'ok':
-                entry_store.crossref_bibtex_entry_key = entry_store.crossref_bibtex_entry.get('ID')
-                entry_store.crossref_bibtex_entry['ID'] = entry_id
-                
-                status, check = double_check_bibtex_entries(
-                    entry, entry_store.crossref_bibtex_entry,
-                    self.config, self.decisions, self.logger
-                )
-                
-                self.logger.info(f'{status} {check}')
-                entry_store.check = check
-                entry_store.found_doi_status = status
-                
-                if status == 'valid':
+            # The titles of all the entries are compared in one pass
+            fetched = [
+                entry_store for entry_store in self.store.values()
+                if entry_store.crossref_query_status == 'ok' and entry_store.doi_to_bibtex_status == 'ok'
+            ]
+            title_checks = dict(zip(map(id, fetched), batch_check_titles([
+                (entry_store.input.get('title', ''), entry_store.crossref_bibtex_entry.get('title', ''))
+                for entry_store in fetched
+            ])))
+            
+            validated: Dict[str, float] = {}
+            for k, (key, entry_store) in enumerate(self.store.items()):
+                if self.validate_entry(k, entry_store, title_checks.get(id(entry_store))) == 'valid':
                     valid_crossref_bib_db.entries.append(entry_store.crossref_bibtex_entry)
-            else:
-                entry_store.found_doi_status = 'failed'
+                validated[key] = time.perf_counter()
             
-            self.logger.info(f'validation results : {entry_store.found_doi_status}\n')
-            k += 1
-        
-        # Remove duplicates
-        n_duplicate = self.remove_duplicates()
+            # Remove duplicates
+            n_duplicate = self.remove_duplicates()
         
         # Step 5: Query Unpaywall
         self.logger.info(header.format('5. unpaywall oai from doi'))
+        with self.step('unpaywall'):
+            try:
+                unpaywall_oais_from_crossref_dois(
+                    valid_crossref_bib_db.entries, self.store, self.config, self.logger,
+                    self.metadata_cache, self.engine, self.journal
+                )
+            except UnpaywallAPIError as e:
+                self.logger.warning(f'Unpaywall API error: {e}')
+            self.save_cache()
+        
+        # An entry is done with its validation or its last result, as in the streaming pipeline
+        for key, done in validated.items():
+            METRICS.observe('entry_seconds', max(done, self.journal.last_update.get(key, done)) - started)
+        return n_duplicate
+    
+    def stream_entries(self, header: str) -> int:
+        """
+        Run steps 2 to 5 with the streaming pipeline.
+        
+        Returns:
+            Number of duplicate entries
+        """
+        self.logger.info(header.format('2-5. streaming pipeline'))
+        counter = itertools.count()
+        with self.step('pipeline'):
+            StreamingPipeline(
+                self.store, self.config, self.logger,
+                lambda entry_store: self.validate_entry(next(counter), entry_store),
+                self.engine, self.metadata_cache, self.journal
+            ).run()
+            
+            # Duplicates are only known once all the entries are validated
+            n_duplicate = self.remove_duplicates()
+            self.save_cache()
+        return n_duplicate
+    
+    def run(self) -> None:
+        """Run the complete processing pipeline with error handling."""
+        if not self.config.filename or not os.path.exists(self.config.filename):
+            self.logger.info(f'bib file {self.config.filename} does not exist')
+            return
+        
+        # Load bib file
+        header = ' ' + '-' * 42 + '------------------------------------------------#\n' + ' ' * 18 + ' {:<40}  ------------------------------------------------#'
+        self.logger.info(header.format('1. Parse input bibtex file'))
+        METRICS.reset()
+        
+        if self.config.profile:
+            self.profiler = StepProfiler(
+                self.config.profile_dir or f'{self.base_filename}_profile', self.logger
+            )
+        
         try:
-            unpaywall_oais_from_crossref_dois(valid_crossref_bib_db.entries, self.store, self.config, self.logger)
-        except UnpaywallAPIError as e:
-            self.logger.warning(f'Unpaywall API error: {e}')
-        self.save_cache()
+            # Load cache and initialize store while the input entries are read,
+            # stopping after --max-entry entries
+            with self.step('parse'):
+                self.load_cache()
+                try:
+                    n_bibtex_entries = self.initialize_store(
+                        BibtexIO.iter_entries(self.config.filename, self.config.max_entry)
+                    )
+                except BibtexParseError:
+                    raise
+                except Exception as e:
+                    self.logger.warning(f'Failed to load BibTeX file: {e}')
+                    raise BibtexParseError(f"Cannot parse {self.config.filename}: {e}") from e
+            self.logger.info(f'# number of entries (input) {n_bibtex_entries}')
+            METRICS.inc('entries_total', value=n_bibtex_entries)
+            self.metadata_cache = MetadataCache.from_config(self.config, self.logger)
+            self.engine = RequestEngine.from_config(self.config, self.logger)
+            self.engine.profiler = self.profiler
         
-        # Step 6: Build output entries
-        self.logger.info(header.format('6. build output bibtex entry'))
-        ad_hoc_build_output_bibtex_entries(self.store, self.config, self.logger)
+            try:
+                if self.config.pipeline:
+                    n_duplicate = self.stream_entries(header)
+                else:
+                    n_duplicate = self.process_entries(header)
+            finally:
+                # The journal keeps the results received before an interruption
+                self.journal.close()
+                if self.metadata_cache is not None:
+                    self.metadata_cache.close()
+                    self.metadata_cache = None
+                self.engine.close()
+                self.engine = None
         
-        # Step 7: Generate report
-        self.generate_report()
+            # Step 6: Build output entries
+            self.logger.info(header.format('6. build output bibtex entry'))
+            provenance = None
+            if self.config.provenance_file:
+                provenance = ProvenanceWriter(self.config.provenance_file, self.logger)
+            try:
+                with self.step('build'):
+                    ad_hoc_build_output_bibtex_entries(self.store, self.config, self.logger, provenance)
+            finally:
+                if provenance is not None:
+                    provenance.close()
         
-        # Step 7b: Generate summary table of problematic entries
-        self.logger.info(' ' + '-' * 42 + '------------------------------------------------#\n' + ' ' * 18 + ' {:<40}  ------------------------------------------------#'.format('7b. Summary of problematic entries'))
-        self.generate_summary_table()
+            with self.step('report'):
+                # Step 7: Generate report
+                self.generate_report()
+            
+                # Step 7b: Generate summary table of problematic entries
+                self.logger.info(' ' + '-' * 42 + '------------------------------------------------#\n' + ' ' * 18 + ' {:<40}  ------------------------------------------------#'.format('7b. Summary of problematic entries'))
+                self.generate_summary_table()
         
-        # Step 8: Write output
-        self.logger.info(header.format('8. Write output bibtex file'))
-        self.write_output(n_bibtex_entries, n_duplicate)
+            # Step 8: Write output
+            self.logger.info(header.format('8. Write output bibtex file'))
+            with self.step('write'):
+                self.write_output(n_bibtex_entries, n_duplicate)
         
-        # Step 9: Clean up (done in write_output)
-        self.logger.info(header.format('9. Replacements of Latex or html symbols'))
+            # Step 9: Clean up (done in write_output)
+            self.logger.info(header.format('9. Replacements of Latex or html symbols'))
         
-        # Step 10: Split output if requested
-        if self.config.split_output:
-            self.split_output()
+            # Step 10: Split output if requested
+            if self.config.split_output:
+                with self.step('split'):
+                    self.split_output()
         
-        # Step 11: Print suggestions
-        if self.decisions.has_decisions():
-            self.logger.info(header.format('11. Suggested command-line options'))
-            self.decisions.print_suggestions(self.config, self.logger)
+            # Step 11: Print suggestions
+            if self.decisions.has_decisions():
+                self.logger.info(header.format('11. Suggested command-line options'))
+                self.decisions.print_suggestions(self.config, self.logger)
+            
+            self.export_metrics()
+        finally:
+            if self.profiler is not None:
+                self.profiler.close()
+                self.profiler = None
+    
+    def export_metrics(self) -> None:
+        """Write the metrics of the run to the files given by --metrics and --metrics-prometheus."""
+        if self.config.metrics_file:
+            METRICS.write_json(self.config.metrics_file)
+            self.logger.info(f'metrics written to {self.config.metrics_file}')
+        if self.config.metrics_prometheus_file:
+            METRICS.write_prometheus(self.config.metrics_prometheus_file)
+            self.logger.info(f'metrics written to {self.config.metrics_prometheus_file}')
 
 
 # =============================================================================
@@ -1993,6 +5610,13 @@ def main():
     """Main entry point with error handling."""
     try:
         config = Config.from_command_line(sys.argv)
+        if config.import_unpaywall_snapshot or config.import_crossref_dump:
+            logger = setup_logging(config.verbose)
+            if config.import_unpaywall_snapshot:
+                import_unpaywall_snapshot(config, logger)
+            if config.import_crossref_dump:
+                import_crossref_dump(config, logger)
+            return
         processor = BibtexProcessor(config)
         processor.run()
     except KeyboardInterrupt: